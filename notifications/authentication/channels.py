@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# user id -> the social networks the user receives notifications through, shared by the site and the celery workers,
+# the cache is invalidated by the signals in authentication/models.py whenever a network or a telegram account changes
+
+def get_user_channels_cache_key(user_id):
+    return f'user_channels:{user_id}'
+
+def load_users_channels(user_ids):
+    '''
+        Input: user_ids -> ids of users
+        Output: dict user id -> list of active and attached social networks of the user
+
+        Telegram is left out for users without a telegram account, there is nowhere to send the message
+    '''
+    from .models import ChooseSendingNotifications
+    users_channels = defaultdict(list)
+    networks = (
+        ChooseSendingNotifications.objects.filter(myuser__in=user_ids, active=True, linked_network=True)
+        .order_by('-sender')
+        .values_list('myuser', 'sender', 'myuser__users_telegram')
+    )
+    for user_id, sender, users_telegram in networks:
+        if sender == 'telegram' and users_telegram is None:
+            continue
+        users_channels[user_id].append(sender)
+    return {user_id: users_channels[user_id] for user_id in user_ids}
+
+def get_users_channels(user_ids):
+    '''
+        Input: user_ids -> ids of users
+        Output: dict user id -> list of active and attached social networks of the user
+
+        Cached users cost no queries, the rest are loaded with one query for all of them
+    '''
+    cache_keys = {get_user_channels_cache_key(user_id): user_id for user_id in set(user_ids)}
+    users_channels = {cache_keys[key]: channels for key, channels in cache.get_many(cache_keys.keys()).items()}
+    missed = [user_id for user_id in cache_keys.values() if user_id not in users_channels]
+    if missed:
+        loaded = load_users_channels(missed)
+        cache.set_many({get_user_channels_cache_key(user_id): channels for user_id, channels in loaded.items()}, settings.USER_CHANNELS_CACHE_TIMEOUT)
+        users_channels.update(loaded)
+    return users_channels
+
+def invalidate_users_channels(user_ids):
+    '''Dropping the cached channels of the users when the transaction commits, a read before the commit would cache the old channels again'''
+    cache_keys = [get_user_channels_cache_key(user_id) for user_id in user_ids if user_id is not None]
+    if cache_keys:
+        transaction.on_commit(lambda: cache.delete_many(cache_keys))
@@ -1,54 +1,27 @@
-from telebot import TeleBot
-from telebot import types
-import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
 
-from django.core.management.base import BaseCommand
-from django.core.exceptions import ObjectDoesNotExist
-
-from authentication.models import MyUser, UserTelegram
-
-# Объявление переменной бота
-bot = TeleBot(os.environ.get('TELEGRAM_TOKEN'), threaded=False)
+from authentication.telegram_bot import bot
 
 class Command(BaseCommand):
     help = "`Notifications` telegram bot"
 
     def add_arguments(self, parser):
-        bot.enable_save_next_step_handlers(delay=2)
-        bot.load_next_step_handlers()
-        bot.infinity_polling()
-
-    @bot.message_handler(commands=['start', 'help'])
-    def send_welcome(message):
-        try:
-            telegram_account = UserTelegram.objects.get(chat_id=message.chat.id)
-            user = MyUser.objects.get(users_telegram=telegram_account)
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    'Моя подписка', callback_data='/subscribe'
-                )
-            )
-            bot.reply_to(message, f"👋 Привет, {user.username} \n Чем я могу вам помочь?", reply_markup=keyboard)
-        except ObjectDoesNotExist:
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(
-                    'Привязка бота к аккаунту notifications!', callback_data='/adding_telegram'
-                )
-            )
-            bot.reply_to(message, "👋 Привет! \nЯ notifications bot 🤖\nЧем я могу вам помочь?", reply_markup=keyboard)
+        parser.add_argument('--set-webhook', metavar='SITE_URL', help='Make telegram send the updates to the webhook of the site ( e.g. https://example.com ) instead of polling and exit')
+        parser.add_argument('--delete-webhook', action='store_true', help='Stop sending the updates to the webhook and exit, polling works again')
 
-    @bot.callback_query_handler(func=lambda c: c.data == '/adding_telegram')
-    def process_callback_adding_telegram(callback_query: types.CallbackQuery):
-        bot.answer_callback_query(callback_query.id)
-        bot.send_message(callback_query.from_user.id, f'Чтобы продолжить регистрацию пройдите по [этой ссылке](http://127.0.0.1/auth/telegram?chat_id={callback_query.from_user.id}&username={callback_query.from_user.username})', parse_mode='MarkdownV2')
-    
-    @bot.callback_query_handler(func=lambda c: c.data == '/subscribe')
-    def process_callback_subscribe_info(callback_query: types.CallbackQuery):
-        user_tg = UserTelegram.objects.get(chat_id=callback_query.from_user.id)
-        user = MyUser.objects.get(users_telegram=user_tg)
-        if user.is_subscribed:
-            bot.send_message(user_tg.chat_id, 'Вы крутой! У вас есть подписка')
+    def handle(self, *args, **options):
+        if options['set_webhook']:
+            if not settings.TELEGRAM_WEBHOOK_SECRET:
+                raise CommandError('Set TELEGRAM_WEBHOOK_SECRET, the webhook accepts only the updates signed with it')
+            url = options['set_webhook'].rstrip('/') + reverse('auth:telegram_webhook')
+            bot.set_webhook(url, secret_token=settings.TELEGRAM_WEBHOOK_SECRET, max_connections=settings.TELEGRAM_BOT_WORKERS)
+            self.stdout.write(self.style.SUCCESS(f'Telegram sends the updates to {url}'))
+        elif options['delete_webhook']:
+            bot.remove_webhook()
+            self.stdout.write(self.style.SUCCESS('The webhook is deleted'))
         else:
-            bot.send_message(user_tg.chat_id, 'У вас нет подписки')
\ No newline at end of file
+            bot.enable_save_next_step_handlers(delay=2)
+            bot.load_next_step_handlers()
+            bot.infinity_polling()
@@ -1,15 +1,14 @@
-import inspect
 import uuid
 
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
-from django.db.models.signals import pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.template.defaultfilters import slugify
 from django.conf import settings
 
-import notifications.send_notifications as send_notifications
+from .channels import get_users_channels, invalidate_users_channels
 
 
 class UserTelegram(models.Model):
@@ -147,14 +146,11 @@ class MyUser(AbstractUser):
         NotificationCategory.objects.get_or_create(name_type='sport', color='#e0c45c', slug='sport')
 
     def get_all_active_and_attached_networks(self):
-        return [chosen.sender for chosen in self.choose_sending.all() if chosen.linked_network == True and chosen.active == True]
+        return get_users_channels([self.id])[self.id]
 
     def get_only_inactive_networks(self):
         return [chosen.sender for chosen in self.choose_sending.all() if chosen.active == False]
 
-    def sender_functions(self):
-        return [f for f in vars(send_notifications).values() if inspect.isfunction(f)]
-
     def get_timezone_name(self):
         for tz, name in settings.TZ_CHOICES:
             if self.tz == tz:
@@ -165,3 +161,25 @@ def check_user_tz(sender, instance, **kwargs):
     user_tz = instance._meta.get_field('tz')
     user_tz.editable = False
 
+@receiver(post_save, sender=MyUser)
+def user_saved(sender, instance, **kwargs):
+    '''The telegram account of the user may have been changed'''
+    invalidate_users_channels([instance.id])
+
+@receiver(post_save, sender=ChooseSendingNotifications)
+@receiver(post_delete, sender=ChooseSendingNotifications)
+def network_changed(sender, instance, **kwargs):
+    '''A social network was activated, deactivated, attached or detached'''
+    invalidate_users_channels([instance.user_id])
+
+@receiver(m2m_changed, sender=MyUser.choose_sending.through)
+def user_networks_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    '''Social networks were added to or removed from the user ( or users were added to or removed from a social network )'''
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_users_channels((pk_set or [instance.user_id]) if reverse else [instance.id])
+
+@receiver(post_save, sender=UserTelegram)
+@receiver(pre_delete, sender=UserTelegram)
+def telegram_account_changed(sender, instance, **kwargs):
+    '''Deleting a telegram account sets MyUser.users_telegram to null with an UPDATE, which sends no signals'''
+    invalidate_users_channels(list(MyUser.objects.filter(users_telegram=instance).values_list('id', flat=True))) # read before the account is gone
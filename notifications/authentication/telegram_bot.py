@@ -0,0 +1,64 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import close_old_connections
+from telebot import TeleBot
+from telebot import types
+
+from .models import MyUser, UserTelegram
+
+# The updates come from the webhook ( authentication.views.telegram_webhook ) or from polling ( python manage.py telegram_bot ),
+# they are handled by a pool of TELEGRAM_BOT_WORKERS threads, so one chat waiting for the database does not hold up the others
+
+# Объявление переменной бота
+bot = TeleBot(settings.TELEGRAM_TOKEN, threaded=True, num_threads=settings.TELEGRAM_BOT_WORKERS)
+
+def handles_update(handler):
+    '''Every update is handled like a request: the database connection of the thread is checked before and after it'''
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+@bot.message_handler(commands=['start', 'help'])
+@handles_update
+def send_welcome(message):
+    try:
+        telegram_account = UserTelegram.objects.get(chat_id=message.chat.id)
+        user = MyUser.objects.get(users_telegram=telegram_account)
+        keyboard = types.InlineKeyboardMarkup()
+        keyboard.add(
+            types.InlineKeyboardButton(
+                'Моя подписка', callback_data='/subscribe'
+            )
+        )
+        bot.reply_to(message, f"👋 Привет, {user.username} \n Чем я могу вам помочь?", reply_markup=keyboard)
+    except ObjectDoesNotExist:
+        keyboard = types.InlineKeyboardMarkup()
+        keyboard.add(
+            types.InlineKeyboardButton(
+                'Привязка бота к аккаунту notifications!', callback_data='/adding_telegram'
+            )
+        )
+        bot.reply_to(message, "👋 Привет! \nЯ notifications bot 🤖\nЧем я могу вам помочь?", reply_markup=keyboard)
+
+@bot.callback_query_handler(func=lambda c: c.data == '/adding_telegram')
+@handles_update
+def process_callback_adding_telegram(callback_query: types.CallbackQuery):
+    bot.answer_callback_query(callback_query.id)
+    bot.send_message(callback_query.from_user.id, f'Чтобы продолжить регистрацию пройдите по [этой ссылке](http://127.0.0.1/auth/telegram?chat_id={callback_query.from_user.id}&username={callback_query.from_user.username})', parse_mode='MarkdownV2')
+
+@bot.callback_query_handler(func=lambda c: c.data == '/subscribe')
+@handles_update
+def process_callback_subscribe_info(callback_query: types.CallbackQuery):
+    user_tg = UserTelegram.objects.get(chat_id=callback_query.from_user.id)
+    user = MyUser.objects.get(users_telegram=user_tg)
+    if user.is_subscribed:
+        bot.send_message(user_tg.chat_id, 'Вы крутой! У вас есть подписка')
+    else:
+        bot.send_message(user_tg.chat_id, 'У вас нет подписки')
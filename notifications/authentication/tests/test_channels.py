@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..channels import get_users_channels
+from ..models import MyUser, ChooseSendingNotifications, UserTelegram
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class UserChannelsTests(TestCase):
+
+    @classmethod
+    def setUp(cls):
+        cache.clear()
+        cls.myuser = MyUser.objects.create(username='channels_user', email='channels_user@gmail.com')
+        cls.network_telegram = ChooseSendingNotifications.objects.create(sender='telegram', user=cls.myuser, active=True, linked_network=True)
+        cls.network_email = ChooseSendingNotifications.objects.create(sender='email', user=cls.myuser, active=True, linked_network=True)
+        cls.telegram = UserTelegram.objects.create(telegram_user='channels_user', chat_id='1111111111')
+        cls.myuser.users_telegram = cls.telegram
+        cls.myuser.save()
+        cls.myuser.choose_sending.add(cls.network_telegram)
+        cls.myuser.choose_sending.add(cls.network_email)
+
+    def test_channels_are_cached(self):
+        ''' Testing that the channels of a user are loaded once and then come from the cache '''
+        self.assertEqual(self.myuser.get_all_active_and_attached_networks(), ['telegram', 'email'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_users_channels([self.myuser.id]), {self.myuser.id: ['telegram', 'email']})
+
+    def test_channels_cache_is_invalidated(self):
+        ''' Testing that changing a social network or deleting the telegram account resets the cached channels '''
+        self.assertEqual(self.myuser.get_all_active_and_attached_networks(), ['telegram', 'email'])
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.network_email.active = False
+            self.network_email.save()
+            self.assertEqual(self.myuser.get_all_active_and_attached_networks(), ['telegram', 'email']) # the change is not committed yet
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.myuser.get_all_active_and_attached_networks(), ['telegram'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.telegram.delete()
+        self.assertEqual(self.myuser.get_all_active_and_attached_networks(), [])
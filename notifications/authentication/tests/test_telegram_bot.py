@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from telebot import apihelper
+
+class FakeTelegramBotApiHandler(BaseHTTPRequestHandler):
+    # answers every bot api method after a delay, like a slow network
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.requests.append((self.path.rsplit('/', 1)[-1], data))
+        payload = json.dumps({'ok': True, 'result': {'message_id': 2, 'date': 0, 'chat': {'id': 100, 'type': 'private'}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+def get_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET='webhook secret')
+class TelegramWebhookTests(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegramBotApiHandler)
+        cls.server.lock, cls.server.requests, cls.server.delay = threading.Lock(), [], 0.5
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = mock.patch.object(apihelper, 'API_URL', f'http://127.0.0.1:{cls.server.server_address[1]}/bot{{0}}/{{1}}')
+        cls.api_url.start()
+
+    def tearDown(self):
+        self.api_url.stop()
+        self.server.shutdown()
+
+    def post_update(self, update, secret_token='webhook secret'):
+        return self.client.post(
+            reverse('auth:telegram_webhook'), json.dumps(update), content_type='application/json',
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN=secret_token
+        )
+
+    def wait_for_requests(self, amount, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.server.requests) < amount and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.server.requests
+
+    def test_updates_are_handled_concurrently(self):
+        ''' Testing that the webhook answers at once and the updates of several chats are handled at the same time '''
+        start = time.monotonic()
+        for update_id in range(1, 5):
+            self.assertEqual(self.post_update(get_update(update_id, 100 + update_id)).status_code, 200)
+        self.assertLess(time.monotonic() - start, self.server.delay)
+
+        requests = self.wait_for_requests(4)
+        self.assertEqual([method for method, _ in requests], ['sendMessage'] * 4)
+        self.assertLess(time.monotonic() - start, self.server.delay * 3) # one by one it would take 4 delays
+
+    def test_update_without_secret_token_is_rejected(self):
+        ''' Testing that only telegram, which knows the secret token, can send updates '''
+        self.assertEqual(self.post_update(get_update(1, 100), secret_token='wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('auth:telegram_webhook')).status_code, 405)
+        time.sleep(self.server.delay)
+        self.assertEqual(self.server.requests, [])
@@ -14,6 +14,7 @@ from .views import (RegisterView,
                     ChangeUserEmail,
                     verificate_user_email,
                     activate_user_email,
+                    telegram_webhook,
                     )     
 
 app_name = 'auth'
@@ -24,6 +25,7 @@ urlpatterns = [
     path('logout/', UserLogoutView.as_view(), name="logout"),
     path('profile/', UserProfileView.as_view(), name="profile"),
     path('telegram/', attaching_telegram_account_dispetcher, name="register_tg"),
+    path('telegram/webhook/', telegram_webhook, name="telegram_webhook"),
     path('profile/dispetcher_providing_networks/<slug:slug>/', dispetcher_providing_networks, name="dispetcher_providing_networks"),
     path('profile/sender_info/<slug:slug>/', SenderInformationView.as_view(), name="sender_information"),
     path('profile/activate/<uuid:pk>/', activate_sender_network, name="activate_sender_network"),
@@ -10,7 +10,11 @@ from django.utils.encoding import force_bytes, force_str
 from django.core.mail import EmailMessage
 from django.contrib import messages
 from django.db.models import Q
-from django.http import HttpResponseRedirect, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, HttpResponseNotFound
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.template.loader import render_to_string
@@ -259,4 +263,19 @@ def verificate_user_email(request):
 
         send_verificate_message_to_user(request.user, request)
 
-    return render(request, 'auth/email/email_verification/verificate_email_page.html', {'email': email})
\ No newline at end of file
+    return render(request, 'auth/email/email_verification/verificate_email_page.html', {'email': email})
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    '''
+        Telegram sends the updates of the bot here ( python manage.py telegram_bot --set-webhook ),
+        they are handed to the pool of the bot and telegram gets its answer at once, without waiting for the handlers
+    '''
+    from telebot import types
+    from .telegram_bot import bot
+    secret_token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not settings.TELEGRAM_WEBHOOK_SECRET or not constant_time_compare(secret_token, settings.TELEGRAM_WEBHOOK_SECRET):
+        return HttpResponseForbidden()
+    bot.process_new_updates([types.Update.de_json(request.body.decode())])
+    return HttpResponse()
@@ -68,7 +68,7 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
+        'APP_DIRS': True, # without DEBUG django caches the compiled templates ( the cached loader ), the message templates are compiled once per process
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -187,6 +187,45 @@ REST_FRAMEWORK = {
 }
 
 CELERY_BROKER_URL = 'redis://redis:6379'
+CELERY_TASK_DEFAULT_QUEUE = 'scheduling'
+CELERY_TASK_ROUTES = ['notifications.routing.route_channel_task'] # see notifications/routing.py
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', 1)) # a worker reserves only the tasks it runs, the slow ones wait in the queue instead of behind a busy process
+NOTIFICATIONS_CHANNEL_QUEUES = { # social network name -> the celery queue its deliveries are sent by
+    'telegram': 'telegram',
+    'email': 'email',
+}
+CELERY_BEAT_SCHEDULE = {
+    'materialize-notification-occurrences': {
+        'task': 'notifications.tasks.materialize_occurrences_task',
+        'schedule': 60 * 60, # seconds, much less than the scheduling horizon, so a missed run does not delay notifications
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://redis:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'IGNORE_EXCEPTIONS': True, # without redis the site and the workers keep working, reading from the database
+        }
+    }
+}
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+USER_CHANNELS_CACHE_TIMEOUT = 60 * 60 # seconds, the cache is invalidated on every change, the timeout only limits stale entries if redis was unreachable
+
+# Notifications dispatcher ( python manage.py dispatch_notifications )
+NOTIFICATIONS_DISPATCH_INTERVAL = 1 # seconds between two checks of due notifications
+NOTIFICATIONS_DISPATCH_BATCH_SIZE = 500 # maximum amount of notifications dispatched in one transaction
+NOTIFICATIONS_DELIVERY_BATCH_SIZE = 50 # amount of notifications sent by one celery task
+NOTIFICATIONS_ASYNC_WORKER_BATCHES = 20 # maximum amount of delivery batches sent at the same time by the asyncio worker ( python manage.py async_delivery_worker )
+NOTIFICATIONS_ASYNC_WORKER_CONCURRENCY = 1000 # maximum amount of telegram requests in flight ( and pooled connections ) of the asyncio worker
+NOTIFICATIONS_SCHEDULING_HORIZON = 24 * 7 # hours, occurrences of periodic notifications are materialized as statuses only this far ahead
+NOTIFICATIONS_MATERIALIZE_BATCH_SIZE = 500 # maximum amount of periodic notifications materialized in one transaction
+NOTIFICATIONS_RETRY_POLICIES = { # per channel: attempts before a delivery becomes a dead letter, seconds before the first retry doubled every attempt up to backoff_max
+    'telegram': {'max_attempts': 5, 'backoff': 10, 'backoff_max': 10 * 60},
+    'email': {'max_attempts': 5, 'backoff': 60, 'backoff_max': 60 * 60},
+}
 
 # SMTP
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -196,9 +235,27 @@ EMAIL_HOST = os.environ.get('EMAIL_HOST')
 EMAIL_PORT = os.environ.get('EMAIL_PORT')
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+NOTIFICATIONS_EMAIL_MESSAGES_PER_CONNECTION = 100 # smtp servers drop long sessions, so a new connection is opened after this amount of messages
+
+# Rate limits of the channels, shared by all the workers through redis ( see notifications/rate_limits.py ): messages per second and the burst size
+NOTIFICATIONS_RATE_LIMITS = {
+    'telegram': {'rate': 30, 'capacity': 30},
+    'email': {'rate': 10, 'capacity': 10},
+}
+NOTIFICATIONS_RECIPIENT_RATE_LIMITS = { # per recipient of a channel, telegram allows about one message per second to a chat
+    'telegram': {'rate': 1, 'capacity': 3},
+}
 
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_PUBLICK_KEY = os.environ.get('STRIPE_PUBLICK_KEY')
 
 WEBSITE_URL = os.environ.get('WEBSITE_URL')
-TELEGRAM_API_SENDING_MESSAGE = os.environ.get('TELEGRAM_API_SENDING_MESSAGE')
\ No newline at end of file
+TELEGRAM_API_SENDING_MESSAGE = os.environ.get('TELEGRAM_API_SENDING_MESSAGE')
+TELEGRAM_CONCURRENCY = 20 # maximum amount of telegram requests in flight ( and pooled connections )
+TELEGRAM_CONNECTIONS_PER_CLIENT = 20 # pooled connections of one httpx client, more requests in flight are spread over several clients
+TELEGRAM_MAX_RETRIES = 3 # how many times a message is retried after telegram answered 429 Too Many Requests
+TELEGRAM_MAX_RETRY_AFTER = 5 # seconds, a message asked to wait longer is not waited for in the worker, it is retried by celery ( see NOTIFICATIONS_RETRY_POLICIES )
+TELEGRAM_TIMEOUT = 10 # seconds
+TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '') # telegram signs the webhook requests with it ( python manage.py telegram_bot --set-webhook )
+TELEGRAM_BOT_WORKERS = 8 # threads handling the bot updates at the same time ( and webhook connections telegram opens )
\ No newline at end of file
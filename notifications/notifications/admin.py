@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html_join, format_html
 
-from .models import NotificationSingle, NotificationPeriodicity, NotificationStatus, NotificationBase, NotificationId
+from .models import NotificationSingle, NotificationPeriodicity, NotificationPeriodicDate, NotificationStatus, NotificationDelivery, NotificationDeadLetter, NotificationBase, NotificationId
 
 
 # # Register your models here.
@@ -9,6 +9,9 @@ admin.site.register(NotificationId)
 admin.site.register(NotificationStatus)
 admin.site.register(NotificationSingle)
 admin.site.register(NotificationPeriodicity)
+admin.site.register(NotificationPeriodicDate)
+admin.site.register(NotificationDelivery)
+admin.site.register(NotificationDeadLetter)
 
 
 @admin.register(NotificationBase)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import signal
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+
+from . import rate_limits, telegram_client
+from .dispatcher import claim_due_notifications
+from .send_notifications import (
+    DeliveryError,
+    claim_deliveries,
+    get_telegram_error,
+    get_telegram_messages,
+    group_by_network,
+    handle_send_errors,
+    load_deliveries,
+    send_channel_deliveries,
+)
+
+logger = logging.getLogger(__name__)
+
+# The asyncio delivery worker ( python manage.py async_delivery_worker ) takes due statuses from the database itself, instead of the dispatcher and celery,
+# and sends the telegram messages of many batches at once over one pool of connections, so a process keeps thousands of requests in flight.
+# A delivery is the same as in the celery tasks: the status is marked as complited, claimed in the delivery ledger, limited by the rate limits,
+# and a failed one is retried by celery or becomes a dead letter. The database work runs in one thread, the blocking smtp sending in others
+
+@sync_to_async
+def load_due_deliveries(batch_size):
+    '''Output: ( the amount of claimed due statuses, dict social network name -> the deliveries to send through it )'''
+    close_old_connections() # the thread keeps its connection from batch to batch like a request does, the broken or expired one is replaced
+    with transaction.atomic(): # claimed and loaded together, a failure or a dead process leaves the statuses to the next claim instead of dispatched forever
+        notification_status_ids = claim_due_notifications(batch_size)
+        if not notification_status_ids:
+            return 0, {}
+        deliveries = load_deliveries(notification_status_ids, only_due=True)
+    return len(notification_status_ids), group_by_network(deliveries)
+
+class AsyncDeliveryWorker:
+    def __init__(self, batch_size, max_batches, concurrency, interval, once=False):
+        '''
+            Input: batch_size -> the amount of statuses taken at once, max_batches -> the maximum amount of batches sent at the same time,
+                concurrency -> the maximum amount of telegram requests in flight, interval -> seconds between two checks of due statuses when there are none,
+                once -> stop when there are no due statuses
+        '''
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.concurrency = concurrency
+        self.interval = interval
+        self.once = once
+        self.sent = 0
+
+    def stop(self):
+        '''The graceful shutdown: no new statuses are taken, the batches in flight are sent to the end'''
+        if not self.stopping.is_set():
+            logger.info(f'Stopping, {len(self.batches)} batch(-es) in flight')
+            self.stopping.set()
+
+    async def wait(self, seconds):
+        '''Sleeping until the next check of due statuses or the shutdown'''
+        try:
+            await asyncio.wait_for(self.stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, handle_signals=True):
+        '''Output: the amount of sent deliveries'''
+        self.stopping = asyncio.Event()
+        self.batches = set()
+        self.batch_slots = asyncio.Semaphore(self.max_batches)
+        if handle_signals:
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                asyncio.get_running_loop().add_signal_handler(signal_number, self.stop)
+
+        async with telegram_client.AsyncClientPool(self.concurrency) as self.pool:
+            while not self.stopping.is_set():
+                await self.batch_slots.acquire()
+                claimed, deliveries_by_network = await load_due_deliveries(self.batch_size)
+                if claimed:
+                    batch = asyncio.create_task(self.send_batch(deliveries_by_network))
+                    self.batches.add(batch)
+                    batch.add_done_callback(self.batches.discard)
+                else:
+                    self.batch_slots.release()
+                if claimed < self.batch_size: # a full batch means there is a backlog, so don't sleep
+                    if self.once:
+                        break
+                    await self.wait(self.interval)
+            await asyncio.gather(*self.batches)
+        return self.sent
+
+    async def send_batch(self, deliveries_by_network):
+        try:
+            results = await asyncio.gather(
+                *(self.send_channel(network, deliveries) for network, deliveries in deliveries_by_network.items()),
+                return_exceptions=True
+            )
+            for network, result in zip(deliveries_by_network, results):
+                if isinstance(result, Exception):
+                    logger.error(f'Sending a batch of {network} deliveries failed', exc_info=result)
+                else:
+                    self.sent += result
+        finally:
+            self.batch_slots.release()
+
+    async def send_channel(self, channel, deliveries):
+        '''Sending the deliveries of a batch through a social network, output: the amount of sent deliveries'''
+        deliveries = await sync_to_async(claim_deliveries)(channel, deliveries)
+        if not deliveries:
+            return 0
+        if channel != 'telegram': # smtp is blocking, the connection is used in a thread of its own
+            return await sync_to_async(send_channel_deliveries, thread_sensitive=False)(channel, deliveries)
+        try:
+            messages = get_telegram_messages(deliveries)
+            waits = await sync_to_async(rate_limits.take_tokens, thread_sensitive=False)(channel, [chat_id for chat_id, _ in messages])
+            errors = [get_telegram_error(response) for response in await telegram_client.post_messages(self.pool, messages, waits)]
+        except Exception as error: # the whole batch failed, it is retried like in send_notifications.send_channel_deliveries
+            logger.exception(f'Sending a batch of {len(deliveries)} {channel} delivery(-ies) failed')
+            errors = [DeliveryError(f'The batch was not sent: {error!r}')] * len(deliveries)
+        return await sync_to_async(handle_send_errors)(channel, deliveries, errors)
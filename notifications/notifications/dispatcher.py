@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NotificationStatus
+from .tasks import deliver_notifications_task
+
+
+def dispatch_due_notifications(batch_size, delivery_batch_size=None):
+    '''
+        Input: batch_size -> the maximum amount of statuses handed to celery at once,
+            delivery_batch_size -> the amount of statuses sent by one delivery task ( NOTIFICATIONS_DELIVERY_BATCH_SIZE by default )
+        Output: the amount of dispatched statuses
+
+        Claims due not complited statuses with SELECT ... FOR UPDATE SKIP LOCKED ( several dispatchers never publish the same status twice ),
+        publishes delivery tasks for them and marks them as dispatched in the same transaction
+    '''
+    delivery_batch_size = delivery_batch_size or settings.NOTIFICATIONS_DELIVERY_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        due_ids = [
+            str(notification_status_id) for notification_status_id in
+            NotificationStatus.objects.due(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size]
+        ]
+        if not due_ids:
+            return 0
+        for i in range(0, len(due_ids), delivery_batch_size):
+            deliver_notifications_task.delay(due_ids[i:i + delivery_batch_size])
+        NotificationStatus.objects.filter(id__in=due_ids).update(dispatched_at=now)
+    return len(due_ids)
+
+def claim_due_notifications(batch_size):
+    '''
+        Input: batch_size -> the maximum amount of claimed statuses
+        Output: ids of due statuses marked as dispatched, for a worker which sends them itself instead of celery ( see async_worker.py )
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        due_ids = list(NotificationStatus.objects.due(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size])
+        if due_ids:
+            NotificationStatus.objects.filter(id__in=due_ids).update(dispatched_at=now)
+    return due_ids
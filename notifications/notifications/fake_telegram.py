@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# A fake telegram api for the tests and the delivery benchmark ( python manage.py benchmark_delivery )
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    # records the chat of every request, answers 429 to the first request of every chat if the server throttles
+    # ( asking to wait server.retry_after seconds ) and accepts the other messages after server.latency seconds
+    protocol_version = 'HTTP/1.1' # keep-alive, like telegram
+    disable_nagle_algorithm = True # the headers and the body are written separately, nagle would delay the body until the client acknowledges the headers
+
+    def do_POST(self):
+        data = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        chat_id = data['chat_id'][0]
+        with self.server.lock:
+            self.server.requests.append(chat_id)
+            throttled = self.server.throttle and chat_id not in self.server.throttled_chats
+            self.server.throttled_chats.add(chat_id)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if throttled:
+            status, body = 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': self.server.retry_after}}
+        else:
+            status, body = 200, {'ok': True, 'result': {'chat': {'id': chat_id}, 'text': data['text'][0]}}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 4096
+
+    def __init__(self, latency=0, throttle=False, retry_after=0):
+        super().__init__(('127.0.0.1', 0), FakeTelegramHandler)
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.reset()
+
+    @property
+    def url(self):
+        '''The url to set as TELEGRAM_API_SENDING_MESSAGE'''
+        return f'http://127.0.0.1:{self.server_address[1]}/sendMessage'
+
+    def reset(self):
+        '''Forgetting the requests and the throttled chats'''
+        self.requests = []
+        self.throttled_chats = set()
+
+    def start(self):
+        '''Serving in a thread of its own'''
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
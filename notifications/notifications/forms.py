@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 
 from django import forms
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -9,8 +10,8 @@ from django.contrib.postgres.forms import SimpleArrayField
 from crispy_forms import helper, layout
 
 from notification_categories.models import NotificationCategory
-from config.celery import app
-from .models import NotificationSingle, NotificationPeriodicity, NotificationId, NotificationStatus
+from .models import NotificationSingle, NotificationPeriodicity
+from .scheduling import reschedule_periodic_notification
 
 class NotificationCreateForm(forms.ModelForm):
     notification_category = forms.ModelChoiceField(label=_("Category"), queryset=NotificationCategory.objects.all(), initial='study')
@@ -127,14 +128,14 @@ class PeriodicalNotificationCreateForm(forms.ModelForm):
     notification_periodicity_num = forms.IntegerField(label=_("Number of repetitions"), initial=1, min_value=1, max_value=15)
     dates_type = forms.ChoiceField(
         label=_("Select dates"), 
-        choices=[('Every day', _('Every day')), ('Your own dates', _('Your own dates'))], 
+        choices=[('Every day', _('Every day')), ('Your own dates', _('Your own dates')), ('Recurrence rule', _('Recurrence rule'))], 
         initial="Every day", 
         widget=forms.RadioSelect(attrs={'onchange': 'check()'})
     )
     dates = SimpleArrayField(forms.CharField(max_length=30), label='', required=False)
     class Meta:
         model = NotificationPeriodicity
-        fields = ['notification_category', 'title', 'text', 'notification_periodic_time', 'notification_periodicity_num', 'dates']
+        fields = ['notification_category', 'title', 'text', 'notification_periodic_time', 'notification_periodicity_num', 'recurrence']
         widgets = {
             'notification_periodic_time' : forms.TimeInput(attrs={'type': 'time'}),
         }
@@ -163,6 +164,9 @@ class PeriodicalNotificationCreateForm(forms.ModelForm):
         dates_field = layout.Field(
             "dates", css_class="form-control d-none"
         )
+        recurrence_field = layout.Field(
+            "recurrence", css_class="form-control d-none", placeholder="FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10"
+        )
         dates_type_field = layout.Div(
             layout.Field('dates_type', css_class="form-control"),
             css_class="myclass mt-2"
@@ -181,6 +185,7 @@ class PeriodicalNotificationCreateForm(forms.ModelForm):
             notification_periodicity_num_field,
             dates_type_field,
             dates_field,
+            recurrence_field,
             submit_button
         )
     
@@ -192,28 +197,35 @@ class PeriodicalNotificationCreateForm(forms.ModelForm):
         elif value == 'Your own dates':
             if not self.cleaned_data.get('dates'):
                 raise forms.ValidationError(_("If you`ve chosen `Your own dates`, please enter your dates in the field `your own dates`"))
-            user_dates = self.cleaned_data.get('dates')
-            for date in user_dates:
+            user_dates = []
+            for date in self.cleaned_data.get('dates'):
                 try:
                     date = datetime.strptime(date, "%Y-%m-%d")
                 except ValueError:
                     raise forms.ValidationError(_("ENTER DATES IN APPROPRIATE FORMAT"))
                 if date > datetime.strptime("2040-12-31", "%Y-%m-%d"):
                     raise forms.ValidationError(_(f'This date {date.date()} is too late. Please enter a date no later than 2040 year =3'))
+                user_dates.append(date.date())
+            self.cleaned_data['dates'] = user_dates # parsed once, the create view gets date objects
+        elif value == 'Recurrence rule':
+            if not self.cleaned_data.get('recurrence'):
+                raise forms.ValidationError(_("If you`ve chosen `Recurrence rule`, please enter the rule in the field `recurrence rule`"))
+        if value != 'Recurrence rule':
+            self.cleaned_data['recurrence'] = ''
 
 class NotificationPeriodicEditForm(forms.ModelForm):
     notification_category = forms.ModelChoiceField(label=_("Category"), queryset=NotificationCategory.objects.all(), initial='study')
     notification_periodicity_num = forms.IntegerField(label=_("Number of repetitions"), initial=1, min_value=1, max_value=15)
     dates_type = forms.ChoiceField(
         label=_("Select dates"), 
-        choices=[('Every day', _('Every day')), ('Your own dates', _('Your own dates'))], 
+        choices=[('Every day', _('Every day')), ('Your own dates', _('Your own dates')), ('Recurrence rule', _('Recurrence rule'))], 
         initial="Every day", 
         widget=forms.RadioSelect(attrs={'onchange': 'check()'})
     )
     dates = SimpleArrayField(forms.CharField(max_length=30), label='', required=False)
     class Meta:
         model = NotificationPeriodicity
-        fields = ['notification_category', 'title', 'text', 'notification_periodic_time', 'notification_periodicity_num', 'dates']
+        fields = ['notification_category', 'title', 'text', 'notification_periodic_time', 'notification_periodicity_num', 'recurrence']
         widgets = {
             'notification_periodic_time' : forms.TimeInput(attrs={'type': 'time'}),
         }
@@ -223,6 +235,9 @@ class NotificationPeriodicEditForm(forms.ModelForm):
         self.notification_periodic_kwargs = kwargs.pop('notification_periodic_kwargs')
 
         super().__init__(*args, **kwargs)
+        self.initial.setdefault('dates', self.instance.get_dates())
+        if self.instance.recurrence:
+            self.initial.setdefault('dates_type', 'Recurrence rule')
         self.fields['notification_category'].queryset = NotificationCategory.objects.filter(Q(user=self.request.user) | Q(user=None))
         self.fields['notification_periodic_time'].initial = timezone.localtime(timezone.now()).time()
 
@@ -244,6 +259,9 @@ class NotificationPeriodicEditForm(forms.ModelForm):
         dates_field = layout.Field(
             "dates", css_class="form-control d-none"
         )
+        recurrence_field = layout.Field(
+            "recurrence", css_class="form-control d-none", placeholder="FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10"
+        )
         dates_type_field = layout.Div(
             layout.Field('dates_type', css_class="form-control"),
             css_class="myclass mt-2"
@@ -263,6 +281,7 @@ class NotificationPeriodicEditForm(forms.ModelForm):
             notification_periodicity_num_field,
             dates_type_field,
             dates_field,
+            recurrence_field,
             submit_button
         )
     
@@ -274,23 +293,29 @@ class NotificationPeriodicEditForm(forms.ModelForm):
             elif value == 'Your own dates':
                 if not self.cleaned_data.get('dates'):
                     raise forms.ValidationError(_("If you`ve chosen `Your own dates`, please enter your dates in the field `your own dates`"))
-                user_dates = self.cleaned_data.get('dates')
-                for date in user_dates:
+                user_dates = []
+                for date in self.cleaned_data.get('dates'):
                     try:
                         date = datetime.strptime(date, "%Y-%m-%d")
                     except ValueError:
                         raise forms.ValidationError(_("ENTER DATES IN APPROPRIATE FORMAT"))
                     if date > datetime.strptime("2040-12-31", "%Y-%m-%d"):
                         raise forms.ValidationError(_(f'This date {date.date()} is too late. Please enter a date no later than 2040 year =3'))
+                    user_dates.append(date.date())
+                self.cleaned_data['dates'] = user_dates # parsed once, save() gets date objects
+            elif value == 'Recurrence rule':
+                if not self.cleaned_data.get('recurrence'):
+                    raise forms.ValidationError(_("If you`ve chosen `Recurrence rule`, please enter the rule in the field `recurrence rule`"))
+            if value != 'Recurrence rule':
+                self.cleaned_data['recurrence'] = ''
     
+    @transaction.atomic # the notification and its scheduled statuses are committed together
     def save(self, commit=True):
+        if not self.instance.recurrence:
+            self.instance.recurrence_start = None
+        elif 'recurrence' in self.changed_data or self.instance.recurrence_start is None: # a new rule starts today
+            self.instance.recurrence_start = timezone.localtime(timezone.now()).date()
         res = super().save(commit)
-        for notification_status in res.notification_status.all():
-            NotificationStatus.objects.get(id=notification_status.id).delete()
-
-        for task in res.notification_type_periodicity.task_id.all():
-            app.control.revoke(str(task), terminate=True, signal='SIGKILL')
-            NotificationId.objects.get(notification_id=task).delete()
 
         current_date = timezone.localtime(timezone.now()).date()
         value = self.cleaned_data.get('dates_type')                     
@@ -299,11 +324,10 @@ class NotificationPeriodicEditForm(forms.ModelForm):
             for _ in range(self.cleaned_data.get('notification_periodicity_num')):
                 current_date = current_date + timedelta(days=1)
                 dates.append((current_date))
-            res.dates = dates
         elif value == 'Your own dates':
             dates = self.cleaned_data.get('dates')
-            dates = sorted(dates, key=lambda x: datetime.strptime(x, '%Y-%m-%d'))
-            res.dates = dates
-        res.save()
+        elif value == 'Recurrence rule':
+            dates = []
+        reschedule_periodic_notification(res, dates) # only the changed occurrences are rescheduled
 
         return res
\ No newline at end of file
@@ -0,0 +1,22 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.async_worker import AsyncDeliveryWorker
+
+class Command(BaseCommand):
+    help = 'Send due notifications from one asyncio process instead of the dispatcher and the celery delivery workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATIONS_DELIVERY_BATCH_SIZE, help='Amount of notifications taken at once')
+        parser.add_argument('--max-batches', type=int, default=settings.NOTIFICATIONS_ASYNC_WORKER_BATCHES, help='Maximum amount of batches sent at the same time')
+        parser.add_argument('--concurrency', type=int, default=settings.NOTIFICATIONS_ASYNC_WORKER_CONCURRENCY, help='Maximum amount of telegram requests in flight')
+        parser.add_argument('--interval', type=float, default=settings.NOTIFICATIONS_DISPATCH_INTERVAL, help='Seconds between two checks of due notifications')
+        parser.add_argument('--once', action='store_true', help='Send the notifications which are due now and exit')
+
+    def handle(self, *args, **options):
+        worker = AsyncDeliveryWorker(options['batch_size'], options['max_batches'], options['concurrency'], options['interval'], options['once'])
+        self.stdout.write(self.style.SUCCESS('Asyncio delivery worker started =3'))
+        sent = asyncio.run(worker.run())
+        self.stdout.write(f'Asyncio delivery worker stopped, {sent} delivery(-ies) sent')
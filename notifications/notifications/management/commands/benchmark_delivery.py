@@ -0,0 +1,64 @@
+import asyncio
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from notifications import telegram_client
+from notifications.fake_telegram import FakeTelegramServer
+
+def serve_fake_telegram(latency, port):
+    server = FakeTelegramServer(latency=latency)
+    port.value = server.server_address[1]
+    server.serve_forever()
+
+def send_batch(messages):
+    '''A delivery task of a prefork worker process: one batch of messages at a time'''
+    return sum(1 for response in telegram_client.send_messages(messages) if not isinstance(response, Exception) and response.is_success)
+
+class Command(BaseCommand):
+    help = 'Compare the telegram messages per second of prefork worker processes with the asyncio delivery worker against a fake telegram api'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000, help='Amount of sent messages')
+        parser.add_argument('--batch-size', type=int, default=50, help='Amount of messages in a delivery batch')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(), help='Amount of prefork worker processes')
+        parser.add_argument('--concurrency', type=int, default=1000, help='Maximum amount of requests in flight of the asyncio worker')
+        parser.add_argument('--max-batches', type=int, default=20, help='Maximum amount of batches sent at the same time by the asyncio worker')
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds the fake telegram api takes to answer')
+
+    async def send_async(self, batches, concurrency, max_batches):
+        # the way async_worker.AsyncDeliveryWorker sends: one pool of connections shared by the batches in flight
+        batch_slots = asyncio.Semaphore(max_batches)
+        async with telegram_client.AsyncClientPool(concurrency) as pool:
+            async def send(messages):
+                async with batch_slots:
+                    responses = await telegram_client.post_messages(pool, messages)
+                return sum(1 for response in responses if not isinstance(response, Exception) and response.is_success)
+            return sum(await asyncio.gather(*(send(messages) for messages in batches)))
+
+    def handle(self, *args, **options):
+        port = multiprocessing.Value('i', 0)
+        server = multiprocessing.Process(target=serve_fake_telegram, args=(options['latency'], port), daemon=True)
+        server.start()
+        while not port.value:
+            time.sleep(0.01)
+
+        messages = [(str(i), f'text {i}') for i in range(options['messages'])]
+        batches = [messages[i:i + options['batch_size']] for i in range(0, len(messages), options['batch_size'])]
+        try:
+            with override_settings(TELEGRAM_API_SENDING_MESSAGE=f'http://127.0.0.1:{port.value}/sendMessage'):
+                start = time.perf_counter()
+                with multiprocessing.Pool(options['processes']) as pool:
+                    sent = sum(pool.map(send_batch, batches, chunksize=1))
+                self.report(f'prefork ( {options["processes"]} processes )', sent, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                sent = asyncio.run(self.send_async(batches, options['concurrency'], options['max_batches']))
+                self.report(f'asyncio ( {options["concurrency"]} requests in flight )', sent, time.perf_counter() - start)
+        finally:
+            server.terminate()
+
+    def report(self, name, sent, spent):
+        self.stdout.write(f'{name}: {sent} message(-s) in {spent:.2f} seconds, {sent / spent:.0f} messages per second')
@@ -0,0 +1,50 @@
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils.translation import activate, deactivate, gettext as _
+
+from notifications.rendering import EMAIL_TEMPLATES, render_emails, render_telegram_messages
+from notifications.send_notifications import Delivery
+
+class Command(BaseCommand):
+    help = 'Compare the per-message render cost of the rendering layer with rendering every message from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000, help='Amount of rendered messages')
+
+    def render_one_by_one(self, deliveries):
+        # the way messages were rendered before the rendering layer
+        for delivery in deliveries:
+            activate(delivery.lang_code)
+            message = _("👋 Hi, you have received a new notification!") + '\n' + str(_("Category")) + ": " + delivery.notification.notification_category.name_type
+            message += '\n' + str(_("Title")) + ": " + delivery.notification.title + '\n' + str(_("Text")) + ": " + delivery.notification.text
+            message += '\n' + str(_("Time")) + ": " + delivery.time + '\n'
+            render_to_string(EMAIL_TEMPLATES[delivery.model], {'user': delivery.user, 'notification': delivery.notification, 'time': delivery.time, 'time_stamp': delivery.time})
+            deactivate()
+
+    def render_batch(self, deliveries):
+        render_telegram_messages(deliveries)
+        render_emails(deliveries)
+
+    def handle(self, *args, **options):
+        languages = [lang_code for lang_code, _ in settings.LANGUAGES]
+        deliveries = [
+            Delivery(
+                notification=SimpleNamespace(title=f'title {i}', text=f'text {i}', notification_category=SimpleNamespace(name_type='study')),
+                model='single' if i % 2 else 'periodic',
+                user=SimpleNamespace(username=f'user {i}', email=f'user{i}@gmail.com'),
+                time='October 18, 2026 09:00:00 AM',
+                lang_code=languages[i % len(languages)],
+                notification_status_id=None
+            ) for i in range(options['messages'])
+        ]
+        self.render_batch(deliveries[:len(languages) * 2]) # warming up the template caches of both ways
+
+        for name, render in [('one by one', self.render_one_by_one), ('rendering layer', self.render_batch)]:
+            start = time.perf_counter()
+            render(deliveries)
+            spent = time.perf_counter() - start
+            self.stdout.write(f'{name}: {spent * 1e6 / len(deliveries):.1f} µs per message ( telegram text + email )')
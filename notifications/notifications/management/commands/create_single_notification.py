@@ -1,10 +1,13 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from notifications.models import NotificationSingle, NotificationBase, NotificationPeriodicity, NotificationType, NotificationStatus
+from notifications.scheduling import schedule_single_notification
 from authentication.models import MyUser
 from django.utils import timezone
 
 class Command(BaseCommand):
     help = 'Create single notification object =3'
+    @transaction.atomic
     def handle(self, *args, **options):
         timezone_now = timezone.now().strptime(timezone.now().strftime('%Y-%m-%d %H:%M:%S'), '%Y-%m-%d %H:%M:%S')
         notification_status = NotificationStatus.objects.create()
@@ -17,6 +20,7 @@ class Command(BaseCommand):
             notification_status=notification_status,
             notification_type_single=notification_type_single,
         )
+        schedule_single_notification(create_single_task)
         self.stdout.write(self.style.SUCCESS('Successfully created new notification single object "%s"' % create_single_task))
         self.stdout.write(f'''
         notification task type - {create_single_task.notification_task_type},
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.dispatcher import dispatch_due_notifications
+
+class Command(BaseCommand):
+    help = 'Hand due notifications to celery workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.NOTIFICATIONS_DISPATCH_INTERVAL, help='Seconds between two checks of due notifications')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATIONS_DISPATCH_BATCH_SIZE, help='Maximum amount of notifications dispatched in one transaction')
+        parser.add_argument('--once', action='store_true', help='Dispatch the notifications which are due now and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Notifications dispatcher started =3'))
+        try:
+            while True:
+                dispatched = dispatch_due_notifications(options['batch_size'])
+                if dispatched:
+                    self.stdout.write(f'Dispatched {dispatched} notification(-s)')
+                if options['once'] and dispatched < options['batch_size']:
+                    break
+                if dispatched < options['batch_size']: # a full batch means there is a backlog, so don't sleep
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Notifications dispatcher stopped')
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.rate_limits import get_throttled_metrics, reset_throttled_metrics
+
+class Command(BaseCommand):
+    help = 'Show how many messages of every channel were throttled by the rate limits and how long they waited'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the metrics after showing them')
+
+    def handle(self, *args, **options):
+        channels = sorted(settings.NOTIFICATIONS_RATE_LIMITS)
+        for channel, (throttled, throttled_seconds) in get_throttled_metrics(channels).items():
+            average = throttled_seconds / throttled if throttled else 0
+            self.stdout.write(f'{channel}: {throttled} throttled message(-s), {throttled_seconds:.2f} seconds in total, {average:.2f} seconds on average')
+        if options['reset']:
+            reset_throttled_metrics(channels)
+            self.stdout.write(self.style.SUCCESS('The metrics are reset'))
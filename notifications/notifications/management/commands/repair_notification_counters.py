@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from notifications.models import NotificationBase
+
+class Command(BaseCommand):
+    help = 'Recompute the status counters of notifications ( pending, completed, revoked, next notification time ) from their statuses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Amount of notifications updated in one UPDATE')
+
+    def handle(self, *args, **options):
+        notification_ids = list(NotificationBase.objects.order_by('id').values_list('id', flat=True))
+        repaired = 0
+        for i in range(0, len(notification_ids), options['batch_size']): # short updates, so the site and the workers are not locked out for long
+            repaired += NotificationBase.objects.filter(id__in=notification_ids[i:i + options['batch_size']]).refresh_counters()
+        self.stdout.write(self.style.SUCCESS(f'Repaired the status counters of {repaired} notification(-s)'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from notifications.send_notifications import SENDERS, replay_dead_letters
+
+class Command(BaseCommand):
+    help = 'Send the dead letters ( deliveries which failed permanently or ran out of attempts ) once more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel', choices=sorted(SENDERS), help='Replay only the dead letters of this social network')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum amount of replayed dead letters')
+
+    def handle(self, *args, **options):
+        replayed = replay_dead_letters(options['channel'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} dead letter(-s)'))
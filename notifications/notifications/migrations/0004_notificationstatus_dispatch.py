@@ -0,0 +1,35 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:05
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_scheduled_statuses_as_dispatched(apps, schema_editor):
+    # not complited statuses created before the dispatcher already have an eta task in celery
+    NotificationStatus = apps.get_model('notifications', 'NotificationStatus')
+    NotificationStatus.objects.filter(done=0).update(dispatched_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_auto_20230903_1221'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationstatus',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Dispatched at'),
+        ),
+        migrations.AddField(
+            model_name='notificationstatus',
+            name='lang_code',
+            field=models.CharField(default='ru', max_length=10, verbose_name='Language'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationstatus',
+            index=models.Index(condition=models.Q(('dispatched_at__isnull', True), ('done', 0)), fields=['time_stamp'], name='notification_pending_idx'),
+        ),
+        migrations.RunPython(mark_scheduled_statuses_as_dispatched, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:15
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_notificationstatus_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationperiodicity',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('title', 'text', config='simple'), name='notification_periodic_search'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationsingle',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('title', 'text', config='simple'), name='notification_single_search'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationid',
+            name='notification_id',
+            field=models.CharField(max_length=300, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='notificationbase',
+            index=models.Index(fields=['user', '-created_time'], name='notification_base_user_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:17
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_status_counters(apps, schema_editor):
+    # the same counters as NotificationBaseQuerySet.refresh_counters, built on the historical models
+    NotificationBase = apps.get_model('notifications', 'NotificationBase')
+    NotificationStatus = apps.get_model('notifications', 'NotificationStatus')
+    paths = ('notificationsingle__notification_type_single', 'notification_periodic_statuses__notification_type_periodicity')
+
+    def aggregate(value, **filters):
+        return [
+            models.Subquery(
+                NotificationStatus.objects.filter(**{path: models.OuterRef('pk')}, **filters)
+                .order_by().values(path).annotate(value=value).values('value')
+            ) for path in paths
+        ]
+
+    def count(done):
+        single, periodic = aggregate(models.Count('id'), done=done)
+        return Coalesce(single, 0) + Coalesce(periodic, 0)
+
+    NotificationBase.objects.update(
+        pending_statuses=count(0),
+        completed_statuses=count(1),
+        revoked_statuses=count(2),
+        next_fire_at=Coalesce(*aggregate(models.Min('time_stamp'), done=0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_scheduling_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationbase',
+            name='completed_statuses',
+            field=models.PositiveIntegerField(default=0, verbose_name='Completed'),
+        ),
+        migrations.AddField(
+            model_name='notificationbase',
+            name='next_fire_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Next notification at'),
+        ),
+        migrations.AddField(
+            model_name='notificationbase',
+            name='pending_statuses',
+            field=models.PositiveIntegerField(default=0, verbose_name='Pending'),
+        ),
+        migrations.AddField(
+            model_name='notificationbase',
+            name='revoked_statuses',
+            field=models.PositiveIntegerField(default=0, verbose_name='Revoked'),
+        ),
+        migrations.RunPython(fill_status_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:20
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.dateparse import parse_date
+
+
+def copy_dates_to_occurrences(apps, schema_editor):
+    # the dates were stored as "2023-05-14" strings, every one of them becomes a row of the occurrence table
+    NotificationPeriodicity = apps.get_model('notifications', 'NotificationPeriodicity')
+    NotificationPeriodicDate = apps.get_model('notifications', 'NotificationPeriodicDate')
+    occurrences = []
+    for notification_periodic_id, dates in NotificationPeriodicity.objects.values_list('id', 'dates').iterator():
+        occurrences.extend(
+            NotificationPeriodicDate(notification_periodic_id=notification_periodic_id, date=date)
+            for date in {parse_date(date) for date in dates or []} if date is not None
+        )
+    NotificationPeriodicDate.objects.bulk_create(occurrences, batch_size=1000)
+
+
+def copy_occurrences_to_dates(apps, schema_editor):
+    NotificationPeriodicity = apps.get_model('notifications', 'NotificationPeriodicity')
+    NotificationPeriodicDate = apps.get_model('notifications', 'NotificationPeriodicDate')
+    dates = {}
+    for notification_periodic_id, date in NotificationPeriodicDate.objects.order_by('date').values_list('notification_periodic_id', 'date').iterator():
+        dates.setdefault(notification_periodic_id, []).append(str(date))
+    for notification_periodic_id, notification_dates in dates.items():
+        NotificationPeriodicity.objects.filter(id=notification_periodic_id).update(dates=notification_dates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0007_notificationbase_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationPeriodicDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, verbose_name='Date')),
+                ('notification_periodic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='notifications.notificationperiodicity', verbose_name='Periodic notification')),
+            ],
+            options={
+                'verbose_name': 'Notification periodic date',
+                'verbose_name_plural': 'Notification periodic dates',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificationperiodicdate',
+            constraint=models.UniqueConstraint(fields=('notification_periodic', 'date'), name='notification_periodic_date_unique'),
+        ),
+        migrations.AlterField( # a default, so the column can be added back to the filled table when the migration is reversed
+            model_name='notificationperiodicity',
+            name='dates',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=30), default=list, size=None, verbose_name='Dates'),
+        ),
+        migrations.RunPython(copy_dates_to_occurrences, copy_occurrences_to_dates),
+        migrations.RemoveField(
+            model_name='notificationperiodicity',
+            name='dates',
+        ),
+    ]
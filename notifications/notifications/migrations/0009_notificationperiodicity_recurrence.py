@@ -0,0 +1,29 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:24
+
+from django.db import migrations, models
+import notifications.recurrence
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_notificationperiodicdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationperiodicity',
+            name='next_occurrence_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Next occurrence'),
+        ),
+        migrations.AddField(
+            model_name='notificationperiodicity',
+            name='recurrence',
+            field=models.CharField(blank=True, default='', max_length=300, validators=[notifications.recurrence.validate_recurrence], verbose_name='Recurrence rule'),
+        ),
+        migrations.AddField(
+            model_name='notificationperiodicity',
+            name='recurrence_start',
+            field=models.DateField(blank=True, null=True, verbose_name='Recurrence start'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0009_notificationperiodicity_recurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationperiodicity',
+            name='lang_code',
+            field=models.CharField(default='ru', max_length=10, verbose_name='Language'),
+        ),
+    ]
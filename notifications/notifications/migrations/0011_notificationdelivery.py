@@ -0,0 +1,32 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0010_notificationperiodicity_lang_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=50, verbose_name='Channel')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('notification_status', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='notifications.notificationstatus', verbose_name='Status')),
+            ],
+            options={
+                'verbose_name': 'Notification delivery',
+                'verbose_name_plural': 'Notification deliveries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificationdelivery',
+            constraint=models.UniqueConstraint(fields=('notification_status', 'channel'), name='notification_delivery_unique'),
+        ),
+    ]
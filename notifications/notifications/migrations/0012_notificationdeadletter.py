@@ -0,0 +1,40 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0011_notificationdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationdelivery',
+            name='attempts',
+            field=models.PositiveIntegerField(default=1, verbose_name='Attempts'),
+        ),
+        migrations.CreateModel(
+            name='NotificationDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=50, verbose_name='Channel')),
+                ('attempts', models.PositiveIntegerField(verbose_name='Attempts')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('notification_status', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='notifications.notificationstatus', verbose_name='Status')),
+            ],
+            options={
+                'verbose_name': 'Notification dead letter',
+                'verbose_name_plural': 'Notification dead letters',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificationdeadletter',
+            constraint=models.UniqueConstraint(fields=('notification_status', 'channel'), name='notification_dead_letter_unique'),
+        ),
+    ]
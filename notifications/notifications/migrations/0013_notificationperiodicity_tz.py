@@ -0,0 +1,29 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+def fill_timezones(apps, schema_editor):
+    # the notifications were scheduled in the timezone of the session, which is the one of the user
+    NotificationPeriodicity = apps.get_model('notifications', 'NotificationPeriodicity')
+    NotificationPeriodicity.objects.filter(notification_type_periodicity__user__tz__gt='').update(
+        tz=models.Subquery(
+            NotificationPeriodicity.objects.filter(pk=models.OuterRef('pk')).values('notification_type_periodicity__user__tz')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0012_notificationdeadletter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationperiodicity',
+            name='tz',
+            field=models.CharField(default='UTC', max_length=100, verbose_name='Timezone'),
+        ),
+        migrations.RunPython(fill_timezones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0013_notificationperiodicity_tz'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificationbase',
+            index=models.Index(fields=['user', 'pending_statuses', 'revoked_statuses'], name='notification_base_counters_idx'),
+        ),
+    ]
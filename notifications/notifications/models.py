@@ -1,22 +1,22 @@
+import re
 import uuid
-from datetime import datetime, timedelta
-import pytz
+from datetime import timedelta
 
-from django.db import models
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce
 from django.urls import reverse_lazy
 from django.utils import timezone
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.contrib.postgres.fields import ArrayField
-from django.utils.translation import gettext_lazy as _, get_language
-
-from .tasks import create_notification_task, create_periodic_notification_task
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.utils.translation import gettext_lazy as _
 
 from core.models import UrlBase
+from .recurrence import validate_recurrence
 
 class NotificationId(models.Model):
     # the model defining the celery task id
-    notification_id = models.CharField(max_length=300) # task id
+    notification_id = models.CharField(max_length=300, unique=True) # task id
 
     class Meta:
         verbose_name = 'Notification task id'
@@ -25,6 +25,40 @@ class NotificationId(models.Model):
     def __str__(self):
         return self.notification_id
 
+class NotificationStatusQuerySet(models.QuerySet):
+    def due(self, now):
+        '''Not complited statuses whose time has come and which have not been handed to celery yet'''
+        return self.filter(
+            done=NotificationStatus.Status.NOT_COMPLITED,
+            dispatched_at__isnull=True,
+            time_stamp__lte=now,
+        ).order_by('time_stamp')
+
+    def revoke(self):
+        '''
+            Revoking all the not complited statuses with one UPDATE ( and two more queries for the status counters ), output: the amount of revoked statuses
+            Workers are not told about it: the delivery skips statuses which are not `not complited` anymore ( see send_notifications.load_deliveries )
+        '''
+        revoked = self.filter(done=NotificationStatus.Status.NOT_COMPLITED).update(done=NotificationStatus.Status.REVOKED)
+        self.notifications().refresh_counters()
+        return revoked
+
+    def notifications(self):
+        '''
+            The notifications ( NotificationBase ) the statuses belong to
+            Their ids are collected through the single notifications and the periodic ones with two indexed lookups joined by UNION ALL,
+            so the notifications are found by their primary key instead of OR-ing two outer joins, which postgres can only scan
+        '''
+        statuses = self.values('id')
+        return NotificationBase.objects.filter(id__in=(
+            NotificationSingle.objects.filter(notification_status__in=statuses).values('notification_type_single')
+            .union(
+                NotificationPeriodicity.notification_status.through.objects.filter(notificationstatus__in=statuses)
+                .values('notificationperiodicity__notification_type_periodicity'),
+                all=True
+            )
+        ))
+
 class NotificationStatus(models.Model):
     # a model that defines and sets the status of an notification (completed, not completed, or it has been revoked)
     class Status(models.IntegerChoices):
@@ -55,10 +89,29 @@ class NotificationStatus(models.Model):
         choices=Status.choices, 
         default=Status.NOT_COMPLITED
     )
+    dispatched_at = models.DateTimeField( # the time the dispatcher handed the notification to celery
+        _("Dispatched at"),
+        blank=True,
+        null=True
+    )
+    lang_code = models.CharField( # the language the notification will be sent in
+        _("Language"),
+        max_length=10,
+        default=settings.LANGUAGE_CODE
+    )
+
+    objects = NotificationStatusQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Notification status'
         verbose_name_plural = 'Notification statuses'
+        indexes = [
+            models.Index( # the due queue ( NotificationStatusQuerySet.due ) holds only the statuses which are still waiting
+                fields=['time_stamp'],
+                condition=models.Q(done=0, dispatched_at__isnull=True),
+                name='notification_pending_idx'
+            ),
+        ]
 
     def __str__(self):
         if self.done == False:
@@ -66,11 +119,219 @@ class NotificationStatus(models.Model):
         elif self.done == 2:
             return 'Revoked'
         return 'Complited'
-    
+
+class NotificationDeliveryQuerySet(models.QuerySet):
+    def claim(self, channel, notification_status_ids):
+        '''
+            Input: channel -> social network name, notification_status_ids -> ids of the statuses which are about to be sent through it
+            Output: set of the ids which have not been sent through the channel yet, only they should be sent
+
+            One INSERT ... ON CONFLICT DO NOTHING: a status sent already ( a duplicate task, a redelivered or re-triggered one ) conflicts and is skipped
+        '''
+        if not notification_status_ids:
+            return set()
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                    INSERT INTO {table} (notification_status_id, channel, created_at)
+                    SELECT DISTINCT unnest(%s::uuid[]), %s, %s
+                    ON CONFLICT (notification_status_id, channel) DO NOTHING
+                    RETURNING notification_status_id
+                ''',
+                [[str(notification_status_id) for notification_status_id in notification_status_ids], channel, timezone.now()]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def claim_retry(self, channel, notification_status_ids, attempt):
+        '''
+            Input: channel -> social network name, notification_status_ids -> ids of the failed statuses, attempt -> the number of the attempt ( 2 for the first retry )
+            Output: set of the ids whose previous attempt was the last one, so a duplicate retry task does not send them twice
+        '''
+        with transaction.atomic():
+            claimed = set(
+                self.select_for_update(skip_locked=True)
+                .filter(channel=channel, notification_status__in=notification_status_ids, attempts=attempt - 1)
+                .values_list('notification_status_id', flat=True)
+            )
+            self.filter(channel=channel, notification_status__in=claimed).update(attempts=attempt)
+        return claimed
+
+class NotificationDelivery(models.Model):
+    # the delivery ledger: a notification status is sent through every channel at most once
+    notification_status = models.ForeignKey( # connection with the sent status
+        NotificationStatus,
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+        verbose_name=_("Status")
+    )
+    channel = models.CharField( # social network name, for example, telegram
+        _("Channel"),
+        max_length=50
+    )
+    created_at = models.DateTimeField( # the time the delivery was claimed by a worker
+        _("Created at"),
+        default=timezone.now
+    )
+    attempts = models.PositiveIntegerField( # the amount of sending attempts, failed deliveries are retried ( see send_notifications.send_channel_deliveries )
+        _("Attempts"),
+        default=1
+    )
+
+    objects = NotificationDeliveryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Notification delivery'
+        verbose_name_plural = 'Notification deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['notification_status', 'channel'], name='notification_delivery_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.notification_status_id} - {self.channel}'
+
+class NotificationDeadLetter(models.Model):
+    # a delivery which failed permanently or ran out of attempts, it is sent again only by `python manage.py replay_dead_letters`
+    notification_status = models.ForeignKey( # connection with the failed status
+        NotificationStatus,
+        on_delete=models.CASCADE,
+        related_name='dead_letters',
+        verbose_name=_("Status")
+    )
+    channel = models.CharField( # social network name, for example, telegram
+        _("Channel"),
+        max_length=50
+    )
+    attempts = models.PositiveIntegerField( # the amount of sending attempts made
+        _("Attempts"),
+    )
+    error = models.TextField( # the error of the last attempt
+        _("Error"),
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        _("Created at"),
+        default=timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'Notification dead letter'
+        verbose_name_plural = 'Notification dead letters'
+        ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['notification_status', 'channel'], name='notification_dead_letter_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.notification_status_id} - {self.channel}: {self.error}'
+
+def get_search_vector(prefix=''):
+    '''
+        Input: prefix -> path to a single or periodic notification ( "notification_single__" ), empty for the notification itself
+        Output: the search document of a notification, the same expression is indexed by the GIN indexes of single and periodic notifications
+    '''
+    return SearchVector(f'{prefix}title', f'{prefix}text', config='simple')
+
+def get_search_query(query):
+    '''
+        Input: query -> text typed by the user
+        Output: a tsquery matching documents which contain all the words of the query as prefixes ( "wor" finds "work" ), None if there are no words
+    '''
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+
+# paths from a status to its notification ( NotificationBase ): through a single notification and through a periodic one
+STATUS_NOTIFICATION_PATHS = (
+    'notificationsingle__notification_type_single',
+    'notification_periodic_statuses__notification_type_periodicity',
+)
+
+def get_statuses_aggregate(aggregate, **filters):
+    '''
+        Input: aggregate -> aggregate over the statuses ( models.Count('id') ), filters -> filters of the statuses
+        Output: subqueries aggregating the statuses of the outer notification ( NotificationBase ), one per path in STATUS_NOTIFICATION_PATHS
+    '''
+    return [
+        models.Subquery(
+            NotificationStatus.objects.filter(**{path: models.OuterRef('pk')}, **filters)
+            .order_by().values(path).annotate(value=aggregate).values('value')
+        ) for path in STATUS_NOTIFICATION_PATHS
+    ]
+
+def count_statuses(done):
+    single, periodic = get_statuses_aggregate(models.Count('id'), done=done)
+    return Coalesce(single, 0) + Coalesce(periodic, 0)
+
+def get_next_fire_at():
+    return Coalesce(*get_statuses_aggregate(models.Min('time_stamp'), done=NotificationStatus.Status.NOT_COMPLITED))
+
+class NotificationBaseQuerySet(models.QuerySet):
+    def with_status(self):
+        '''Joins the single / periodic notification with its category, status and dates, so a list is rendered in a constant number of queries'''
+        return self.select_related(
+            'notification_single__notification_category',
+            'notification_single__notification_status',
+            'notification_periodic__notification_category',
+        ).prefetch_related('notification_periodic__occurrences')
+
+    def active(self):
+        '''Notifications which still have something to remind about'''
+        return self.with_status().filter(
+            models.Q(pending_statuses__gt=0) | models.Q(revoked_statuses__gt=0) | models.Q(notification_periodic__next_occurrence_at__isnull=False)
+        )
+
+    def finished(self):
+        '''Notifications whose statuses are all complited and which have nothing left to schedule'''
+        return self.with_status().filter(pending_statuses=0, revoked_statuses=0, notification_periodic__next_occurrence_at__isnull=True)
+
+    def refresh_counters(self):
+        '''
+            Recomputes the status counters of the notifications from their statuses, output: the amount of updated notifications
+            Called by every path changing statuses ( scheduling, delivery, revoking and restoring ) in the transaction of the change.
+
+            Under READ COMMITTED a single UPDATE counts with the snapshot it started with, so it could overwrite the counters with a count
+            which misses the statuses of a concurrent transaction committed meanwhile. The notifications are locked first ( in the order of
+            their ids, so concurrent calls do not deadlock ) and the UPDATE starts after the lock is granted: a transaction changing statuses
+            of the same notification recomputes the counters after the other one commits, with a snapshot which sees its statuses
+        '''
+        with transaction.atomic(savepoint=False):
+            ids = list(self.order_by('pk').select_for_update(of=('self',)).values_list('pk', flat=True))
+            if not ids:
+                return 0
+            return NotificationBase.objects.filter(pk__in=ids).update(
+                pending_statuses=count_statuses(NotificationStatus.Status.NOT_COMPLITED),
+                completed_statuses=count_statuses(NotificationStatus.Status.COMPLITED),
+                revoked_statuses=count_statuses(NotificationStatus.Status.REVOKED),
+                next_fire_at=get_next_fire_at(),
+            )
+
+    def search(self, query):
+        '''
+            Notifications whose title or text contain the words of the query, annotated with `rank` and ordered by it
+            The single and periodic notifications are matched by their GIN indexes, only the matches are joined to the notifications
+        '''
+        search_query = get_search_query(query)
+        if search_query is None:
+            return self.none()
+        return self.filter(
+            models.Q(notification_single__in=NotificationSingle.objects.annotate(document=get_search_vector()).filter(document=search_query).values('id')) |
+            models.Q(notification_periodic__in=NotificationPeriodicity.objects.annotate(document=get_search_vector()).filter(document=search_query).values('id'))
+        ).annotate(
+            rank=SearchRank(get_search_vector('notification_single__'), search_query) + SearchRank(get_search_vector('notification_periodic__'), search_query)
+        ).order_by('-rank', '-created_time')
+
 class NotificationBase(models.Model):
     # The general notification model referenced by the single and periodic notifications models
     class Meta:
         ordering = ['-created_time']
+        indexes = [
+            models.Index(fields=['user', '-created_time'], name='notification_base_user_idx'), # the notification lists of a user
+            models.Index(fields=['user', 'pending_statuses', 'revoked_statuses'], name='notification_base_counters_idx'), # the active and finished lists filter on the counters
+        ]
+
+    objects = NotificationBaseQuerySet.as_manager()
 
     id = models.UUIDField( # uuid ( for example,  3010dp5141c-7b58-4e24-94ad-f1b9oisndh12 )
         primary_key=True, 
@@ -97,6 +358,23 @@ class NotificationBase(models.Model):
         _("Notification"),
         max_length=30
     )
+    pending_statuses = models.PositiveIntegerField( # amount of not complited statuses ( see NotificationBaseQuerySet.refresh_counters )
+        _("Pending"),
+        default=0
+    )
+    completed_statuses = models.PositiveIntegerField( # amount of complited statuses
+        _("Completed"),
+        default=0
+    )
+    revoked_statuses = models.PositiveIntegerField( # amount of revoked statuses
+        _("Revoked"),
+        default=0
+    )
+    next_fire_at = models.DateTimeField( # the time of the nearest not complited status
+        _("Next notification at"),
+        blank=True,
+        null=True
+    )
 
     def __str__(self):
         created_date = self.created_time.date()
@@ -107,11 +385,9 @@ class NotificationBase(models.Model):
             return f'Periodic notification, создал {self.user} в {created_date} {created_time}'
 
     def check_all_notifications_are_complited(self):
-        # checking all complited notification statuses
-        if self.notification_type == 'Single':
-            return self.notification_single.notification_status.done == 1
-        elif self.notification_type == 'Periodic':
-            return (self.notification_periodic.notification_status.filter(done=1).count() == self.notification_periodic.notification_status.all().count())
+        # checking all complited notification statuses and that nothing is left to schedule, the same as finished()
+        periodic = getattr(self, 'notification_periodic', None) if self.notification_type == 'Periodic' else None
+        return self.pending_statuses == 0 and self.revoked_statuses == 0 and not (periodic and periodic.next_occurrence_at is not None)
 
 
 class NotificationPeriodicity(UrlBase):
@@ -157,18 +433,61 @@ class NotificationPeriodicity(UrlBase):
         related_name='notification_periodic',
         verbose_name=_("Notification type")
     )
-    dates = ArrayField( # all picked notification dates ( year-month-date ) ["2023-05-14", "2024-10-18"]
-        models.CharField(max_length=30),
-        verbose_name=_("Dates"),
+    recurrence = models.CharField( # recurrence rule ( see recurrence.py ), empty if the notification fires on its picked dates
+        _("Recurrence rule"),
+        max_length=300,
+        blank=True,
+        default='',
+        validators=[validate_recurrence],
+    )
+    recurrence_start = models.DateField( # the first date the recurrence rule may fire on
+        _("Recurrence start"),
+        null=True,
+        blank=True,
+    )
+    next_occurrence_at = models.DateTimeField( # the first execution time which has no status yet, None if there is nothing left to schedule
+        _("Next occurrence"),
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    lang_code = models.CharField( # the language the occurrences materialized later will be sent in
+        _("Language"),
+        max_length=10,
+        default=settings.LANGUAGE_CODE
+    )
+    tz = models.CharField( # the timezone the dates and the recurrence rule are in, the occurrences materialized later keep the wall clock time of the user
+        _("Timezone"),
+        max_length=100,
+        default=settings.TIME_ZONE
     )
 
     class Meta:
         verbose_name = 'Notification periodic'
         verbose_name_plural = 'Notifications periodic'
+        indexes = [
+            GinIndex(get_search_vector(), name='notification_periodic_search'),
+        ]
 
     def __str__(self):
         return f'Periodic - `{self.title.capitalize()}`'
 
+    def get_dates(self):
+        '''Getting all picked notification dates in order'''
+        return list(self.occurrences.values_list('date', flat=True))
+
+    def set_dates(self, dates):
+        '''
+            Input: dates -> picked notification dates ( date objects )
+            Output: True if the dates have changed
+            Replaces the dates of the notification, only the removed and the added dates are written, whatever the amount of dates is
+        '''
+        dates, old_dates = set(dates), set(self.get_dates())
+        if old_dates - dates:
+            self.occurrences.filter(date__in=old_dates - dates).delete()
+        NotificationPeriodicDate.objects.bulk_create([NotificationPeriodicDate(notification_periodic=self, date=date) for date in sorted(dates - old_dates)])
+        return dates != old_dates
+
     def get_only_not_complited(self):
         '''Getting amount of all the incomplited statuses of an notification'''
         return self.notification_status.filter(done=0).count()
@@ -192,6 +511,30 @@ class NotificationPeriodicity(UrlBase):
     def get_url_path(self):
         return reverse_lazy("notifications:detail_periodic_notification", kwargs={"pk": self.pk})
 
+class NotificationPeriodicDate(models.Model):
+    # One picked date of a periodic notification, so "which notifications fire on this date" is an index lookup
+    notification_periodic = models.ForeignKey( # connection with the periodic notification
+        NotificationPeriodicity,
+        on_delete=models.CASCADE,
+        related_name='occurrences',
+        verbose_name=_("Periodic notification")
+    )
+    date = models.DateField( # the notification execution date (year, month, day)
+        _("Date"),
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Notification periodic date'
+        verbose_name_plural = 'Notification periodic dates'
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['notification_periodic', 'date'], name='notification_periodic_date_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.notification_periodic} - {self.date}'
+
 class NotificationSingle(UrlBase):
     # The single notification model
     id = models.UUIDField( # uuid ( for example, 3010dp5141c-7b58-4e24-94ad-f1b9oisndh1344 )
@@ -240,56 +583,12 @@ class NotificationSingle(UrlBase):
     class Meta:
         verbose_name = 'Notification single'
         verbose_name_plural = 'Notifications single'
+        indexes = [
+            GinIndex(get_search_vector(), name='notification_single_search'),
+        ]
 
     def __str__(self):
         return f'Single - `{self.title.capitalize()}`'
 
     def get_url_path(self):
         return reverse_lazy("notifications:detail_single_notification", kwargs={"pk": self.pk})
-
-def create_task(instance, time):
-    '''
-        Input: instance -> notification model (single or periodic), time -> notification execution time
-    '''
-    timezone_now = timezone.now().strptime(timezone.now().strftime('%Y-%m-%d %H:%M:%S'), '%Y-%m-%d %H:%M:%S') # time - now
-    timezone_now = timezone.localtime(timezone.make_aware(timezone_now))
-    if type(instance) == NotificationSingle:
-        difference_seconds = (time - timezone_now).total_seconds() # the difference in seconds between the time of a single notification and now
-        task = create_notification_task.apply_async(args=(instance.id, get_language()), eta=timezone_now + timedelta(seconds=difference_seconds)) # creating celery task, which will be executed via difference_seconds ( eta argument )
-
-        model = NotificationId.objects.create(notification_id=task.id) # creating task model
-        instance.notification_type_single.task_id.add(model) # adding task to the general model
-        
-        notif_status = NotificationStatus.objects.get(id=instance.notification_status.id) #search for a status model by id
-        notif_status.notification_celery_id = model
-        notif_status.save() # save status model 
-
-    elif type(instance) == NotificationPeriodicity:
-        notif_status = NotificationStatus.objects.create(time_stamp=time) # creating a notification status model with the time_stamp argument - the notification execution time
-        task = create_periodic_notification_task.apply_async(args=(instance.id, notif_status.id, get_language()), eta=time) #  creating celery task, which will be executed in argument time 
-        instance.notification_status.add(notif_status) # adding this status to the model
-
-        model = NotificationId.objects.create(notification_id=task.id) # creating task model
-        instance.notification_type_periodicity.task_id.add(model) # adding task to the general model
-        notif_status.notification_celery_id = model 
-        notif_status.save() # save status model 
-
-@receiver(post_save, sender=NotificationSingle)
-def post_created_single(sender, instance, **kwargs):
-    '''After saving a single notification, the post_save method is executed, receiving its model as an argument'''
-    notification_date = instance.notification_date
-    notification_time = instance.notification_time
-    two_times = str(notification_date) + ' ' + str(notification_time)
-    two_times = datetime.strptime(two_times, '%Y-%m-%d %H:%M:%S') # save time in readable format
-    two_times = timezone.localtime(timezone.make_aware(two_times), timezone=pytz.timezone(str(timezone.get_current_timezone())))
-    create_task(instance, two_times)
-
-@receiver(post_save, sender=NotificationPeriodicity)
-def post_created_periodic(sender, instance, **kwargs):
-    '''After saving a periodic notification, the post_save method is executed, receiving its model as an argument'''
-    model = NotificationPeriodicity.objects.get(id=instance.id) # get periodic model
-    for date in range(len(model.dates)):
-        time = model.dates[date] + ' ' + f'{model.notification_periodic_time}'
-        time = timezone.make_aware(datetime.strptime(time, '%Y-%m-%d %H:%M:%S'))
-        time = timezone.localtime(time, timezone=pytz.timezone(str(timezone.get_current_timezone())))
-        create_task(instance, time)
\ No newline at end of file
@@ -1,21 +1,31 @@
 from datetime import datetime, timedelta
 
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
-from django.utils.translation import get_language
 
 from rest_framework import generics, status
 from rest_framework.decorators import APIView
 from rest_framework import permissions
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 
 from notification_categories.models import NotificationCategory
-from config.celery import app
 
 from ..models import NotificationBase, NotificationSingle, NotificationPeriodicity, NotificationStatus, NotificationId
-from ..tasks import create_periodic_notification_task
+from ..scheduling import (
+    delete_tasks,
+    reschedule_periodic_notification,
+    reschedule_single_notification,
+    restore_periodic_status,
+    revoke_periodic_notification,
+    schedule_periodic_notification,
+    schedule_single_notification,
+)
+from .pagination import NotificationCursorPagination, NotificationSearchPagination
 from .serializers import (
     NotificationListSerializer, 
     NotificationPeriodicListSerializer, 
@@ -25,66 +35,84 @@ from .serializers import (
 )
 
 
-class NotificationListApiView(generics.ListAPIView):
+def serialize_notifications(notifications):
+    '''
+        Input: notifications -> NotificationBase queryset annotated by with_status()
+        Output: two dicts ( single and periodic ) of serialized notifications keyed by their id
+    '''
+    single_notifications_data = {}
+    periodic_notifications_data = {}
+    for notification in notifications:
+        if notification.notification_type == 'Single':
+            notification_single_serializer = NotificationSingleSerializer([notification.notification_single], many=True)
+            single_id = notification_single_serializer.data[0]["id"]
+            single_notifications_data[single_id] = notification_single_serializer.data
+        elif notification.notification_type == 'Periodic':
+            notification_periodic_serializer = NotificationPeriodicListSerializer([notification.notification_periodic], many=True)
+            periodic_id = notification_periodic_serializer.data[0]["id"]
+            periodic_notifications_data[periodic_id] = notification_periodic_serializer.data
+    return single_notifications_data, periodic_notifications_data
+
+class NotificationListMixin:
+    '''
+        Common part of the notification list apis: cursor pagination and filters by `category` ( category id ) and `type` ( single or periodic )
+    '''
     model = NotificationBase
     serializer_class = NotificationListSerializer
+    pagination_class = NotificationCursorPagination
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [SessionAuthentication, BasicAuthentication]
-
+    notification_types = {'single': 'Single', 'periodic': 'Periodic'}
+
+    def filter_queryset(self, queryset):
+        notification_type = self.request.query_params.get('type')
+        category = self.request.query_params.get('category')
+        if notification_type:
+            if notification_type.lower() not in self.notification_types:
+                raise ValidationError({'type': _('Type should be `single` or `periodic`')})
+            queryset = queryset.filter(notification_type=self.notification_types[notification_type.lower()])
+        if category:
+            if not category.isdigit():
+                raise ValidationError({'category': _('Category should be a category id')})
+            queryset = queryset.filter(Q(notification_single__notification_category=category) | Q(notification_periodic__notification_category=category))
+        return queryset
+
+    def get_paginated_data(self, single_key, periodic_key):
+        '''Output: links to the next and previous pages and the current page notifications ( single and periodic ) serialized by serialize_notifications'''
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        data = {
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
+        }
+        data[single_key], data[periodic_key] = serialize_notifications(page)
+        return data
+
+class NotificationListApiView(NotificationListMixin, generics.ListAPIView):
     def get_queryset(self):
-        return self.model.objects.filter(user=self.request.user)
+        return self.model.objects.filter(user=self.request.user).active()
 
     def list(self, request, *args, **kwargs):
-        data = {}
-        single_notifications_data = {}
-        periodic_notifications_data = {}
-        for notification in self.get_queryset():
-            if notification.check_all_notifications_are_complited() == False:
-                if notification.notification_type == 'Single':
-                    notification_single_query = NotificationSingle.objects.filter(notification_type_single=notification)
-                    notification_single_serializer = NotificationSingleSerializer(notification_single_query, many=True)
-                    for model in notification_single_serializer.data:
-                        single_id = dict(model)["id"]
-                    single_notifications_data[single_id] = notification_single_serializer.data
-                elif notification.notification_type == 'Periodic':
-                    notification_periodic_query = NotificationPeriodicity.objects.filter(notification_type_periodicity=notification)
-                    notification_periodic_serializer = NotificationPeriodicListSerializer(notification_periodic_query, many=True)
-                    for model in notification_periodic_serializer.data:
-                        periodic_id = dict(model)["id"]
-                    periodic_notifications_data[periodic_id] = notification_periodic_serializer.data
-        data['notifications_single'] = single_notifications_data
-        data['notifications_periodic'] = periodic_notifications_data
+        data = self.get_paginated_data('notifications_single', 'notifications_periodic')
         return Response(data, status=status.HTTP_200_OK)
     
-class NotificationFinishedListApiView(generics.ListAPIView):
-    model = NotificationBase
-    serializer_class = NotificationListSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [SessionAuthentication, BasicAuthentication]
+class NotificationFinishedListApiView(NotificationListMixin, generics.ListAPIView):
+    def get_queryset(self):
+        return self.model.objects.filter(user=self.request.user).finished()
+
+    def list(self, request, *args, **kwargs):
+        data = self.get_paginated_data('finished_notifications_single', 'finished_notifications_periodic')
+        return Response(data, status=status.HTTP_200_OK)
+
+class NotificationSearchApiView(NotificationListMixin, generics.ListAPIView):
+    '''Not finished notifications matching the `q` query parameter, the most relevant first'''
+    pagination_class = NotificationSearchPagination
 
     def get_queryset(self):
-        return self.model.objects.filter(user=self.request.user)
+        return self.model.objects.filter(user=self.request.user).search(self.request.query_params.get('q', '')).active()
 
     def list(self, request, *args, **kwargs):
-        data = {}
-        single_finished_notifications_data = {}
-        periodic_finished_notifications_data = {}
-        for notification in self.get_queryset():
-            if notification.check_all_notifications_are_complited() == True:
-                if notification.notification_type == 'Single':
-                    notification_single_query = NotificationSingle.objects.filter(notification_type_single=notification)
-                    notification_single_serializer = NotificationSingleSerializer(notification_single_query, many=True)
-                    for model in notification_single_serializer.data:
-                        single_id = dict(model)["id"]
-                    single_finished_notifications_data[single_id] = notification_single_serializer.data
-                elif notification.notification_type == 'Periodic':
-                    notification_periodic_query = NotificationPeriodicity.objects.filter(notification_type_periodicity=notification)
-                    notification_periodic_serializer = NotificationPeriodicListSerializer(notification_periodic_query, many=True)
-                    for model in notification_periodic_serializer.data:
-                        periodic_id = dict(model)["id"]
-                    periodic_finished_notifications_data[periodic_id] = notification_periodic_serializer.data
-        data['finished_notifications_single'] = single_finished_notifications_data
-        data['finished_notifications_periodic'] = periodic_finished_notifications_data
+        data = self.get_paginated_data('notifications_single', 'notifications_periodic')
+        data['count'] = self.paginator.page.paginator.count
         return Response(data, status=status.HTTP_200_OK)
     
 class NotificationSingleDetailApiView(generics.RetrieveAPIView):
@@ -114,6 +142,7 @@ class NotificationSingleCreateApiView(generics.CreateAPIView):
     def get_queryset(self):
         return self.queryset.filter(notification_type_single__user=self.request.user)
             
+    @transaction.atomic # the notification and its scheduled status are committed together
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         if serializer.is_valid(raise_exception=True):
@@ -128,7 +157,7 @@ class NotificationSingleCreateApiView(generics.CreateAPIView):
                 user=self.request.user,
                 notification_type='Single'
             )
-            self.queryset.create(
+            notification_single = self.queryset.create(
                 notification_category=NotificationCategory.objects.get(id=serializer.data['notification_category']),
                 title=serializer.data['title'],
                 text=serializer.data['text'],
@@ -137,6 +166,7 @@ class NotificationSingleCreateApiView(generics.CreateAPIView):
                 notification_status=notif_status,
                 notification_type_single=notif_base
             )
+            schedule_single_notification(notification_single)
             return Response(status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -154,28 +184,19 @@ class NotificationSingleEditApiView(generics.UpdateAPIView):
         context["request"] = self.request
         return context
 
+    @transaction.atomic
     def put(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         if NotificationSingle.objects.get(id=kwargs.get('pk')).notification_type_single.user == self.request.user:
             if serializer.is_valid(raise_exception=True):
-                res = self.queryset.get(pk=self.kwargs['pk'])
-                time = str(serializer.data['notification_date']) + ' ' + str(serializer.data['notification_time'])
-                time = datetime.strptime(time, '%Y-%m-%d %H:%M:%S')
-                time = timezone.localtime(timezone.make_aware(time))
-
-                NotificationStatus.objects.get(id=res.notification_status.id).delete()
-                
-                task = res.notification_status.notification_celery_id
-                app.control.revoke(str(task), terminate=True, signal='SIGKILL')
-                NotificationId.objects.get(notification_id=task).delete()
-                
+                res = self.queryset.select_related('notification_status').get(pk=self.kwargs['pk'])
                 res.notification_category = NotificationCategory.objects.get(id=serializer.data['notification_category'])
                 res.title = serializer.data['title']
                 res.text = serializer.data['text']
                 res.notification_time = serializer.data['notification_time']
                 res.notification_date = serializer.data['notification_date']
-                res.notification_status = NotificationStatus.objects.create(time_stamp=time)
                 res.save()
+                reschedule_single_notification(res) # a change of the title or the text needs no rescheduling
                 return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -195,7 +216,6 @@ class NotificationSingleDeleteApiView(generics.DestroyAPIView):
 
             task = notification_single.notification_status.notification_celery_id.notification_id
 
-            app.control.revoke(str(task), terminate=True, signal='SIGKILL')
             NotificationId.objects.get(notification_id=task).delete()
             notification_base.delete()
 
@@ -226,6 +246,7 @@ class NotificationPeriodicCreateApiView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [SessionAuthentication, BasicAuthentication]
 
+    @transaction.atomic # the notification and its scheduled statuses are committed together
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         if serializer.is_valid(raise_exception=True):
@@ -240,26 +261,36 @@ class NotificationPeriodicCreateApiView(generics.CreateAPIView):
                 for _ in range(amount_of_dates):
                     current_date = current_date + timedelta(days=1)
                     dates.append(current_date)
-                self.queryset.create(
+                notification_periodic = self.queryset.create(
                     notification_category=NotificationCategory.objects.get(id=serializer.data['notification_category']),
                     title=serializer.data['title'],
                     text=serializer.data['text'],
                     notification_periodicity_num=serializer.data['notification_periodicity_num'],
                     notification_periodic_time=serializer.data['notification_periodic_time'],
-                    dates=dates,
                     notification_type_periodicity=notif_base
                 )
             elif serializer.data['dates_type'] == 'Your own dates':
-                dates = serializer.data['dates'].split(',')
-                dates = sorted(dates, key=lambda x: datetime.strptime(x, '%Y-%m-%d'))
-                self.queryset.create(
+                dates = serializer.validated_data['dates']
+                notification_periodic = self.queryset.create(
                     notification_category=NotificationCategory.objects.get(id=serializer.data['notification_category']),
                     title=serializer.data['title'],
                     text=serializer.data['text'],
                     notification_periodic_time=serializer.data['notification_periodic_time'],
-                    dates=dates,
                     notification_type_periodicity=notif_base
                 )
+            elif serializer.data['dates_type'] == 'Recurrence rule':
+                dates = []
+                notification_periodic = self.queryset.create(
+                    notification_category=NotificationCategory.objects.get(id=serializer.data['notification_category']),
+                    title=serializer.data['title'],
+                    text=serializer.data['text'],
+                    notification_periodic_time=serializer.data['notification_periodic_time'],
+                    recurrence=serializer.data['recurrence'],
+                    recurrence_start=current_date,
+                    notification_type_periodicity=notif_base
+                )
+            notification_periodic.set_dates(dates)
+            schedule_periodic_notification(notification_periodic)
             return Response(status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -272,17 +303,12 @@ class NotificationPeriodicEditApiView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [SessionAuthentication, BasicAuthentication]
 
+    @transaction.atomic
     def put(self, request, *args, **kwargs):
         if NotificationPeriodicity.objects.get(id=kwargs.get('pk')).notification_type_periodicity.user == self.request.user:
             serializer = self.serializer_class(data=request.data, context={'request': request})
             if serializer.is_valid(raise_exception=True):
                 res = NotificationPeriodicity.objects.get(id=kwargs.get('pk'))
-                for notification_status in res.notification_status.all():
-                    NotificationStatus.objects.get(id=notification_status.id).delete()
-
-                for task in res.notification_type_periodicity.task_id.all():
-                    app.control.revoke(str(task), terminate=True, signal='SIGKILL')
-                    NotificationId.objects.get(notification_id=task).delete()
 
                 current_date = timezone.localtime(timezone.now()).date()                    
                 if serializer.data['dates_type'] == 'Every day':
@@ -290,17 +316,22 @@ class NotificationPeriodicEditApiView(generics.UpdateAPIView):
                     for _ in range(serializer.data['notification_periodicity_num']):
                         current_date = current_date + timedelta(days=1)
                         dates.append(current_date)
-                    res.dates = dates
                 elif serializer.data['dates_type'] == 'Your own dates':
-                    dates = serializer.data['dates'].split(',')
-                    dates = sorted(dates, key=lambda x: datetime.strptime(x, '%Y-%m-%d'))
-                    res.dates = dates
+                    dates = serializer.validated_data['dates']
+                elif serializer.data['dates_type'] == 'Recurrence rule':
+                    dates = []
+                if not serializer.validated_data['recurrence']:
+                    res.recurrence_start = None
+                elif serializer.validated_data['recurrence'] != res.recurrence or res.recurrence_start is None: # a new rule starts today
+                    res.recurrence_start = timezone.localtime(timezone.now()).date()
+                res.recurrence = serializer.validated_data['recurrence']
                 res.notification_category = NotificationCategory.objects.get(id=serializer.data['notification_category'])
                 res.title = serializer.data['title']
                 res.text = serializer.data['text']
                 res.notification_periodicity_num = serializer.data['notification_periodicity_num']
                 res.notification_periodic_time = serializer.data['notification_periodic_time']
                 res.save()
+                reschedule_periodic_notification(res, dates) # only the changed occurrences are rescheduled
                 return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -320,14 +351,7 @@ class NotificationPeriodicDeleteApiView(generics.DestroyAPIView):
         notification_periodic = NotificationPeriodicity.objects.get(id=kwargs.get('pk'))
         if notification_periodic.notification_type_periodicity.user == self.request.user:
             notification_base = NotificationBase.objects.get(notification_periodic=notification_periodic)
-
-            for notification_status in notification_periodic.notification_status.all():
-                NotificationStatus.objects.get(id=notification_status.id).delete()
-
-            for task in notification_periodic.notification_type_periodicity.task_id.all():
-                app.control.revoke(str(task), terminate=True, signal='SIGKILL')
-                NotificationId.objects.get(notification_id=task).delete()
-
+            delete_tasks(notification_base)
             notification_base.delete()
 
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -363,10 +387,7 @@ class NotificationPeriodicRevokeCertainTimeStampApiView(generics.DestroyAPIView)
 
     def delete(self, request, *args, **kwargs):
         notification_status = get_object_or_404(self.queryset, id=self.kwargs['pk'])
-        notification_status.done = 2
-        notification_status.save()
-        task = notification_status.notification_celery_id.notification_id
-        app.control.revoke(str(task), terminate=True, signal='SIGKILL')
+        self.queryset.objects.filter(id=notification_status.id).revoke()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class NotificationPeriodicRevokeAllTimeStampsApiView(generics.DestroyAPIView):
@@ -376,12 +397,7 @@ class NotificationPeriodicRevokeAllTimeStampsApiView(generics.DestroyAPIView):
     authentication_classes = [SessionAuthentication, BasicAuthentication]
 
     def delete(self, request, *args, **kwargs):
-        notif_statuses = get_object_or_404(self.queryset, id=self.kwargs['pk']).notification_status.filter(done=0)
-        for notification_status in notif_statuses:
-            notification_status.done = 2
-            notification_status.save()
-            task = notification_status.notification_celery_id.notification_id
-            app.control.revoke(str(task), terminate=True, signal='SIGKILL')
+        revoke_periodic_notification(get_object_or_404(self.queryset, id=self.kwargs['pk']))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class ChangeNotificationStatusFromRevokeToIncompleteApi(APIView):
@@ -392,13 +408,9 @@ class ChangeNotificationStatusFromRevokeToIncompleteApi(APIView):
     def post(self, request, *args, **kwargs):
         notification_status = get_object_or_404(self.model, id=kwargs['pk'])
         notification_periodic_model = NotificationPeriodicity.objects.get(notification_status=notification_status)
-        notification_celery_id = NotificationId.objects.get(notification_id=notification_status.notification_celery_id.notification_id)
         if notification_periodic_model.notification_type_periodicity.user == request.user:
             if notification_status.time_stamp > timezone.localtime(timezone.now()):
-                notification_status.done = 0 # incomplited
-                notification_status.save()
-                task = create_periodic_notification_task.apply_async(args=(notification_periodic_model.id, notification_status.id, get_language()), eta=notification_status.time_stamp)
-                notification_celery_id.notification_id = task
-                notification_celery_id.save()
+                with transaction.atomic():
+                    restore_periodic_status(notification_periodic_model, notification_status)
             return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class NotificationCursorPagination(CursorPagination):
+    # keyset pagination over the creation time, so every page costs the same regardless of the history size
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_time', 'id')
+
+class NotificationSearchPagination(PageNumberPagination):
+    # search results are ordered by rank, which a cursor cannot point to, so the pages are numbered
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
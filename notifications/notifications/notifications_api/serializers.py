@@ -7,6 +7,7 @@ from rest_framework import serializers
 
 from notification_categories.models import NotificationCategory
 from ..models import NotificationBase, NotificationSingle, NotificationPeriodicity, NotificationStatus
+from ..recurrence import validate_recurrence
 from .fields import NotificationCategoryFilteredPrimaryKeyRelatedField
 
 def timezone_today_date():
@@ -43,7 +44,8 @@ class NotificationPeriodicSerializer(serializers.Serializer):
     notification_periodicity_num = serializers.IntegerField(initial=1, max_value=15, min_value=1)
     notification_periodic_time = serializers.TimeField(default=timezone.localtime(timezone.now()))
     dates = serializers.CharField(required=False, style={'base_template': 'input.html'}, initial='', help_text=_("Enter dates in appropriate format (yyyy-mm-dd), for example, 2023-08-15,2023-12-15 without any spaces!!!!!!!!"))
-    dates_type = serializers.ChoiceField(choices=['Every day', 'Your own dates'])
+    recurrence = serializers.CharField(required=False, allow_blank=True, max_length=300, validators=[validate_recurrence], help_text=_("Recurrence rule, for example, FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10 ( every monday and wednesday, 10 times )"))
+    dates_type = serializers.ChoiceField(choices=['Every day', 'Your own dates', 'Recurrence rule'])
 
     def validate(self, attrs):
         if attrs['dates_type'] == 'Every day':
@@ -52,8 +54,8 @@ class NotificationPeriodicSerializer(serializers.Serializer):
         if attrs['dates_type'] == 'Your own dates':
             if not attrs.get('dates'):
                 raise serializers.ValidationError(_("If you`ve chosen `your own dates`, please enter your dates in the field `dates`"))
-            user_dates = attrs['dates'].split(',')
-            for date in user_dates:
+            user_dates = []
+            for date in attrs['dates'].split(','):
                 try:
                     date = datetime.strptime(date, "%Y-%m-%d")
                 except ValueError:
@@ -64,11 +66,19 @@ class NotificationPeriodicSerializer(serializers.Serializer):
 
                 if date.date() <= datetime.now().date():
                     raise serializers.ValidationError(_(f'This date {date.date()} should be in the future (not in the past and present =/ ) =3'))
+                user_dates.append(date.date())
+            attrs['dates'] = user_dates # parsed once, the views get date objects
+        if attrs['dates_type'] == 'Recurrence rule':
+            if not attrs.get('recurrence'):
+                raise serializers.ValidationError(_("If you`ve chosen `recurrence rule`, please enter the rule in the field `recurrence`"))
+        else:
+            attrs['recurrence'] = ''
 
         return super().validate(attrs)
 
 class NotificationPeriodicListSerializer(serializers.ModelSerializer):
     notification_category = NotificationCategoryFilteredPrimaryKeyRelatedField(queryset=NotificationCategory.objects.all())
+    dates = serializers.SlugRelatedField(source='occurrences', slug_field='date', many=True, read_only=True)
 
     class Meta:
         model = NotificationPeriodicity
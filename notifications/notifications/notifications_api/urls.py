@@ -3,6 +3,7 @@ from django.urls import path
 from .api_views import (
     NotificationListApiView,
     NotificationFinishedListApiView,
+    NotificationSearchApiView,
 
     NotificationSingleDetailApiView, 
     NotificationSingleCreateApiView, 
@@ -26,6 +27,7 @@ app_name = "notifications_api"
 urlpatterns = [
     path('notifications_list/', NotificationListApiView.as_view(), name='notifications_list_api'),
     path('finished_notifications_list/', NotificationFinishedListApiView.as_view(), name='finished_notifications_list_api'),
+    path('search/', NotificationSearchApiView.as_view(), name='search_notifications_api'),
 
     path('create_notification_single/', NotificationSingleCreateApiView.as_view(), name='create_notification_single_api'),
     path('edit_notification_single/<uuid:pk>/', NotificationSingleEditApiView.as_view(), name='edit_notification_single_api'),
@@ -0,0 +1,94 @@
+import logging
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Token buckets in redis, shared by all the workers: a channel ( NOTIFICATIONS_RATE_LIMITS ) and every recipient of it
+# ( NOTIFICATIONS_RECIPIENT_RATE_LIMITS, e.g. a telegram chat ) get `rate` messages per second with bursts of `capacity` messages.
+# A message takes its token in advance even if the bucket is empty, the bucket goes below zero and the message waits until its token is refilled,
+# so the messages of all the workers queue up at the rate of the provider instead of being answered 429 Too Many Requests
+
+# KEYS -> the buckets of a message, ARGV -> rate and capacity of every bucket, output: seconds the message has to wait ( as a string, lua numbers are returned as integers )
+TAKE_TOKEN_SCRIPT = '''
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate, capacity = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate) - 1
+    redis.call('HSET', key, 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', key, math.ceil((capacity - tokens) / rate) + 1)
+    if tokens < 0 then
+        wait = math.max(wait, -tokens / rate)
+    end
+end
+return tostring(wait)
+'''
+
+def get_buckets(channel, recipient=None):
+    '''Output: list of ( redis key, limit ) of the buckets a message to the recipient takes a token from'''
+    buckets = []
+    if channel in settings.NOTIFICATIONS_RATE_LIMITS:
+        buckets.append((f'rate_limit:{channel}', settings.NOTIFICATIONS_RATE_LIMITS[channel]))
+    if recipient is not None and channel in settings.NOTIFICATIONS_RECIPIENT_RATE_LIMITS:
+        buckets.append((f'rate_limit:{channel}:{recipient}', settings.NOTIFICATIONS_RECIPIENT_RATE_LIMITS[channel]))
+    return buckets
+
+def get_throttled_keys(channel):
+    return f'rate_limit:{channel}:throttled', f'rate_limit:{channel}:throttled_seconds'
+
+def take_tokens(channel, recipients):
+    '''
+        Input: channel -> social network name, recipients -> the recipient of every message ( a telegram chat id ) or None
+        Output: list of seconds every message has to wait before it is sent, with one round trip to redis for the whole batch
+
+        Without redis the messages are not limited ( zero waits ), the provider answers 429 then and the senders handle it
+    '''
+    buckets = [get_buckets(channel, recipient) for recipient in recipients]
+    if not any(buckets):
+        return [0] * len(recipients)
+    try:
+        connection = get_redis_connection('default')
+        take_token = connection.register_script(TAKE_TOKEN_SCRIPT)
+        pipeline = connection.pipeline(transaction=False)
+        for message_buckets in buckets:
+            take_token(
+                keys=[key for key, _ in message_buckets],
+                args=[value for _, limit in message_buckets for value in (limit['rate'], limit['capacity'])],
+                client=pipeline
+            )
+        waits = [float(wait) for wait in pipeline.execute()]
+    except RedisError:
+        logger.warning(f'The {channel} rate limit is not applied, redis is unreachable', exc_info=True)
+        return [0] * len(recipients)
+    record_throttled(connection, channel, [wait for wait in waits if wait > 0])
+    return waits
+
+def record_throttled(connection, channel, waits):
+    '''Counting the throttled messages of the channel and the seconds they waited'''
+    if not waits:
+        return
+    throttled_key, throttled_seconds_key = get_throttled_keys(channel)
+    try:
+        connection.pipeline(transaction=False).incr(throttled_key, len(waits)).incrbyfloat(throttled_seconds_key, sum(waits)).execute()
+    except RedisError:
+        pass
+    logger.info(f'{len(waits)} {channel} message(-s) throttled for {sum(waits):.2f} seconds in total, {max(waits):.2f} seconds at most')
+
+def get_throttled_metrics(channels):
+    '''Output: dict channel -> ( amount of throttled messages, seconds they waited in total ) since the metrics were reset'''
+    connection = get_redis_connection('default')
+    values = connection.mget([key for channel in channels for key in get_throttled_keys(channel)])
+    return {
+        channel: (int(values[i * 2] or 0), float(values[i * 2 + 1] or 0))
+        for i, channel in enumerate(channels)
+    }
+
+def reset_throttled_metrics(channels):
+    get_redis_connection('default').delete(*[key for channel in channels for key in get_throttled_keys(channel)])
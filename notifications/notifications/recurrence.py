@@ -0,0 +1,47 @@
+import re
+import zoneinfo
+from datetime import datetime
+
+from dateutil.rrule import rrulestr
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+# A recurrence rule is an RRULE ( RFC 5545 ) without DTSTART, for example "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10" or "FREQ=MONTHLY;UNTIL=20261231",
+# it starts on `recurrence_start` of the periodic notification and fires at its `notification_periodic_time`.
+# The occurrences are not stored: scheduling expands them only up to the scheduling horizon ( see scheduling.py )
+
+RECURRENCE_FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY') # more frequent rules would flood the user
+
+def get_recurrence(rule, start):
+    '''
+        Input: rule -> recurrence rule, start -> naive local datetime of the first possible occurrence
+        Output: dateutil rrule, ValueError if the rule is invalid
+    '''
+    return rrulestr(rule, dtstart=start)
+
+def validate_recurrence(rule):
+    frequency = re.search(r'FREQ=(\w+)', rule.upper())
+    if not frequency or frequency.group(1) not in RECURRENCE_FREQUENCIES or 'DTSTART' in rule.upper():
+        raise ValidationError(_("Enter a daily, weekly, monthly or yearly recurrence rule, for example, FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10"))
+    try:
+        get_recurrence(rule, datetime.now())
+    except (ValueError, TypeError):
+        raise ValidationError(_("ENTER THE RECURRENCE RULE IN APPROPRIATE FORMAT"))
+
+def expand_recurrence(notification, start, until):
+    '''
+        Input: notification -> periodic notification with a recurrence rule, start / until -> aware datetimes
+        Output: ( aware execution times of the notification from start to until inclusive, the first execution time after until or None )
+
+        The rule is expanded in the wall clock of the stored timezone of the notification, not of the active one ( the beat task runs in UTC ),
+        so the notification keeps its time across daylight saving changes
+    '''
+    tz = zoneinfo.ZoneInfo(notification.tz)
+    recurrence = get_recurrence(
+        notification.recurrence,
+        datetime.combine(notification.recurrence_start, notification.notification_periodic_time.replace(microsecond=0))
+    )
+    times = recurrence.between(timezone.make_naive(start, tz), timezone.make_naive(until, tz), inc=True)
+    next_time = recurrence.after(timezone.make_naive(until, tz))
+    return [timezone.make_aware(time, tz) for time in times], next_time and timezone.make_aware(next_time, tz)
@@ -0,0 +1,74 @@
+from collections import defaultdict
+from functools import lru_cache
+
+from django.template.loader import get_template
+from django.utils import translation
+from django.utils.translation import gettext as _
+
+EMAIL_TEMPLATES = {
+    'single': 'auth/email/notifications/email_new_single_notification.html',
+    'periodic': 'auth/email/notifications/email_new_periodic_notification.html',
+}
+
+@lru_cache(maxsize=None)
+def get_notification_template(lang_code, template_name):
+    '''The compiled template for ( language, template ), so rendering a message never goes through the template loaders'''
+    with translation.override(lang_code):
+        return get_template(template_name)
+
+@lru_cache(maxsize=None)
+def get_telegram_labels(lang_code):
+    '''Translated parts of a telegram message, computed once per language'''
+    with translation.override(lang_code):
+        return {
+            'welcome': _("👋 Hi, you have received a new notification!"),
+            'category': _("Category"),
+            'title': _("Title"),
+            'text': _("Text"),
+            'time': _("Time"),
+        }
+
+@lru_cache(maxsize=None)
+def get_email_subject(lang_code):
+    with translation.override(lang_code):
+        return _('New notification')
+
+def render_telegram_message(delivery):
+    labels = get_telegram_labels(delivery.lang_code)
+    return (
+        f"{labels['welcome']}\n"
+        f"{labels['category']}: {delivery.notification.notification_category.name_type}\n"
+        f"{labels['title']}: {delivery.notification.title}\n"
+        f"{labels['text']}: {delivery.notification.text}\n"
+        f"{labels['time']}: {delivery.time}\n"
+    )
+
+def render_telegram_messages(deliveries):
+    return [render_telegram_message(delivery) for delivery in deliveries]
+
+def render_emails(deliveries):
+    '''
+        Input: deliveries -> list of send_notifications.Delivery
+        Output: list of ( subject, html body ) in the order of the deliveries
+
+        The batch is rendered in one pass per language, so the translation is activated once per language instead of once per message
+    '''
+    indexes_by_language = defaultdict(list)
+    for i, delivery in enumerate(deliveries):
+        indexes_by_language[delivery.lang_code].append(i)
+
+    rendered = [None] * len(deliveries)
+    for lang_code, indexes in indexes_by_language.items():
+        subject = get_email_subject(lang_code)
+        with translation.override(lang_code):
+            for i in indexes:
+                delivery = deliveries[i]
+                template = get_notification_template(lang_code, EMAIL_TEMPLATES[delivery.model])
+                body = template.render({
+                    'user': delivery.user,
+                    'notification': delivery.notification,
+                    'time': delivery.time,
+                    'time_stamp': delivery.time,
+                })
+                rendered[i] = (subject, body)
+    return rendered
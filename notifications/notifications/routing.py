@@ -0,0 +1,16 @@
+from django.conf import settings
+
+# Every channel is sent by its own celery queue ( NOTIFICATIONS_CHANNEL_QUEUES ), so a slow smtp server does not hold up telegram deliveries,
+# the rest of the tasks ( dispatching batches, materializing occurrences, admin triggers ) go to the scheduling queue, see CELERY_TASK_ROUTES
+
+CHANNEL_TASKS = (
+    'notifications.tasks.send_channel_deliveries_task',
+    'notifications.tasks.retry_deliveries_task',
+)
+
+def route_channel_task(name, args, kwargs, options, task=None, **kw):
+    '''A celery router: the tasks sending through a channel go to the queue of the channel ( their first argument )'''
+    if name in CHANNEL_TASKS:
+        channel = args[0] if args else kwargs['channel']
+        return {'queue': settings.NOTIFICATIONS_CHANNEL_QUEUES.get(channel, settings.CELERY_TASK_DEFAULT_QUEUE)}
+    return None
@@ -0,0 +1,282 @@
+import uuid
+import zoneinfo
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.translation import get_language
+
+from .models import (
+    NotificationBase,
+    NotificationDeadLetter,
+    NotificationDelivery,
+    NotificationId,
+    NotificationPeriodicDate,
+    NotificationPeriodicity,
+    NotificationSingle,
+    NotificationStatus,
+)
+from .recurrence import expand_recurrence
+
+# Scheduling writes not complited statuses ( the outbox ) in the transaction of the notification itself,
+# the dispatcher ( see dispatcher.py ) relays the committed ones to celery in batches when they are due.
+# Call the schedule_* functions inside `transaction.atomic()` right after creating a notification or changing its time.
+# Periodic notifications get statuses only up to the scheduling horizon, materialize_occurrences ( a celery beat task ) moves it forward,
+# so the database and the broker hold a bounded working set however far the dates and the recurrence rules go
+
+def get_notification_time(notification_date, notification_time):
+    '''
+        Input: notification_date -> date or "2023-05-14", notification_time -> time or "09:00:00"
+        Output: aware notification execution time in the current timezone
+    '''
+    if isinstance(notification_date, str):
+        notification_date = parse_date(notification_date)
+    if isinstance(notification_time, str):
+        notification_time = parse_time(notification_time)
+    return timezone.localtime(timezone.make_aware(datetime.combine(notification_date, notification_time.replace(microsecond=0))))
+
+def create_task(instance, time):
+    '''
+        Input: instance -> notification model (single or periodic), time -> notification execution time
+        Sets up a not complited status with the execution time, the dispatcher hands it to celery when the time comes
+    '''
+    model = NotificationId.objects.create(notification_id=str(uuid.uuid4())) # creating task model, the dispatcher publishes the celery task with this id
+    lang_code = get_language() or settings.LANGUAGE_CODE
+    if type(instance) == NotificationSingle:
+        instance.notification_type_single.task_id.add(model) # adding task to the general model
+
+        notif_status = NotificationStatus.objects.get(id=instance.notification_status.id) #search for a status model by id
+        notif_status.time_stamp = time
+        notif_status.notification_celery_id = model
+        notif_status.lang_code = lang_code
+        notif_status.dispatched_at = None
+        notif_status.save() # save status model
+        NotificationBase.objects.filter(id=instance.notification_type_single_id).refresh_counters()
+
+    elif type(instance) == NotificationPeriodicity:
+        create_periodic_tasks(instance, [time])
+
+def create_periodic_tasks(instance, times):
+    '''
+        Input: instance -> periodic notification model, times -> all the notification execution times
+        Sets up a not complited status for every execution time with a constant number of queries, whatever the amount of dates is
+    '''
+    instance.lang_code = get_language() or settings.LANGUAGE_CODE
+    create_periodic_tasks_in_bulk([(instance, times)])
+
+def create_periodic_tasks_in_bulk(notifications_times):
+    '''
+        Input: notifications_times -> list of ( periodic notification model, its new notification execution times )
+        Sets up not complited statuses in the language of every notification with a constant number of queries, whatever the amount of notifications is
+    '''
+    occurrences = [(notification, time) for notification, times in notifications_times for time in times]
+    task_models = NotificationId.objects.bulk_create([NotificationId(notification_id=str(uuid.uuid4())) for _ in occurrences]) # postgres returns the ids of the created rows
+    notif_statuses = NotificationStatus.objects.bulk_create([
+        NotificationStatus(time_stamp=time, notification_celery_id=model, lang_code=notification.lang_code)
+        for (notification, time), model in zip(occurrences, task_models)
+    ])
+    NotificationPeriodicity.notification_status.through.objects.bulk_create([ # adding the statuses to the models
+        NotificationPeriodicity.notification_status.through(notificationperiodicity_id=notification.id, notificationstatus_id=notif_status.id)
+        for (notification, _), notif_status in zip(occurrences, notif_statuses)
+    ])
+    NotificationBase.task_id.through.objects.bulk_create([ # adding the tasks to the general models
+        NotificationBase.task_id.through(notificationbase_id=notification.notification_type_periodicity_id, notificationid_id=model.id)
+        for (notification, _), model in zip(occurrences, task_models)
+    ])
+    NotificationBase.objects.filter(
+        id__in=[notification.notification_type_periodicity_id for notification, _ in notifications_times]
+    ).refresh_counters()
+
+def delete_tasks(notification_base):
+    '''Deleting all the tasks of a notification together with their statuses, instead of deleting them one by one'''
+    NotificationId.objects.filter(notificationbase=notification_base).delete() # the statuses are deleted by cascade
+
+def schedule_single_notification(notification):
+    '''Scheduling a single notification at its date and time'''
+    create_task(notification, get_notification_time(notification.notification_date, notification.notification_time))
+
+def reschedule_single_notification(notification):
+    '''
+        Rescheduling an edited ( and saved ) single notification, output: True if its time has changed
+        Its status is moved in place and only if the time has changed: the delivery reads the title and the text when sending.
+        A sent status is sent again at the new time, so its deliveries are removed from the delivery ledger ( and the dead letters )
+    '''
+    time = get_notification_time(notification.notification_date, notification.notification_time)
+    notif_status = notification.notification_status
+    if notif_status.time_stamp == time:
+        return False
+    if notif_status.done == NotificationStatus.Status.COMPLITED:
+        NotificationDelivery.objects.filter(notification_status=notif_status).delete()
+        NotificationDeadLetter.objects.filter(notification_status=notif_status).delete()
+    notif_status.time_stamp = time
+    notif_status.done = NotificationStatus.Status.NOT_COMPLITED
+    notif_status.dispatched_at = None # if it is in celery already, the delivery skips it until the new time ( see send_notifications.load_deliveries )
+    notif_status.lang_code = get_language() or settings.LANGUAGE_CODE
+    notif_status.save(update_fields=['time_stamp', 'done', 'dispatched_at', 'lang_code'])
+    NotificationBase.objects.filter(id=notification.notification_type_single_id).refresh_counters()
+    return True
+
+def get_scheduling_horizon(now=None):
+    '''Output: the time up to which the occurrences of periodic notifications are materialized as statuses'''
+    return (now or timezone.now()) + timedelta(hours=settings.NOTIFICATIONS_SCHEDULING_HORIZON)
+
+def get_occurrence_times(notification, dates, start, until):
+    '''
+        Input: notification -> periodic notification, dates -> its picked dates in order ( recurring notifications have none ),
+            start / until -> aware datetimes, start is None to take all the dates up to until
+        Output: ( execution times of the notification from start to until inclusive, the first execution time after until or None )
+    '''
+    if notification.recurrence:
+        return expand_recurrence(notification, start, until)
+    with timezone.override(notification.tz): # the beat task runs in the default timezone, not in the one of the user
+        times = [get_notification_time(notification_date, notification.notification_periodic_time) for notification_date in dates]
+    return (
+        [time for time in times if (start is None or time >= start) and time <= until],
+        next((time for time in times if time > until), None)
+    )
+
+def get_periodic_dates(notifications):
+    '''
+        Input: notifications -> periodic notifications which are materialized from their next_occurrence_at
+        Output: dict notification id -> its picked dates from the date of the next occurrence, read with one query
+    '''
+    dates = defaultdict(list)
+    notifications = [notification for notification in notifications if not notification.recurrence]
+    if notifications:
+        occurrences = NotificationPeriodicDate.objects.filter(
+            notification_periodic__in=notifications,
+            date__gte=min(timezone.localtime(notification.next_occurrence_at, zoneinfo.ZoneInfo(notification.tz)).date() for notification in notifications),
+        )
+        for notification_periodic_id, notification_date in occurrences.values_list('notification_periodic_id', 'date'):
+            dates[notification_periodic_id].append(notification_date)
+    return dates
+
+def materialize_periodic_notifications(notifications, dates, until):
+    '''
+        Input: notifications -> periodic notifications, dates -> dict notification id -> picked dates in order, until -> aware datetime
+        Output: the amount of created statuses
+
+        Sets up statuses for the occurrences of every notification from its next_occurrence_at to until and remembers the next one,
+        the queries do not depend on the amount of notifications and occurrences
+    '''
+    notifications_times = []
+    for notification in notifications:
+        times, notification.next_occurrence_at = get_occurrence_times(notification, dates.get(notification.id, []), notification.next_occurrence_at, until)
+        notifications_times.append((notification, times))
+    create_periodic_tasks_in_bulk(notifications_times)
+    NotificationPeriodicity.objects.bulk_update(notifications, ['next_occurrence_at', 'lang_code', 'tz'])
+    return sum(len(times) for _, times in notifications_times)
+
+def schedule_periodic_notification(notification):
+    '''
+        Scheduling a periodic notification at its time on every one of its dates or on the occurrences of its recurrence rule,
+        only the ones within the horizon get statuses now
+    '''
+    now = timezone.now()
+    notification.lang_code = get_language() or settings.LANGUAGE_CODE # later occurrences are sent in the language of the user who scheduled them
+    notification.tz = timezone.get_current_timezone_name() # and at the wall clock time of the timezone they were scheduled in
+    notification.next_occurrence_at = now if notification.recurrence else None # the picked dates are taken from the first one
+    dates = {} if notification.recurrence else {notification.id: notification.get_dates()}
+    materialize_periodic_notifications([notification], dates, get_scheduling_horizon(now))
+
+def reschedule_periodic_notification(notification, dates):
+    '''
+        Input: notification -> edited ( and saved ) periodic notification, dates -> its picked dates ( empty for a recurrence rule )
+        Output: the amount of created, moved and deleted statuses
+
+        Applies an edit as a diff: a change of the title or the text touches no statuses, not complited statuses whose time is not scheduled anymore
+        are moved to the new times, the rest of them are deleted and the rest of the new times get new statuses, all in bulk.
+        Complited and revoked statuses are kept and their dates are not scheduled again, so editing the time does not repeat a sent reminder.
+        Call it inside `transaction.atomic()` together with saving the notification
+    '''
+    notification.set_dates(dates)
+    now = timezone.now()
+    stored = (notification.next_occurrence_at, notification.lang_code, notification.tz)
+    notification.tz = timezone.get_current_timezone_name() # the edit is made in the timezone of the user, the occurrences are recomputed in it
+    times, next_occurrence_at = get_occurrence_times(notification, sorted(set(dates)), now if notification.recurrence else None, get_scheduling_horizon(now))
+    statuses = list(notification.notification_status.all())
+    tz = zoneinfo.ZoneInfo(notification.tz)
+    handled_dates = { # the dates which have been sent or revoked already
+        timezone.localtime(notif_status.time_stamp, tz).date() for notif_status in statuses
+        if notif_status.done != NotificationStatus.Status.NOT_COMPLITED
+    }
+    times = [time for time in times if timezone.localtime(time, tz).date() not in handled_dates]
+    scheduled_times, kept_times = {notif_status.time_stamp for notif_status in statuses}, set(times)
+    new_times = [time for time in times if time not in scheduled_times]
+    stale_statuses = [
+        notif_status for notif_status in statuses
+        if notif_status.done == NotificationStatus.Status.NOT_COMPLITED and notif_status.time_stamp not in kept_times
+    ]
+
+    lang_code = get_language() or settings.LANGUAGE_CODE
+    moved_statuses = [notif_status for notif_status in stale_statuses if notif_status.dispatched_at is None][:len(new_times)] # the dispatched ones are in celery already
+    for notif_status, time in zip(moved_statuses, new_times):
+        notif_status.time_stamp, notif_status.lang_code = time, lang_code
+    if moved_statuses:
+        NotificationStatus.objects.bulk_update(moved_statuses, ['time_stamp', 'lang_code'])
+    deleted_statuses = [notif_status for notif_status in stale_statuses if notif_status not in moved_statuses]
+    if deleted_statuses:
+        NotificationId.objects.filter(notificationstatus__in=deleted_statuses).delete() # the statuses are deleted by cascade
+
+    notification.next_occurrence_at, notification.lang_code = next_occurrence_at, lang_code
+    if (notification.next_occurrence_at, notification.lang_code, notification.tz) != stored:
+        NotificationPeriodicity.objects.filter(id=notification.id).update(
+            next_occurrence_at=notification.next_occurrence_at, lang_code=notification.lang_code, tz=notification.tz
+        )
+    created_times = new_times[len(moved_statuses):]
+    if created_times:
+        create_periodic_tasks_in_bulk([(notification, created_times)]) # the status counters are refreshed there
+    elif moved_statuses or deleted_statuses:
+        NotificationBase.objects.filter(id=notification.notification_type_periodicity_id).refresh_counters()
+    return len(new_times) + len(deleted_statuses)
+
+def materialize_occurrences(now=None, batch_size=None):
+    '''
+        Input: now -> aware datetime ( timezone.now() by default ), batch_size -> the amount of notifications materialized in one transaction
+        Output: the amount of created statuses
+
+        Materializes the occurrences of periodic notifications which come within the horizon,
+        notifications locked by a concurrent run are skipped ( SELECT ... FOR UPDATE SKIP LOCKED ), the next run picks them up
+    '''
+    batch_size = batch_size or settings.NOTIFICATIONS_MATERIALIZE_BATCH_SIZE
+    until = get_scheduling_horizon(now)
+    created = 0
+    while True:
+        with transaction.atomic():
+            notifications = list(
+                NotificationPeriodicity.objects.filter(next_occurrence_at__lte=until)
+                .order_by('next_occurrence_at').select_for_update(skip_locked=True)[:batch_size]
+            )
+            if notifications:
+                created += materialize_periodic_notifications(notifications, get_periodic_dates(notifications), until)
+        if len(notifications) < batch_size:
+            return created
+
+def revoke_periodic_notification(notification):
+    '''Revoking all the not complited statuses of a periodic notification and stopping the materialization of its next occurrences'''
+    notification.notification_status.revoke()
+    notification.next_occurrence_at = None
+    NotificationPeriodicity.objects.filter(id=notification.id).update(next_occurrence_at=None)
+
+def restore_periodic_status(notification, notif_status):
+    '''
+        Restoring a revoked status of a periodic notification under a new task id, output: the amount of statuses created after it
+        If revoking has stopped the materialization ( see revoke_periodic_notification ), it goes on from the last status of the notification
+    '''
+    notif_status.done = NotificationStatus.Status.NOT_COMPLITED
+    notif_status.dispatched_at = None # the dispatcher hands it to celery again when the time comes
+    notif_status.lang_code = get_language() or settings.LANGUAGE_CODE
+    notif_status.save(update_fields=['done', 'dispatched_at', 'lang_code'])
+    NotificationId.objects.filter(id=notif_status.notification_celery_id_id).update(notification_id=str(uuid.uuid4())) # a new task id for the restored notification
+    if notification.next_occurrence_at is None:
+        last_time = notification.notification_status.aggregate(last_time=Max('time_stamp'))['last_time']
+        dates = [] if notification.recurrence else notification.get_dates()
+        _, notification.next_occurrence_at = get_occurrence_times(notification, dates, last_time, last_time)
+        if notification.next_occurrence_at is not None:
+            return materialize_periodic_notifications([notification], {notification.id: dates}, get_scheduling_horizon()) # the status counters are refreshed there
+    NotificationBase.objects.filter(id=notification.notification_type_periodicity_id).refresh_counters()
+    return 0
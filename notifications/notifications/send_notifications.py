@@ -1,75 +1,358 @@
+import logging
 import pytz
+import random
+import smtplib
+import time
+from collections import defaultdict, namedtuple
 from datetime import datetime
-import requests
 
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
-from django.utils.translation import gettext as _
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
 from django.conf import settings
 from django.utils import timezone
-from django.utils.translation import activate, deactivate
 
-def telegram(instance_id, lang_code, model, notification_status_id=None):
-    from .models import NotificationSingle, NotificationPeriodicity   
+from . import rate_limits, rendering, telegram_client
+
+logger = logging.getLogger(__name__)
+
+# everything the senders need to send one notification occurrence, loaded up front
+# model -> 'single' or 'periodic', time -> formatted notification execution time
+Delivery = namedtuple('Delivery', ['notification', 'model', 'user', 'time', 'lang_code', 'notification_status_id'])
+
+def format_single_time(notification_single):
+    return (datetime.combine(notification_single.notification_date, notification_single.notification_time)).strftime('%B %d, %Y %H:%M:%S %p')
+
+def format_periodic_time(time_stamp, user):
+    time_stamp = timezone.localtime(time_stamp, timezone=pytz.timezone(user.tz))
+    return time_stamp.strftime('%B %d, %Y %H:%M:%S %p')
+
+def get_delivery(instance_id, lang_code, model, notification_status_id=None):
+    '''Loading a single delivery for the old one-notification-per-task senders'''
+    from .models import NotificationSingle, NotificationPeriodicity
     if model == 'single':
-        notification_single = NotificationSingle.objects.get(id=instance_id)
-        time = (datetime.combine(notification_single.notification_date, notification_single.notification_time)).strftime('%B %d, %Y %H:%M:%S %p')
-        user = NotificationSingle.objects.get(id=instance_id).notification_type_single.user
-        activate(lang_code)
-        welcome = _(f"👋 Hi, you have received a new notification!")
-        category = str(_("Category")) + ": " + notification_single.notification_category.name_type
-        title = str(_("Title"))+ ": " + notification_single.title
-        text = str(_("Text"))+ ": " + notification_single.text
-        time_str = str(_("Time"))+ ": " + str(time)
-        deactivate()
-        message = welcome + '\n' + category + '\n' + title + '\n' + text + '\n' + time_str + '\n'
-        return requests.post(url=settings.TELEGRAM_API_SENDING_MESSAGE, data={'chat_id': user.users_telegram.chat_id, 'text': message})
+        notification = NotificationSingle.objects.select_related('notification_category', 'notification_type_single__user__users_telegram').get(id=instance_id)
+        user = notification.notification_type_single.user
+        return Delivery(notification, model, user, format_single_time(notification), lang_code, notification.notification_status_id)
     elif model == 'periodic':
-        user = NotificationPeriodicity.objects.get(id=instance_id).notification_type_periodicity.user
-        notification_periodicity = NotificationPeriodicity.objects.get(id=instance_id)
-
-        time_stamp = notification_periodicity.notification_status.get(id=notification_status_id).time_stamp
-        time_stamp = timezone.localtime(time_stamp, timezone=pytz.timezone(user.tz))
-        time_stamp = time_stamp.strftime('%B %d, %Y %H:%M:%S %p')
-        
-        welcome = _(f"👋 Hi, you have received a new notification!")
-        category = str(_("Category")) + ": " + notification_periodicity.notification_category.name_type
-        title = str(_("Title"))+ ": " + notification_periodicity.title
-        text = str(_("Text"))+ ": " + notification_periodicity.text
-        time_stamp_str = str(_("Time"))+ ": " + str(time_stamp)
-        message = welcome + '\n' + category + '\n' + title + '\n' + text + '\n' + time_stamp_str + '\n'
-        return requests.post(url=settings.TELEGRAM_API_SENDING_MESSAGE, data={'chat_id': user.users_telegram.chat_id, 'text': message})
+        notification = NotificationPeriodicity.objects.select_related('notification_category', 'notification_type_periodicity__user__users_telegram').get(id=instance_id)
+        user = notification.notification_type_periodicity.user
+        time_stamp = notification.notification_status.get(id=notification_status_id).time_stamp
+        return Delivery(notification, model, user, format_periodic_time(time_stamp, user), lang_code, notification_status_id)
+
+def load_deliveries(notification_status_ids, only_due=False, hand_off=None):
+    '''
+        Input: notification_status_ids -> ids of the statuses which should be sent,
+            only_due -> skip the statuses whose time has not come ( an edit moved them after they were dispatched, the dispatcher hands them over again ),
+            hand_off -> called with the deliveries before the statuses are committed as complited, if it raises they stay not complited
+        Output: list of deliveries of the not complited statuses, which are marked as complited
+
+        The statuses, notifications, users, categories and social networks are loaded in a constant number of queries,
+        so the deliveries always have the current title and text of the notifications
+    '''
+    from .models import NotificationStatus
+    with transaction.atomic():
+        notification_statuses = NotificationStatus.objects.select_for_update(of=('self',)).filter(id__in=notification_status_ids, done=NotificationStatus.Status.NOT_COMPLITED)
+        if only_due:
+            notification_statuses = notification_statuses.filter(time_stamp__lte=timezone.now())
+        notification_statuses = {notification_status.id: notification_status for notification_status in notification_statuses}
+        NotificationStatus.objects.filter(id__in=notification_statuses.keys()).update(done=NotificationStatus.Status.COMPLITED)
+        NotificationStatus.objects.filter(id__in=notification_statuses.keys()).notifications().refresh_counters()
+        deliveries = get_deliveries(notification_statuses)
+        if hand_off and deliveries:
+            hand_off(deliveries)
+    return deliveries
+
+def deliver_notifications(notification_status_ids):
+    '''
+        Input: notification_status_ids -> ids of dispatched statuses ( see dispatcher.py )
+        Output: the amount of deliveries handed to the queues of their social networks
+
+        The channel tasks are published before the statuses are committed as complited, like the dispatcher publishes the delivery tasks.
+        If publishing fails the statuses stay not complited and are released, so the dispatcher hands them over again
+    '''
+    from .models import NotificationStatus
+    try:
+        return len(load_deliveries(notification_status_ids, only_due=True, hand_off=queue_deliveries))
+    except Exception:
+        NotificationStatus.objects.filter(id__in=notification_status_ids, done=NotificationStatus.Status.NOT_COMPLITED).update(dispatched_at=None)
+        raise
+
+def send_notifications_now(notification_status_ids, lang_code):
+    '''
+        Input: notification_status_ids -> ids of not complited statuses, lang_code -> the language they are sent in
+        Output: the amount of deliveries handed to the queues of their social networks
+
+        The statuses are sent at once whatever their time is ( the "send now" buttons of the staff ), through the queues of the social networks like the dispatched ones
+    '''
+    from .models import NotificationStatus
+    with transaction.atomic():
+        NotificationStatus.objects.filter(id__in=notification_status_ids, done=NotificationStatus.Status.NOT_COMPLITED).update(lang_code=lang_code)
+        return len(load_deliveries(notification_status_ids, hand_off=queue_deliveries))
+
+def get_deliveries(notification_statuses):
+    '''
+        Input: notification_statuses -> dict status id -> status
+        Output: list of deliveries of the statuses, loaded in a constant number of queries
+    '''
+    from .models import NotificationSingle, NotificationPeriodicity
+    deliveries = []
+    singles = (
+        NotificationSingle.objects.filter(notification_status__in=notification_statuses.keys())
+        .select_related('notification_category', 'notification_type_single__user__users_telegram')
+    )
+    for notification in singles:
+        notification_status = notification_statuses[notification.notification_status_id]
+        user = notification.notification_type_single.user
+        deliveries.append(Delivery(notification, 'single', user, format_single_time(notification), notification_status.lang_code, notification_status.id))
+
+    periodic_statuses = (
+        NotificationPeriodicity.notification_status.through.objects.filter(notificationstatus__in=notification_statuses.keys())
+        .select_related('notificationperiodicity__notification_category', 'notificationperiodicity__notification_type_periodicity__user__users_telegram')
+    )
+    for periodic_status in periodic_statuses:
+        notification_status = notification_statuses[periodic_status.notificationstatus_id]
+        notification = periodic_status.notificationperiodicity
+        user = notification.notification_type_periodicity.user
+        deliveries.append(Delivery(notification, 'periodic', user, format_periodic_time(notification_status.time_stamp, user), notification_status.lang_code, notification_status.id))
+    return deliveries
+
+class DeliveryError(Exception):
+    # a failed delivery, a permanent one ( the chat does not exist, the user blocked the bot ) is not retried,
+    # retry_after -> seconds the provider asked to wait before the retry
+    def __init__(self, message, permanent=False, retry_after=None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.retry_after = retry_after
+
+TELEGRAM_PERMANENT_STATUS_CODES = (400, 403)
+
+def get_telegram_error(response):
+    '''Output: DeliveryError of a failed telegram request ( an exception or an error response ) or None'''
+    if isinstance(response, Exception):
+        return DeliveryError(f'Telegram request failed: {response!r}')
+    if response.is_error:
+        return DeliveryError(
+            f'Telegram answered {response.status_code}: {response.text[:200]}',
+            permanent=response.status_code in TELEGRAM_PERMANENT_STATUS_CODES,
+            retry_after=telegram_client.get_retry_after(response)
+        )
+    return None
+
+def get_telegram_messages(deliveries):
+    '''Output: list of ( chat_id, text ) of the deliveries'''
+    texts = rendering.render_telegram_messages(deliveries)
+    return [(delivery.user.users_telegram.chat_id, text) for delivery, text in zip(deliveries, texts)]
+
+def send_telegram_messages(deliveries):
+    '''
+        Sending a batch of telegram messages concurrently over pooled connections
+        Output: list of errors ( None for a sent message ) in the order of the deliveries
+    '''
+    messages = get_telegram_messages(deliveries)
+    waits = rate_limits.take_tokens('telegram', [chat_id for chat_id, _ in messages])
+    return [get_telegram_error(response) for response in telegram_client.send_messages(messages, waits=waits)]
+
+def email_message(delivery, subject, body):
+    msg = EmailMessage(subject, body, to=[delivery.user.email])
+    msg.content_subtype = "html"
+    return msg
+
+def send_email_message(connection, message):
+    if not connection.send_messages([message]): # the smtp backend returns 0 instead of raising if it could not connect
+        raise smtplib.SMTPException('The message was not sent')
+
+def send_email_messages(messages, waits=None):
+    '''
+        Sending messages over one smtp connection instead of a new ssl session per message,
+        if the connection breaks it is opened again and the failed message is sent once more
+        Input: waits -> seconds every message waits before it is sent ( see rate_limits.take_tokens )
+        Output: list of errors ( None for a sent message ) in the order of the messages
+    '''
+    connection = get_connection()
+    errors = []
+    started = time.monotonic()
+    try:
+        connection.open()
+        for message, wait in zip(messages, waits or [0] * len(messages)):
+            time.sleep(max(0, started + wait - time.monotonic()))
+            try:
+                send_email_message(connection, message)
+            except (smtplib.SMTPException, OSError):
+                try:
+                    connection.close()
+                    connection.open()
+                    send_email_message(connection, message)
+                except (smtplib.SMTPException, OSError) as error:
+                    errors.append(DeliveryError(f'Email was not sent: {error!r}', permanent=isinstance(error, smtplib.SMTPRecipientsRefused)))
+                    continue
+            errors.append(None)
+    except (smtplib.SMTPException, OSError) as error: # the smtp server can not be reached at all
+        errors.extend([DeliveryError(f'Email was not sent: {error!r}')] * (len(messages) - len(errors)))
+    finally:
+        connection.close()
+    return errors
+
+def send_emails(deliveries):
+    '''
+        Sending a batch of emails, NOTIFICATIONS_EMAIL_MESSAGES_PER_CONNECTION messages per smtp connection at most
+        Output: list of errors ( None for a sent email ) in the order of the deliveries
+    '''
+    messages = [email_message(delivery, subject, body) for delivery, (subject, body) in zip(deliveries, rendering.render_emails(deliveries))]
+    messages_per_connection = settings.NOTIFICATIONS_EMAIL_MESSAGES_PER_CONNECTION
+    errors = []
+    for i in range(0, len(messages), messages_per_connection):
+        waits = rate_limits.take_tokens('email', [None] * len(messages[i:i + messages_per_connection])) # the tokens are taken right before the connection sends them
+        errors.extend(send_email_messages(messages[i:i + messages_per_connection], waits))
+    return errors
+
+# the channel registry: social network name ( ChooseSendingNotifications.sender ) -> the function sending a batch of deliveries through it,
+# it returns the error of every delivery ( None if it was sent ) and does not raise because of a single failed delivery
+SENDERS = {
+    'telegram': send_telegram_messages,
+    'email': send_emails,
+}
+
+def get_retry_delay(channel, attempt):
+    '''
+        Input: channel -> social network name, attempt -> the number of the failed attempt
+        Output: seconds before the next attempt, the backoff of the channel doubled every attempt ( up to its backoff_max ),
+            half of it is random, so the retries of a failed batch do not hit the provider all at once
+    '''
+    policy = settings.NOTIFICATIONS_RETRY_POLICIES[channel]
+    delay = min(policy['backoff_max'], policy['backoff'] * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def handle_failed_deliveries(channel, failed, attempt):
+    '''
+        Input: channel -> social network name, failed -> list of ( delivery, error ), attempt -> the number of the failed attempt
+        The deliveries are retried by a celery task with a countdown, so no worker waits for the provider,
+        the ones which failed permanently or ran out of the attempts of the channel become dead letters
+    '''
+    from .models import NotificationDeadLetter
+    from .tasks import retry_deliveries_task
+    max_attempts = settings.NOTIFICATIONS_RETRY_POLICIES[channel]['max_attempts']
+    retried = [(delivery, error) for delivery, error in failed if attempt < max_attempts and not getattr(error, 'permanent', False)]
+    retried_ids = {delivery.notification_status_id for delivery, _ in retried}
+    dead = [(delivery, error) for delivery, error in failed if delivery.notification_status_id not in retried_ids]
+    if retried:
+        retry_deliveries_task.apply_async(
+            (channel, [str(delivery.notification_status_id) for delivery, _ in retried], attempt + 1),
+            countdown=max([get_retry_delay(channel, attempt)] + [getattr(error, 'retry_after', None) or 0 for _, error in retried]) # not before the provider allows
+        )
+    if dead:
+        NotificationDeadLetter.objects.bulk_create([
+            NotificationDeadLetter(notification_status_id=delivery.notification_status_id, channel=channel, attempts=attempt, error=str(error))
+            for delivery, error in dead
+        ], ignore_conflicts=True)
+    logger.warning(f'{len(failed)} {channel} delivery(-ies) failed on attempt {attempt}: {len(retried)} will be retried, {len(dead)} dead letter(-s)')
+
+def send_channel_deliveries(channel, deliveries, attempt=1):
+    '''
+        Sending a batch of claimed deliveries through a channel, output: the amount of sent deliveries
+        A failed delivery does not stop the others, it is retried or becomes a dead letter ( see handle_failed_deliveries )
+    '''
+    if not deliveries:
+        return 0
+    try:
+        errors = SENDERS[channel](deliveries)
+    except Exception as error: # the whole batch failed, for example, the rendering
+        logger.exception(f'Sending a batch of {len(deliveries)} {channel} delivery(-ies) failed')
+        errors = [DeliveryError(f'The batch was not sent: {error!r}')] * len(deliveries)
+    return handle_send_errors(channel, deliveries, errors, attempt)
+
+def handle_send_errors(channel, deliveries, errors, attempt=1):
+    '''
+        Input: errors -> the error of every delivery ( None if it was sent ) returned by the sender of the channel
+        Output: the amount of sent deliveries, the failed ones are retried or become dead letters
+    '''
+    failed = [(delivery, error) for delivery, error in zip(deliveries, errors) if error is not None]
+    if failed:
+        handle_failed_deliveries(channel, failed, attempt)
+    return len(deliveries) - len(failed)
+
+def claim_deliveries(channel, deliveries):
+    '''Output: the deliveries which are not in the delivery ledger of the channel yet, they are added to it'''
+    from .models import NotificationDelivery
+    claimed = NotificationDelivery.objects.claim(channel, [delivery.notification_status_id for delivery in deliveries])
+    return [delivery for delivery in deliveries if delivery.notification_status_id in claimed]
+
+def claim_and_send(channel, deliveries):
+    '''Sending the deliveries which are not in the delivery ledger of the channel yet, output: the amount of sent deliveries'''
+    return send_channel_deliveries(channel, claim_deliveries(channel, deliveries))
+
+def group_by_network(deliveries):
+    '''Output: dict social network name -> the deliveries to send through it, the active and attached social networks of the users come from the per-user channel cache'''
+    from authentication.channels import get_users_channels
+    users_channels = get_users_channels([delivery.user.id for delivery in deliveries])
+    deliveries_by_network = defaultdict(list)
+    for delivery in deliveries:
+        for network in users_channels[delivery.user.id]:
+            if network in SENDERS:
+                deliveries_by_network[network].append(delivery)
+    return deliveries_by_network
+
+def send_deliveries(deliveries):
+    '''
+        Sending every delivery through all the active and attached social networks of its user, one batch per social network.
+        Every batch is claimed in the delivery ledger first, the deliveries sent through the social network already are skipped
+    '''
+    for network, network_deliveries in group_by_network(deliveries).items():
+        claim_and_send(network, network_deliveries)
+
+def queue_deliveries(deliveries):
+    '''Handing the deliveries to the celery queues of their social networks ( see routing.py ), one task per social network'''
+    from .tasks import send_channel_deliveries_task
+    for network, network_deliveries in group_by_network(deliveries).items():
+        send_channel_deliveries_task.delay(network, [str(delivery.notification_status_id) for delivery in network_deliveries])
+
+def send_channel_deliveries_by_ids(channel, notification_status_ids):
+    '''
+        Input: channel -> social network name, notification_status_ids -> ids of the complited statuses queued for the channel ( see queue_deliveries )
+        Output: the amount of sent deliveries
+    '''
+    from .models import NotificationStatus
+    with transaction.atomic(): # the task may start before the delivery task which queued it commits, the lock waits for that commit
+        notification_statuses = [
+            notification_status for notification_status in NotificationStatus.objects.select_for_update().filter(id__in=notification_status_ids)
+            if notification_status.done == NotificationStatus.Status.COMPLITED # checked after the lock, a filter would see the statuses before the commit
+        ]
+    return claim_and_send(channel, get_deliveries({notification_status.id: notification_status for notification_status in notification_statuses}))
+
+def retry_deliveries(channel, notification_status_ids, attempt):
+    '''
+        Input: channel -> social network name, notification_status_ids -> ids of the failed statuses, attempt -> the number of this attempt
+        Output: the amount of sent deliveries, the ones retried by another task already are skipped
+    '''
+    from .models import NotificationDelivery, NotificationStatus
+    claimed = NotificationDelivery.objects.claim_retry(channel, notification_status_ids, attempt)
+    notification_statuses = NotificationStatus.objects.filter(id__in=claimed, done=NotificationStatus.Status.COMPLITED)
+    deliveries = get_deliveries({notification_status.id: notification_status for notification_status in notification_statuses})
+    return send_channel_deliveries(channel, deliveries, attempt)
+
+def replay_dead_letters(channel=None, limit=None):
+    '''
+        Input: channel -> replay only the dead letters of this social network, limit -> the maximum amount of replayed dead letters
+        Output: the amount of replayed dead letters, they are sent again by retry tasks with all the attempts of their channel
+    '''
+    from .models import NotificationDeadLetter, NotificationDelivery
+    from .tasks import retry_deliveries_task
+    with transaction.atomic():
+        dead_letters = NotificationDeadLetter.objects.select_for_update(skip_locked=True)
+        if channel:
+            dead_letters = dead_letters.filter(channel=channel)
+        notification_status_ids = defaultdict(list)
+        for dead_letter in dead_letters[:limit]:
+            notification_status_ids[dead_letter.channel].append(dead_letter.notification_status_id)
+        for dead_letter_channel, ids in notification_status_ids.items():
+            NotificationDeadLetter.objects.filter(channel=dead_letter_channel, notification_status__in=ids).delete()
+            NotificationDelivery.objects.filter(channel=dead_letter_channel, notification_status__in=ids).update(attempts=0)
+            transaction.on_commit(
+                lambda dead_letter_channel=dead_letter_channel, ids=ids: retry_deliveries_task.delay(dead_letter_channel, [str(i) for i in ids], 1)
+            )
+    return sum(len(ids) for ids in notification_status_ids.values())
+
+def telegram(instance_id, lang_code, model, notification_status_id=None):
+    return claim_and_send('telegram', [get_delivery(instance_id, lang_code, model, notification_status_id)])
 
 def email(instance_id, lang_code, model, notification_status_id=None):
-    from .models import NotificationSingle, NotificationPeriodicity   
-    if model == 'single':
-        notification = NotificationSingle.objects.get(id=instance_id)
-        user = NotificationSingle.objects.get(id=instance_id).notification_type_single.user
-        email = user.email
-        time = (datetime.combine(notification.notification_date, notification.notification_time)).strftime('%B %d, %Y %H:%M:%S %p')
-        verificate_message = render_to_string('auth/email/notifications/email_new_single_notification.html', {
-                                                                                    'user': user,
-                                                                                    'notification': notification,
-                                                                                    'time': time
-                                                                                    })
-        msg = EmailMessage(_('New notification'), verificate_message, to=[email])
-        msg.content_subtype = "html"
-        msg.send()
-    elif model == 'periodic':
-        notification_periodicity = NotificationPeriodicity.objects.get(id=instance_id)
-        user = notification_periodicity.notification_type_periodicity.user
-
-        time_stamp = notification_periodicity.notification_status.get(id=notification_status_id).time_stamp
-        time_stamp = timezone.localtime(time_stamp, timezone=pytz.timezone(user.tz))
-        time_stamp = time_stamp.strftime('%B %d, %Y %H:%M:%S %p')
-
-        user = NotificationPeriodicity.objects.get(id=instance_id).notification_type_periodicity.user
-        email = user.email
-        verificate_message = render_to_string('auth/email/notifications/email_new_periodic_notification.html', {
-                                                                                    'user': user,
-                                                                                    'notification': notification,
-                                                                                    'time_stamp': time_stamp,
-                                                                                    })
-        msg = EmailMessage(_('New notification'), verificate_message, to=[email])
-        msg.content_subtype = "html"
-        msg.send()
\ No newline at end of file
+    return claim_and_send('email', [get_delivery(instance_id, lang_code, model, notification_status_id)])
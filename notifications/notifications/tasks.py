@@ -3,39 +3,42 @@ from celery.utils.log import get_task_logger
 
 logger = get_task_logger(__name__)
 
+@shared_task(acks_late=True, reject_on_worker_lost=True) # the task is acknowledged after it has run, the broker hands it to another worker if this one dies
+def deliver_notifications_task(notification_status_ids):
+   '''Sending a batch of due notification statuses ( see dispatcher.py )'''
+   from .send_notifications import deliver_notifications
+   logger.info(f'Queued {deliver_notifications(notification_status_ids)} of {len(notification_status_ids)} notification(-s)')
+
 @shared_task()
-def create_notification_task(instance_id, lang_code): 
-   from .models import NotificationSingle, NotificationStatus
-   notification_single = NotificationSingle.objects.get(id=instance_id)
-   notif_status_id = notification_single.notification_status.id
-   notification_status = NotificationStatus.objects.get(id=notif_status_id)
+def send_channel_deliveries_task(channel, notification_status_ids):
+   '''Sending a batch of deliveries through one social network, the task runs in the queue of the social network ( see routing.py )'''
+   from .send_notifications import send_channel_deliveries_by_ids
+   sent = send_channel_deliveries_by_ids(channel, notification_status_ids)
+   logger.info(f'Sent {sent} of {len(notification_status_ids)} {channel} delivery(-ies)')
 
-   if notification_status.done == False:
-      notification_status.done = True
-      notification_status.save()
-   NotificationSingle.objects.filter(id=instance_id).update(notification_status=notification_status)
+@shared_task()
+def materialize_occurrences_task():
+   '''Setting up statuses for the occurrences of recurring notifications which come within the scheduling horizon ( see scheduling.py )'''
+   from .scheduling import materialize_occurrences
+   logger.info(f'Materialized {materialize_occurrences()} occurrence(-s)')
 
-   user = NotificationSingle.objects.get(id=instance_id).notification_type_single.user
-   all_notification_sender_types = user.get_all_active_and_attached_networks()
-   all_sender_functions = user.sender_functions()
-   if len(all_notification_sender_types) > 0:
-      for f in all_sender_functions:
-         if (f.__name__) in all_notification_sender_types:
-            f(instance_id, lang_code, model='single')
+@shared_task()
+def create_notification_task(instance_id, lang_code):
+   '''Sending a single notification now, whatever its time is ( the "send now" button of the staff )'''
+   from .models import NotificationSingle
+   from .send_notifications import send_notifications_now
+   notification_status_id = NotificationSingle.objects.values_list('notification_status', flat=True).get(id=instance_id)
+   send_notifications_now([notification_status_id], lang_code)
 
 @shared_task()
 def create_periodic_notification_task(instance_id, notification_status_id, lang_code):
-   from .models import NotificationPeriodicity, NotificationStatus
-   notification_status = NotificationStatus.objects.get(id=notification_status_id)
+   '''Sending an occurrence of a periodic notification now, whatever its time is ( the "send now" button of the staff )'''
+   from .send_notifications import send_notifications_now
+   send_notifications_now([notification_status_id], lang_code)
 
-   if notification_status.done == False:
-      notification_status.done = True
-   notification_status.save()
-   
-   user = NotificationPeriodicity.objects.get(id=instance_id).notification_type_periodicity.user
-   all_notification_sender_types = user.get_all_active_and_attached_networks()
-   all_sender_functions = user.sender_functions()
-   if len(all_notification_sender_types) > 0:
-      for f in all_sender_functions:
-         if (f.__name__) in all_notification_sender_types:
-            f(instance_id, lang_code, model='periodic', notification_status_id=notification_status_id)
+@shared_task()
+def retry_deliveries_task(channel, notification_status_ids, attempt):
+   '''Sending the failed deliveries of a channel once more ( see send_notifications.handle_failed_deliveries )'''
+   from .send_notifications import retry_deliveries
+   sent = retry_deliveries(channel, notification_status_ids, attempt)
+   logger.info(f'Retried {len(notification_status_ids)} {channel} delivery(-ies), attempt {attempt}: {sent} sent')
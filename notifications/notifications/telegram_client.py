@@ -0,0 +1,114 @@
+import asyncio
+import itertools
+import os
+import threading
+
+import httpx
+
+from django.conf import settings
+
+def get_retry_after(response):
+    '''Output: seconds telegram asked to wait ( 429 Too Many Requests ) or None'''
+    if response.status_code != 429:
+        return None
+    try:
+        return response.json()['parameters']['retry_after']
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+def get_async_client(max_connections):
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(limits=limits, timeout=settings.TELEGRAM_TIMEOUT)
+
+class AsyncClientPool:
+    '''
+        Pooled connections to telegram for `concurrency` requests in flight, split between httpx clients of TELEGRAM_CONNECTIONS_PER_CLIENT connections:
+        an httpx client goes through all of its connections for every request, so one client with hundreds of them spends more time on that than on sending
+    '''
+    def __init__(self, concurrency):
+        sizes = [settings.TELEGRAM_CONNECTIONS_PER_CLIENT] * (concurrency // settings.TELEGRAM_CONNECTIONS_PER_CLIENT)
+        if concurrency % settings.TELEGRAM_CONNECTIONS_PER_CLIENT:
+            sizes.append(concurrency % settings.TELEGRAM_CONNECTIONS_PER_CLIENT)
+        self.clients = [(get_async_client(size), asyncio.Semaphore(size)) for size in sizes]
+        self.next_client = itertools.cycle(self.clients)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*(client.aclose() for client, _ in self.clients))
+
+    async def post(self, url, data):
+        '''A request through the next client, waiting for a free connection of it'''
+        client, semaphore = next(self.next_client)
+        async with semaphore:
+            return await client.post(url, data=data)
+
+async def post_messages(pool, messages, waits=None):
+    '''
+        Input: pool -> AsyncClientPool ( it can be shared by several batches ), messages -> list of ( chat_id, text ),
+            waits -> seconds every message waits before it is sent ( see rate_limits.take_tokens )
+        Output: list of responses ( or exceptions ) in the order of the messages
+
+        Every 429 response is retried after its `retry_after`, the other messages keep going meanwhile.
+        A `retry_after` longer than TELEGRAM_MAX_RETRY_AFTER is not waited for, the 429 response is returned and the delivery is retried by celery
+    '''
+    async def send(chat_id, text, wait):
+        await asyncio.sleep(wait) # the waiting messages do not hold a connection
+        for _ in range(settings.TELEGRAM_MAX_RETRIES + 1):
+            response = await pool.post(settings.TELEGRAM_API_SENDING_MESSAGE, data={'chat_id': chat_id, 'text': text})
+            retry_after = get_retry_after(response)
+            if retry_after is None or retry_after > settings.TELEGRAM_MAX_RETRY_AFTER:
+                break
+            await asyncio.sleep(retry_after)
+        return response
+
+    return await asyncio.gather(
+        *(send(chat_id, text, wait) for (chat_id, text), wait in zip(messages, waits or [0] * len(messages))),
+        return_exceptions=True
+    )
+
+class ProcessClient:
+    '''
+        The event loop of the process, running in a thread of its own, with a pool of connections for every concurrency,
+        so the batches of synchronous code ( e.g. celery tasks ) reuse the connections to telegram instead of opening new ones every batch
+    '''
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        self.pools = {}
+        threading.Thread(target=self.loop.run_forever, name='telegram-client', daemon=True).start()
+
+    def get_pool(self, concurrency):
+        # called in the loop, the clients belong to it
+        if concurrency not in self.pools:
+            self.pools[concurrency] = AsyncClientPool(concurrency)
+        return self.pools[concurrency]
+
+    async def post_messages(self, messages, concurrency, waits):
+        return await post_messages(self.get_pool(concurrency), messages, waits)
+
+    def send_messages(self, messages, concurrency, waits):
+        return asyncio.run_coroutine_threadsafe(self.post_messages(messages, concurrency, waits), self.loop).result()
+
+_process_client = None
+_process_client_lock = threading.Lock()
+
+def get_process_client():
+    '''The client of the current process, a forked worker process ( celery prefork ) gets a new one: the loop thread is not forked'''
+    global _process_client
+    with _process_client_lock:
+        if _process_client is None or _process_client.pid != os.getpid():
+            _process_client = ProcessClient()
+        return _process_client
+
+def send_messages(messages, concurrency=None, waits=None):
+    '''
+        Sending a batch of messages concurrently from synchronous code ( e.g. celery tasks ) over the connections of the process
+        Input: messages -> list of ( chat_id, text ), concurrency -> the maximum amount of requests in flight,
+            waits -> seconds every message waits before it is sent
+        Output: list of responses ( or exceptions ) in the order of the messages
+    '''
+    if not messages:
+        return []
+    return get_process_client().send_messages(messages, concurrency or settings.TELEGRAM_CONCURRENCY, waits)
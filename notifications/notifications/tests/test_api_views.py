@@ -7,9 +7,10 @@ from django.urls import reverse
 from rest_framework.test import APIClient, APITestCase
 
 from authentication.models import MyUser
-from config.celery import app
 from notification_categories.models import NotificationCategory
 from notifications.models import NotificationSingle, NotificationPeriodicity, NotificationBase, NotificationStatus, NotificationId
+from notifications.scheduling import schedule_single_notification, schedule_periodic_notification
+from notifications.send_notifications import load_deliveries
 
 class NotificationsGenericViewsApiTests(APITestCase):
     @classmethod
@@ -104,6 +105,7 @@ class NotificationSingleViewsApiTests(APITestCase):
             notification_status=cls.test_notification_status,
             notification_type_single=cls.test_notification_type_single
         )
+        schedule_single_notification(cls.notification_single)
         cls.c = APIClient()
 
     def test_notification_single_detail_api_get_method(self):
@@ -127,6 +129,58 @@ class NotificationSingleViewsApiTests(APITestCase):
         authenticated_myuser_response = self.c.get(url)
         self.assertEqual(authenticated_myuser_response.status_code, 200)
 
+    def test_notifications_lists_api_split_by_status(self):
+        ''' Testing that a complited notification moves from the incomplete list api to the finished one '''
+        single_id = str(self.notification_single.id)
+        self.c.login(username=self.username, password=self.password)
+
+        response = self.c.get(reverse('notifications_api:notifications_list_api'))
+        self.assertIn(single_id, response.data['notifications_single'])
+
+        load_deliveries([self.test_notification_status.id]) # the delivery completes the status and its notification
+
+        response = self.c.get(reverse('notifications_api:notifications_list_api'))
+        self.assertNotIn(single_id, response.data['notifications_single'])
+        finished_response = self.c.get(reverse('notifications_api:finished_notifications_list_api'))
+        self.assertIn(single_id, finished_response.data['finished_notifications_single'])
+
+    def test_notifications_list_api_pagination_and_filters(self):
+        ''' Testing cursor pagination and `type` / `category` filters of notifications list api '''
+        single_id = str(self.notification_single.id)
+        url = reverse('notifications_api:notifications_list_api')
+        self.c.login(username=self.username, password=self.password)
+
+        response = self.c.get(url, {'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['notifications_single']) + len(response.data['notifications_periodic']), 1)
+        self.assertIn('next', response.data)
+
+        response = self.c.get(url, {'type': 'single', 'category': self.test_category.id})
+        self.assertIn(single_id, response.data['notifications_single'])
+
+        response = self.c.get(url, {'type': 'periodic'})
+        self.assertNotIn(single_id, response.data['notifications_single'])
+
+        response = self.c.get(url, {'type': 'unknown'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_notifications_api(self):
+        ''' Testing full text search api: prefixes of words, ranking and page numbers '''
+        single_id = str(self.notification_single.id)
+        url = reverse('notifications_api:search_notifications_api')
+        self.c.login(username=self.username, password=self.password)
+
+        response = self.c.get(url, {'q': 'API tit'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertIn(single_id, response.data['notifications_single'])
+
+        response = self.c.get(url, {'q': 'api unknownword'})
+        self.assertEqual(response.data['count'], 0)
+
+        response = self.c.get(url, {'q': ' !? '})
+        self.assertEqual(response.data['count'], 0)
+
     def test_create_notification_single_api_post_request(self):
         ''' Testing POST request of notification single create page '''
 
@@ -275,9 +329,10 @@ class NotificationPeriodicViewsApiTests(APITestCase):
             text=cls.test_text,
             notification_periodic_time=cls.notification_periodic_time,
             notification_periodicity_num=cls.notification_periodicity_num,
-            dates=cls.dates,
             notification_type_periodicity=cls.type_periodic
         )
+        cls.periodic_notification.set_dates(cls.dates)
+        schedule_periodic_notification(cls.periodic_notification)
 
         cls.c = APIClient()
 
@@ -666,18 +721,16 @@ class NotificationPeriodicViewsApiTests(APITestCase):
         url = reverse('notifications_api:notification_periodic_revoke_certain_time_stamp_api', kwargs=request_kwargs)
 
         old_status = NotificationStatus.objects.first()
-        old_revoked_tasks = app.control.inspect().revoked()
 
         # authenticated user who is not `author` of the notification
         self.c.login(username=self.username, password=self.password)
         response = self.c.delete(url)
 
         new_status = NotificationStatus.objects.first()
-        new_revoked_tasks = app.control.inspect().revoked()
 
 
-        self.assertTrue(old_revoked_tasks != new_revoked_tasks)
         self.assertNotEqual(old_status.done, new_status.done) # 0 2
+        self.assertEqual(new_status.done, NotificationStatus.Status.REVOKED) # the delivery skips it, workers are not told
         self.assertEqual(response.status_code, 204)
 
     def test_notification_periodic_revoke_all_time_stamps_page_delete_request(self):
@@ -686,18 +739,16 @@ class NotificationPeriodicViewsApiTests(APITestCase):
             'pk': NotificationPeriodicity.objects.first().id
         }
         url = reverse('notifications_api:notification_periodic_revoke_all_time_stamps_api', kwargs=request_kwargs)
-        old_revoked_tasks = app.control.inspect().revoked()
         old_revoked_notif_statuses = self.periodic_notification.notification_status.filter(done=2).count()
 
         # authenticated user who is not `author` of the notification
         self.c.login(username=self.username, password=self.password)
         response = self.c.delete(url)
 
-        new_revoked_tasks = app.control.inspect().revoked()
         new_revoked_notif_statuses = self.periodic_notification.notification_status.filter(done=2).count()
         
         self.assertEqual(old_revoked_notif_statuses+self.notification_periodicity_num, new_revoked_notif_statuses)
-        self.assertTrue(old_revoked_tasks != new_revoked_tasks)
+        self.assertFalse(self.periodic_notification.notification_status.filter(done=0).exists())
         self.assertEqual(response.status_code, 204)
 
     def test_notification_periodic_change_notification_status_from_revoke_to_incomplete_api_post_request(self):
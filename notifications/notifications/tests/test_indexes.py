@@ -0,0 +1,46 @@
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from authentication.models import MyUser
+from ..models import NotificationBase, NotificationId, NotificationPeriodicDate, NotificationStatus
+
+class NotificationIndexesTests(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.myuser = MyUser.objects.create(username='indexes_user', email='indexes_user@gmail.com')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off') # the tables of the test database are tiny, postgres would read them whole anyway
+
+    def assertUsesIndex(self, queryset, index_name_regex):
+        self.assertRegex(queryset.explain(), rf'(Index (Only )?Scan( Backward)? using|Bitmap Index Scan on) {index_name_regex}')
+
+    def test_due_statuses_use_pending_index(self):
+        ''' Testing that the dispatcher reads the due statuses from the partial index of the waiting statuses '''
+        self.assertUsesIndex(NotificationStatus.objects.due(timezone.now()), 'notification_pending_idx')
+
+    def test_notification_list_uses_user_index(self):
+        ''' Testing that the notification list of a user ( the queryset of the list views ) is read in the order of the index '''
+        self.assertUsesIndex(NotificationBase.objects.filter(user=self.myuser).active(), 'notification_base_user_idx')
+
+    def test_search_uses_gin_indexes(self):
+        ''' Testing that the search ( the queryset of the search views ) matches the single and periodic notifications by their GIN indexes '''
+        queryset = NotificationBase.objects.filter(user=self.myuser).search('work').active()
+        self.assertUsesIndex(queryset, 'notification_single_search')
+        self.assertUsesIndex(queryset, 'notification_periodic_search')
+
+    def test_task_lookup_uses_unique_index(self):
+        ''' Testing that a task is found by its id without scanning all the tasks '''
+        self.assertUsesIndex(NotificationId.objects.filter(notification_id='task id'), r'notifications_notificationid_notification_id_\w+')
+
+    def test_dates_lookup_uses_date_index(self):
+        ''' Testing that the periodic notifications firing on a date are found without scanning all the dates '''
+        self.assertUsesIndex(NotificationPeriodicDate.objects.filter(date=timezone.localdate()), r'notifications_notificationperiodicdate_date_\w+')
+
+    def test_notifications_of_statuses_use_primary_key(self):
+        ''' Testing that the notifications whose status counters are refreshed are found by their primary key, not by scanning all of them '''
+        self.assertUsesIndex(NotificationStatus.objects.filter(done=NotificationStatus.Status.NOT_COMPLITED).notifications(), 'notifications_notificationbase_pkey')
+
+    def test_finished_list_uses_counters_index(self):
+        ''' Testing that the finished notifications of a user are found by the index of the status counters '''
+        self.assertUsesIndex(NotificationBase.objects.filter(user=self.myuser).finished(), 'notification_base_counters_idx')
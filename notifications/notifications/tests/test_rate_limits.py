@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase, override_settings
+from django_redis import get_redis_connection
+
+from ..rate_limits import get_throttled_metrics, reset_throttled_metrics, take_tokens
+
+@override_settings(
+    NOTIFICATIONS_RATE_LIMITS={'test_channel': {'rate': 10, 'capacity': 2}},
+    NOTIFICATIONS_RECIPIENT_RATE_LIMITS={'test_channel': {'rate': 1, 'capacity': 1}},
+)
+class RateLimitsTests(SimpleTestCase):
+    def setUp(self):
+        connection = get_redis_connection('default')
+        connection.delete(*connection.keys('rate_limit:test_channel*') or ['rate_limit:test_channel'])
+
+    def test_messages_wait_for_their_tokens(self):
+        ''' Testing that a burst of the bucket capacity is sent at once and the next messages queue up at the rate of the channel '''
+        waits = take_tokens('test_channel', [None] * 5)
+        self.assertEqual(waits[:2], [0, 0])
+        for wait, expected in zip(waits[2:], [0.1, 0.2, 0.3]):
+            self.assertAlmostEqual(wait, expected, delta=0.05)
+
+    def test_recipient_is_limited_separately(self):
+        ''' Testing that the messages to one chat wait for the chat bucket, while the other chats are limited only by the channel '''
+        waits = take_tokens('test_channel', ['chat 1', 'chat 1', 'chat 2'])
+        self.assertEqual(waits[0], 0)
+        self.assertAlmostEqual(waits[1], 1, delta=0.05)
+        self.assertAlmostEqual(waits[2], 0.1, delta=0.05) # the burst of the channel is over
+
+    def test_throttled_time_is_measured(self):
+        ''' Testing that the amount of throttled messages and the seconds they waited are counted '''
+        reset_throttled_metrics(['test_channel'])
+        waits = take_tokens('test_channel', [None] * 4)
+        throttled, throttled_seconds = get_throttled_metrics(['test_channel'])['test_channel']
+        self.assertEqual(throttled, 2)
+        self.assertAlmostEqual(throttled_seconds, sum(waits), places=3)
+
+@override_settings(NOTIFICATIONS_RATE_LIMITS={'test_channel': {'rate': 10, 'capacity': 2}})
+class RateLimitsWithoutRedisTests(SimpleTestCase):
+    @override_settings(CACHES={'default': {'BACKEND': 'django_redis.cache.RedisCache', 'LOCATION': 'redis://127.0.0.1:1/1'}})
+    def test_messages_are_not_limited_without_redis(self):
+        ''' Testing that the messages are sent without waiting if redis is unreachable '''
+        self.assertEqual(take_tokens('test_channel', [None] * 5), [0] * 5)
+
+    def test_channel_without_limit_does_not_use_redis(self):
+        ''' Testing that a channel without a rate limit is not throttled '''
+        self.assertEqual(take_tokens('unlimited_channel', ['chat 1', 'chat 1']), [0, 0])
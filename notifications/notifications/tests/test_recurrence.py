@@ -0,0 +1,52 @@
+from datetime import date, datetime, time
+import zoneinfo
+
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from ..models import NotificationPeriodicity
+from ..recurrence import expand_recurrence, validate_recurrence
+
+class RecurrenceTests(SimpleTestCase):
+    @classmethod
+    def setUp(cls):
+        cls.notification_periodic = NotificationPeriodicity(
+            title='weekly notification',
+            text='weekly text',
+            notification_periodic_time=time(9, 30, 15, 500),
+            recurrence='FREQ=WEEKLY;BYDAY=MO,WE;COUNT=5',
+            recurrence_start=date(2024, 1, 1), # monday
+        )
+
+    def get_time(self, *args):
+        return timezone.localtime(timezone.make_aware(datetime(*args)))
+
+    def test_occurrences_are_expanded_within_the_window(self):
+        ''' Testing that only the occurrences of the window are expanded and the next one is remembered '''
+        times, next_time = expand_recurrence(self.notification_periodic, self.get_time(2024, 1, 1), self.get_time(2024, 1, 8, 9, 30, 15))
+        self.assertEqual(times, [self.get_time(2024, 1, 1, 9, 30, 15), self.get_time(2024, 1, 3, 9, 30, 15), self.get_time(2024, 1, 8, 9, 30, 15)])
+        self.assertEqual(next_time, self.get_time(2024, 1, 10, 9, 30, 15))
+
+    def test_finished_recurrence_has_no_next_occurrence(self):
+        ''' Testing that a rule with a count stops after its last occurrence '''
+        times, next_time = expand_recurrence(self.notification_periodic, self.get_time(2024, 1, 9), self.get_time(2024, 12, 31))
+        self.assertEqual(times, [self.get_time(2024, 1, 10, 9, 30, 15), self.get_time(2024, 1, 15, 9, 30, 15)])
+        self.assertIsNone(next_time)
+
+    def test_occurrences_are_expanded_in_the_timezone_of_the_notification(self):
+        ''' Testing that the occurrences keep the wall clock time of the stored timezone whatever timezone is active '''
+        self.notification_periodic.tz = 'Europe/Moscow'
+        moscow = zoneinfo.ZoneInfo('Europe/Moscow')
+        with timezone.override('UTC'):
+            times, next_time = expand_recurrence(self.notification_periodic, datetime(2024, 1, 1, tzinfo=moscow), datetime(2024, 1, 3, 23, tzinfo=moscow))
+        self.assertEqual(times, [datetime(2024, 1, 1, 9, 30, 15, tzinfo=moscow), datetime(2024, 1, 3, 9, 30, 15, tzinfo=moscow)])
+        self.assertEqual(next_time, datetime(2024, 1, 8, 9, 30, 15, tzinfo=moscow))
+
+    def test_recurrence_validation(self):
+        ''' Testing that only valid daily, weekly, monthly or yearly rules are accepted '''
+        for rule in ('FREQ=WEEKLY;BYDAY=MO,WE', 'FREQ=MONTHLY;BYMONTHDAY=1;UNTIL=20301231', 'FREQ=DAILY;COUNT=3'):
+            validate_recurrence(rule)
+        for rule in ('FREQ=MINUTELY', 'FREQ=WEEKLY;BYDAY=XX', 'BYDAY=MO', 'DTSTART:20240101T000000\nRRULE:FREQ=DAILY'):
+            with self.assertRaises(ValidationError):
+                validate_recurrence(rule)
@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase
+
+from config.celery import app
+
+class TaskRoutingTests(SimpleTestCase):
+    def get_queue(self, name, args=()):
+        return app.amqp.router.route({}, name, args, {})['queue'].name
+
+    def test_channel_tasks_go_to_queue_of_channel(self):
+        ''' Testing that the sending and the retries of a channel run in its own queue '''
+        self.assertEqual(self.get_queue('notifications.tasks.send_channel_deliveries_task', ('telegram', [])), 'telegram')
+        self.assertEqual(self.get_queue('notifications.tasks.send_channel_deliveries_task', ('email', [])), 'email')
+        self.assertEqual(self.get_queue('notifications.tasks.retry_deliveries_task', ('email', [], 2)), 'email')
+
+    def test_other_tasks_go_to_scheduling_queue(self):
+        ''' Testing that dispatched batches and materializing do not wait behind the deliveries '''
+        self.assertEqual(self.get_queue('notifications.tasks.deliver_notifications_task', ([],)), 'scheduling')
+        self.assertEqual(self.get_queue('notifications.tasks.materialize_occurrences_task'), 'scheduling')
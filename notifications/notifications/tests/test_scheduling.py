@@ -0,0 +1,469 @@
+from datetime import datetime, time, timedelta
+import zoneinfo
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone, translation
+
+from authentication.models import MyUser, UserTelegram
+from notification_categories.models import NotificationCategory
+from ..async_worker import AsyncDeliveryWorker, load_due_deliveries
+from ..dispatcher import claim_due_notifications, dispatch_due_notifications
+from ..fake_telegram import FakeTelegramServer
+from ..models import NotificationBase, NotificationDeadLetter, NotificationDelivery, NotificationSingle, NotificationPeriodicity, NotificationStatus
+from ..scheduling import (
+    create_periodic_tasks,
+    get_scheduling_horizon,
+    materialize_occurrences,
+    reschedule_periodic_notification,
+    reschedule_single_notification,
+    restore_periodic_status,
+    revoke_periodic_notification,
+    schedule_single_notification,
+    schedule_periodic_notification,
+)
+from ..send_notifications import SENDERS, DeliveryError, load_deliveries, retry_deliveries, send_deliveries
+from ..tasks import create_notification_task, deliver_notifications_task, retry_deliveries_task, send_channel_deliveries_task
+
+class NotificationSchedulingTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.myuser = MyUser.objects.create(username='dispatcher_user', email='dispatcher_user@gmail.com')
+        cls.notification_category = NotificationCategory.objects.create(
+            user=cls.myuser,
+            name_type='dispatcher',
+            color='#000000'
+        )
+        cls.notification_time = timezone.localtime(timezone.now() - timedelta(minutes=5)).replace(microsecond=0)
+        cls.notification_single = NotificationSingle.objects.create(
+            notification_category=cls.notification_category,
+            title='due notification',
+            text='due text',
+            notification_date=cls.notification_time.date(),
+            notification_time=cls.notification_time.time(),
+            notification_status=NotificationStatus.objects.create(),
+            notification_type_single=NotificationBase.objects.create(user=cls.myuser, notification_type='Single')
+        )
+        schedule_single_notification(cls.notification_single)
+
+    def create_periodic_notification(self, **fields):
+        '''A periodic notification of the user, the fields override the defaults'''
+        return NotificationPeriodicity.objects.create(**{
+            'notification_category': self.notification_category,
+            'title': 'periodic notification',
+            'text': 'periodic text',
+            'notification_periodic_time': self.notification_time.time(),
+            'notification_type_periodicity': NotificationBase.objects.create(user=self.myuser, notification_type='Periodic'),
+            **fields
+        })
+
+class DispatcherTests(NotificationSchedulingTestCase):
+    def test_due_notification_is_dispatched_once(self):
+        ''' Testing that a due notification status is handed to celery only once '''
+        notification_status = NotificationSingle.objects.get(id=self.notification_single.id).notification_status
+        self.assertIsNotNone(notification_status.notification_celery_id)
+
+        with mock.patch.object(deliver_notifications_task, 'delay') as delay:
+            self.assertEqual(dispatch_due_notifications(batch_size=10), 1)
+            self.assertEqual(dispatch_due_notifications(batch_size=10), 0)
+
+        delay.assert_called_once_with([str(notification_status.id)])
+        notification_status.refresh_from_db()
+        self.assertIsNotNone(notification_status.dispatched_at)
+
+    def test_due_notifications_are_split_into_delivery_batches(self):
+        ''' Testing that the dispatcher publishes one delivery task per delivery batch '''
+        for _ in range(4):
+            NotificationStatus.objects.create(time_stamp=timezone.now() - timedelta(minutes=1))
+
+        with mock.patch.object(deliver_notifications_task, 'delay') as delay:
+            self.assertEqual(dispatch_due_notifications(batch_size=10, delivery_batch_size=2), 5)
+        self.assertEqual(delay.call_count, 3)
+
+    def test_future_and_revoked_notifications_are_not_dispatched(self):
+        ''' Testing that revoked statuses and statuses in the future stay in the database '''
+        NotificationStatus.objects.create(time_stamp=timezone.now() + timedelta(days=1))
+        NotificationStatus.objects.filter(id=self.notification_single.notification_status.id).update(done=2)
+
+        with mock.patch.object(deliver_notifications_task, 'delay') as delay:
+            self.assertEqual(dispatch_due_notifications(batch_size=10), 0)
+        delay.assert_not_called()
+
+class DeliveryTests(NotificationSchedulingTestCase):
+    def test_deliveries_are_loaded_once(self):
+        ''' Testing that a delivery batch loads only not complited statuses and marks them as complited '''
+        notification_status_id = self.notification_single.notification_status.id
+
+        deliveries = load_deliveries([notification_status_id])
+        self.assertEqual(len(deliveries), 1)
+        self.assertEqual(deliveries[0].notification, self.notification_single)
+        self.assertEqual(deliveries[0].user, self.myuser)
+        self.assertEqual(NotificationStatus.objects.get(id=notification_status_id).done, 1)
+
+        self.assertEqual(load_deliveries([notification_status_id]), [])
+
+    def test_delivery_is_sent_once_per_channel(self):
+        ''' Testing that the delivery ledger skips a status sent through a channel already, whoever sends it again '''
+        notification_status_id = self.notification_single.notification_status.id
+        deliveries = load_deliveries([notification_status_id])
+        sender = mock.Mock()
+        with mock.patch.dict(SENDERS, {'telegram': sender, 'email': sender}), \
+                mock.patch('authentication.channels.get_users_channels', return_value={self.myuser.id: ['telegram', 'email']}):
+            send_deliveries(deliveries)
+            send_deliveries(deliveries) # a duplicate task
+        self.assertEqual(sender.call_count, 2)
+        self.assertEqual(sorted(NotificationDelivery.objects.values_list('channel', flat=True)), ['email', 'telegram'])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(NotificationDelivery.objects.claim('telegram', [notification_status_id, notification_status_id]), set())
+        self.assertEqual(NotificationDelivery.objects.claim('sms', [notification_status_id]), {notification_status_id})
+
+    @mock.patch('authentication.channels.get_users_channels')
+    def test_delivery_batch_is_queued_per_channel(self, get_users_channels):
+        ''' Testing that a dispatched batch is handed to the queue of every channel and sent there once '''
+        notification_status_id = self.notification_single.notification_status.id
+        get_users_channels.return_value = {self.myuser.id: ['telegram', 'email']}
+        with mock.patch.object(send_channel_deliveries_task, 'delay') as delay:
+            deliver_notifications_task([str(notification_status_id)])
+        self.assertEqual(sorted(call.args for call in delay.call_args_list), [('email', [str(notification_status_id)]), ('telegram', [str(notification_status_id)])])
+
+        sender = mock.Mock(return_value=[None])
+        with mock.patch.dict(SENDERS, {'email': sender}):
+            send_channel_deliveries_task('email', [str(notification_status_id)])
+            send_channel_deliveries_task('email', [str(notification_status_id)])
+        sender.assert_called_once()
+
+    @mock.patch('authentication.channels.get_users_channels')
+    def test_failed_hand_off_keeps_statuses_not_complited(self, get_users_channels):
+        ''' Testing that a batch whose channel tasks are not published stays not complited and the dispatcher hands it over again '''
+        notification_status_id = self.notification_single.notification_status.id
+        get_users_channels.return_value = {self.myuser.id: ['telegram']}
+        with mock.patch.object(deliver_notifications_task, 'delay'):
+            dispatch_due_notifications(batch_size=10)
+
+        with mock.patch.object(send_channel_deliveries_task, 'delay', side_effect=ConnectionError('the broker is unreachable')):
+            with self.assertRaises(ConnectionError):
+                deliver_notifications_task([str(notification_status_id)])
+        notification_status = NotificationStatus.objects.get(id=notification_status_id)
+        self.assertEqual(notification_status.done, NotificationStatus.Status.NOT_COMPLITED)
+        self.assertIsNone(notification_status.dispatched_at)
+        self.assertEqual(NotificationBase.objects.get(id=self.notification_single.notification_type_single_id).pending_statuses, 1)
+
+    @mock.patch('authentication.channels.get_users_channels')
+    def test_future_notification_is_sent_now_by_staff(self, get_users_channels):
+        ''' Testing that the "send now" task hands a notification whose time has not come to the queues of its channels in the chosen language '''
+        notification_status_id = self.notification_single.notification_status.id
+        NotificationStatus.objects.filter(id=notification_status_id).update(time_stamp=timezone.now() + timedelta(days=1))
+        get_users_channels.return_value = {self.myuser.id: ['telegram']}
+        with mock.patch.object(send_channel_deliveries_task, 'delay') as delay:
+            create_notification_task(self.notification_single.id, 'de')
+        delay.assert_called_once_with('telegram', [str(notification_status_id)])
+        notification_status = NotificationStatus.objects.get(id=notification_status_id)
+        self.assertEqual((notification_status.done, notification_status.lang_code), (NotificationStatus.Status.COMPLITED, 'de'))
+
+    def test_revoked_notification_is_not_delivered(self):
+        ''' Testing that revoking does not depend on workers and a revoked status already handed to celery is not sent '''
+        notification_status_id = self.notification_single.notification_status.id
+        with mock.patch.object(deliver_notifications_task, 'delay'):
+            dispatch_due_notifications(batch_size=10)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(NotificationStatus.objects.filter(id=notification_status_id).revoke(), 1)
+        self.assertEqual(load_deliveries([notification_status_id]), [])
+        self.assertEqual(NotificationStatus.objects.get(id=notification_status_id).done, NotificationStatus.Status.REVOKED)
+
+class DeliveryRetryTests(NotificationSchedulingTestCase):
+    @mock.patch.object(retry_deliveries_task, 'apply_async')
+    @mock.patch('authentication.channels.get_users_channels')
+    def test_failed_delivery_is_retried_then_dead_lettered(self, get_users_channels, apply_async):
+        ''' Testing that a failed delivery is retried with a growing countdown, becomes a dead letter after the last attempt and can be replayed '''
+        notification_status_id = self.notification_single.notification_status.id
+        get_users_channels.return_value = {self.myuser.id: ['telegram']}
+        sender = mock.Mock(return_value=[DeliveryError('Telegram answered 502')])
+        with mock.patch.dict(SENDERS, {'telegram': sender}), \
+                self.settings(NOTIFICATIONS_RETRY_POLICIES={'telegram': {'max_attempts': 3, 'backoff': 10, 'backoff_max': 60}}):
+            send_deliveries(load_deliveries([notification_status_id]))
+            (channel, ids, attempt), = [call.args[0] for call in apply_async.call_args_list]
+            self.assertEqual((channel, ids, attempt), ('telegram', [str(notification_status_id)], 2))
+            self.assertTrue(5 <= apply_async.call_args.kwargs['countdown'] <= 10)
+
+            self.assertEqual(retry_deliveries('telegram', ids, 2), 0)
+            self.assertEqual(retry_deliveries('telegram', ids, 2), 0) # a duplicate retry task
+            self.assertEqual(apply_async.call_count, 2)
+            self.assertTrue(10 <= apply_async.call_args.kwargs['countdown'] <= 20)
+            self.assertEqual(retry_deliveries('telegram', ids, 3), 0)
+            self.assertEqual(sender.call_count, 3)
+            self.assertEqual(apply_async.call_count, 2)
+
+            dead_letter = NotificationDeadLetter.objects.get()
+            self.assertEqual((dead_letter.notification_status_id, dead_letter.channel, dead_letter.attempts), (notification_status_id, 'telegram', 3))
+
+            sender.return_value = [None]
+            with mock.patch.object(retry_deliveries_task, 'delay') as delay, self.captureOnCommitCallbacks(execute=True):
+                call_command('replay_dead_letters', stdout=StringIO())
+            delay.assert_called_once_with('telegram', [str(notification_status_id)], 1)
+            self.assertFalse(NotificationDeadLetter.objects.exists())
+            self.assertEqual(retry_deliveries(*delay.call_args.args), 1)
+
+class AsyncDeliveryWorkerTests(NotificationSchedulingTestCase):
+    @mock.patch('authentication.channels.get_users_channels')
+    def test_async_worker_sends_due_notifications(self, get_users_channels):
+        ''' Testing that the asyncio worker takes due statuses, sends them once through a fake telegram api and stops when they are sent '''
+        server = FakeTelegramServer(throttle=True).start()
+        self.addCleanup(server.stop)
+        MyUser.objects.filter(id=self.myuser.id).update(users_telegram=UserTelegram.objects.create(telegram_user='async_user', chat_id='42'))
+        get_users_channels.return_value = {self.myuser.id: ['telegram']}
+        notification_status_id = self.notification_single.notification_status.id
+
+        worker = AsyncDeliveryWorker(batch_size=10, max_batches=2, concurrency=5, interval=0, once=True)
+        with self.settings(
+            TELEGRAM_API_SENDING_MESSAGE=server.url,
+            NOTIFICATIONS_RATE_LIMITS={}, NOTIFICATIONS_RECIPIENT_RATE_LIMITS={},
+        ):
+            self.assertEqual(async_to_sync(worker.run)(handle_signals=False), 1)
+            self.assertEqual(async_to_sync(AsyncDeliveryWorker(10, 2, 5, 0, once=True).run)(handle_signals=False), 0)
+
+        self.assertEqual(server.requests, ['42', '42']) # the first request of a chat is answered 429
+        self.assertEqual(NotificationStatus.objects.get(id=notification_status_id).done, NotificationStatus.Status.COMPLITED)
+        self.assertTrue(NotificationDelivery.objects.filter(notification_status=notification_status_id, channel='telegram').exists())
+
+    def test_failed_load_leaves_statuses_to_the_next_claim(self):
+        ''' Testing that the statuses claimed by the asyncio worker are not left dispatched if loading their deliveries fails '''
+        notification_status_id = self.notification_single.notification_status.id
+        with mock.patch('notifications.async_worker.load_deliveries', side_effect=ConnectionError('the connection is lost')):
+            with self.assertRaises(ConnectionError):
+                async_to_sync(load_due_deliveries)(10)
+        self.assertIsNone(NotificationStatus.objects.get(id=notification_status_id).dispatched_at)
+        self.assertEqual(claim_due_notifications(10), [notification_status_id])
+
+class PeriodicSchedulingTests(NotificationSchedulingTestCase):
+    def test_periodic_occurrences_are_created_in_bulk(self):
+        ''' Testing that the amount of queries does not depend on the amount of periodic dates '''
+        notification_periodic = self.create_periodic_notification()
+        times = [self.notification_time + timedelta(days=day) for day in range(1, 16)]
+        with self.assertNumQueries(6): # the status counters lock the notification before counting
+            create_periodic_tasks(notification_periodic, times)
+
+        self.assertEqual(notification_periodic.notification_status.count(), 15)
+        self.assertEqual(notification_periodic.notification_type_periodicity.task_id.count(), 15)
+        self.assertEqual(sorted(notification_periodic.notification_status.values_list('time_stamp', flat=True)), times)
+
+    def test_periodic_dates_are_stored_as_occurrences(self):
+        ''' Testing that the picked dates are kept once each and in order, and the notification is scheduled on every one of them '''
+        notification_periodic = self.create_periodic_notification()
+        dates = [self.notification_time.date() + timedelta(days=day) for day in (3, 1, 2, 1)]
+        with self.assertNumQueries(2):
+            notification_periodic.set_dates(dates)
+        self.assertEqual(notification_periodic.get_dates(), sorted(set(dates)))
+        self.assertEqual(
+            list(NotificationPeriodicity.objects.filter(occurrences__date=dates[0]).values_list('id', flat=True)),
+            [notification_periodic.id]
+        )
+
+        schedule_periodic_notification(notification_periodic)
+        self.assertEqual(
+            sorted(notification_periodic.notification_status.values_list('time_stamp', flat=True)),
+            [self.notification_time + timedelta(days=day) for day in (1, 2, 3)]
+        )
+
+    def test_saving_notification_does_not_schedule_it_again(self):
+        ''' Testing that only the scheduling functions create statuses, saving a notification does not '''
+        notification_periodic = self.create_periodic_notification()
+        notification_periodic.set_dates([self.notification_time.date() + timedelta(days=day) for day in range(1, 4)])
+        self.assertEqual(notification_periodic.notification_status.count(), 0)
+
+        schedule_periodic_notification(notification_periodic)
+        notification_periodic.title = 'new periodic title'
+        notification_periodic.save()
+        self.notification_single.save()
+
+        self.assertEqual(notification_periodic.notification_status.count(), 3)
+        self.assertEqual(NotificationStatus.objects.filter(dispatched_at__isnull=True, done=0).count(), 4)
+
+class MaterializationTests(NotificationSchedulingTestCase):
+    def test_recurring_notification_is_materialized_lazily(self):
+        ''' Testing that a recurring notification gets statuses only within the scheduling horizon and the materializer moves it forward '''
+        notification_periodic = self.create_periodic_notification(title='daily notification', text='daily text', recurrence='FREQ=DAILY;COUNT=30', recurrence_start=self.notification_time.date() + timedelta(days=1))
+        now = timezone.now()
+        schedule_periodic_notification(notification_periodic)
+        horizon_days = len([day for day in range(1, 31) if self.notification_time + timedelta(days=day) <= get_scheduling_horizon(now)])
+        self.assertEqual(notification_periodic.notification_status.count(), horizon_days)
+        self.assertEqual(notification_periodic.next_occurrence_at, self.notification_time + timedelta(days=horizon_days + 1))
+        self.assertIn(notification_periodic.notification_type_periodicity, NotificationBase.objects.active())
+
+        self.assertEqual(materialize_occurrences(now + timedelta(days=10)), 10)
+        self.assertEqual(materialize_occurrences(now + timedelta(days=10)), 0)
+        self.assertEqual(materialize_occurrences(now + timedelta(days=100)), 30 - horizon_days - 10)
+        notification_periodic.refresh_from_db()
+        self.assertIsNone(notification_periodic.next_occurrence_at)
+        self.assertEqual(notification_periodic.notification_status.count(), 30)
+
+    def test_recurring_notification_without_statuses_is_not_finished(self):
+        ''' Testing that a recurring notification with nothing materialized yet is active and not complited, like the lists count it '''
+        notification_periodic = self.create_periodic_notification(title='monthly notification', text='monthly text', recurrence='FREQ=MONTHLY', recurrence_start=self.notification_time.date() + timedelta(days=20))
+        schedule_periodic_notification(notification_periodic)
+        self.assertEqual(notification_periodic.notification_status.count(), 0)
+
+        notification_base = NotificationBase.objects.with_status().get(id=notification_periodic.notification_type_periodicity_id)
+        self.assertIn(notification_base, NotificationBase.objects.active())
+        self.assertFalse(notification_base.check_all_notifications_are_complited())
+
+    def test_far_dates_are_materialized_in_batches(self):
+        ''' Testing that only the dates within the scheduling horizon get statuses and the materializer adds the rest batch by batch '''
+        horizon = timedelta(hours=settings.NOTIFICATIONS_SCHEDULING_HORIZON)
+        notifications_periodic = []
+        for i in range(3):
+            notification_periodic = self.create_periodic_notification(title=f'periodic notification {i}')
+            notification_periodic.set_dates([self.notification_time.date() + timedelta(days=1), self.notification_time.date() + horizon + timedelta(days=30)])
+            schedule_periodic_notification(notification_periodic)
+            notifications_periodic.append(notification_periodic)
+            self.assertEqual(notification_periodic.notification_status.count(), 1)
+            self.assertEqual(notification_periodic.next_occurrence_at, self.notification_time + horizon + timedelta(days=30))
+
+        self.assertEqual(materialize_occurrences(timezone.now() + timedelta(days=29)), 0)
+        self.assertEqual(materialize_occurrences(timezone.now() + timedelta(days=31), batch_size=2), 3)
+        for notification_periodic in notifications_periodic:
+            notification_periodic.refresh_from_db()
+            self.assertIsNone(notification_periodic.next_occurrence_at)
+            self.assertEqual(notification_periodic.notification_status.count(), 2)
+            self.assertEqual(NotificationBase.objects.get(id=notification_periodic.notification_type_periodicity_id).pending_statuses, 2)
+
+    def test_dates_are_materialized_in_the_timezone_of_the_user(self):
+        ''' Testing that the beat task materializes a far date at the wall clock time of the timezone it was scheduled in, not of the default one '''
+        far_date = self.notification_time.date() + timedelta(hours=settings.NOTIFICATIONS_SCHEDULING_HORIZON) + timedelta(days=30)
+        with timezone.override('Europe/Moscow'):
+            notification_periodic = self.create_periodic_notification(notification_periodic_time=time(9, 0))
+            notification_periodic.set_dates([far_date])
+            schedule_periodic_notification(notification_periodic)
+        notification_time = datetime.combine(far_date, time(9, 0), tzinfo=zoneinfo.ZoneInfo('Europe/Moscow')) # 06:00 UTC
+        self.assertEqual(notification_periodic.next_occurrence_at, notification_time)
+
+        self.assertEqual(materialize_occurrences(notification_time), 1)
+        self.assertEqual(notification_periodic.notification_status.get().time_stamp, notification_time)
+
+    def test_revoked_recurring_notification_is_not_materialized(self):
+        ''' Testing that revoking all the statuses of a recurring notification stops its recurrence '''
+        notification_periodic = self.create_periodic_notification(title='weekly notification', text='weekly text', recurrence='FREQ=WEEKLY', recurrence_start=self.notification_time.date() + timedelta(days=1))
+        schedule_periodic_notification(notification_periodic)
+        revoke_periodic_notification(notification_periodic)
+
+        self.assertEqual(materialize_occurrences(timezone.now() + timedelta(days=30)), 0)
+        self.assertFalse(notification_periodic.notification_status.filter(done=NotificationStatus.Status.NOT_COMPLITED).exists())
+
+class ReschedulingTests(NotificationSchedulingTestCase):
+    def test_edit_reschedules_only_changed_occurrences(self):
+        ''' Testing that editing the text touches no statuses and editing the dates or the time moves only the changed not complited statuses '''
+        notification_periodic = self.create_periodic_notification()
+        dates = [self.notification_time.date() + timedelta(days=day) for day in range(0, 3)]
+        notification_periodic.set_dates(dates)
+        schedule_periodic_notification(notification_periodic)
+        complited_status = notification_periodic.notification_status.get(time_stamp=self.notification_time)
+        load_deliveries([complited_status.id])
+        statuses = dict(notification_periodic.notification_status.values_list('id', 'time_stamp'))
+
+        notification_periodic.text = 'edited periodic text'
+        notification_periodic.save()
+        with self.assertNumQueries(2): # reading the dates and the statuses, nothing is written
+            self.assertEqual(reschedule_periodic_notification(notification_periodic, dates), 0)
+        self.assertEqual(dict(notification_periodic.notification_status.values_list('id', 'time_stamp')), statuses)
+
+        dates = dates[:2] + [self.notification_time.date() + timedelta(days=4)]
+        with translation.override('de'):
+            self.assertEqual(reschedule_periodic_notification(notification_periodic, dates), 1)
+        self.assertEqual(notification_periodic.notification_status.get(time_stamp=self.notification_time + timedelta(days=4)).lang_code, 'de')
+        self.assertEqual(set(notification_periodic.notification_status.values_list('id', flat=True)), set(statuses))
+        self.assertEqual(
+            sorted(notification_periodic.notification_status.values_list('time_stamp', flat=True)),
+            [self.notification_time + timedelta(days=day) for day in (0, 1, 4)]
+        )
+
+        notification_periodic.notification_periodic_time = (self.notification_time + timedelta(minutes=30)).time()
+        notification_periodic.save()
+        self.assertEqual(reschedule_periodic_notification(notification_periodic, dates), 2)
+        self.assertEqual(NotificationStatus.objects.get(id=complited_status.id).time_stamp, self.notification_time)
+        self.assertEqual( # the date sent already is not scheduled again at the new time
+            sorted(notification_periodic.notification_status.filter(done=NotificationStatus.Status.NOT_COMPLITED).values_list('time_stamp', flat=True)),
+            [self.notification_time + timedelta(days=day, minutes=30) for day in (1, 4)]
+        )
+        self.assertEqual(NotificationBase.objects.get(id=notification_periodic.notification_type_periodicity_id).pending_statuses, 2)
+
+    def test_single_edit_moves_status_only_if_time_changed(self):
+        ''' Testing that editing the text of a single notification writes no status and a dispatched status moved to a later time is not sent early '''
+        with mock.patch.object(deliver_notifications_task, 'delay'):
+            dispatch_due_notifications(batch_size=10)
+        notification_single = NotificationSingle.objects.select_related('notification_status').get(id=self.notification_single.id)
+        notification_status = notification_single.notification_status
+
+        notification_single.text = 'edited text'
+        notification_single.save()
+        with self.assertNumQueries(0):
+            self.assertFalse(reschedule_single_notification(notification_single))
+
+        notification_single.notification_date = self.notification_time.date() + timedelta(days=1)
+        notification_single.save()
+        self.assertTrue(reschedule_single_notification(notification_single))
+        moved_status = NotificationStatus.objects.get(id=notification_status.id)
+        self.assertEqual(moved_status.time_stamp, self.notification_time + timedelta(days=1))
+        self.assertEqual(moved_status.notification_celery_id_id, notification_status.notification_celery_id_id)
+        self.assertIsNone(moved_status.dispatched_at)
+
+        self.assertEqual(load_deliveries([notification_status.id], only_due=True), []) # the task dispatched before the edit
+        self.assertEqual(NotificationStatus.objects.get(id=notification_status.id).done, NotificationStatus.Status.NOT_COMPLITED)
+
+    def test_sent_single_notification_is_sent_again_after_edit(self):
+        ''' Testing that a sent single notification moved to a new time is not skipped by the delivery ledger of its first delivery '''
+        notification_status_id = self.notification_single.notification_status.id
+        sender = mock.Mock(return_value=[None])
+        with mock.patch.dict(SENDERS, {'telegram': sender}), \
+                mock.patch('authentication.channels.get_users_channels', return_value={self.myuser.id: ['telegram']}):
+            send_deliveries(load_deliveries([notification_status_id]))
+            notification_single = NotificationSingle.objects.select_related('notification_status').get(id=self.notification_single.id)
+            notification_single.notification_time = (self.notification_time + timedelta(minutes=2)).time()
+            notification_single.save()
+            self.assertTrue(reschedule_single_notification(notification_single))
+            self.assertFalse(NotificationDelivery.objects.filter(notification_status=notification_status_id).exists())
+            send_deliveries(load_deliveries([notification_status_id], only_due=True))
+        self.assertEqual(sender.call_count, 2)
+        self.assertEqual(NotificationStatus.objects.get(id=notification_status_id).done, NotificationStatus.Status.COMPLITED)
+
+    def test_restoring_revoked_status_resumes_materialization(self):
+        ''' Testing that restoring a status of a revoked recurring notification remembers its next occurrence again '''
+        notification_periodic = self.create_periodic_notification(title='weekly notification', text='weekly text', recurrence='FREQ=WEEKLY', recurrence_start=self.notification_time.date() + timedelta(days=1))
+        schedule_periodic_notification(notification_periodic)
+        revoke_periodic_notification(notification_periodic)
+        notification_status = notification_periodic.notification_status.get()
+
+        self.assertEqual(restore_periodic_status(notification_periodic, notification_status), 0) # the next occurrence is beyond the horizon
+        notification_periodic.refresh_from_db()
+        self.assertEqual(notification_periodic.next_occurrence_at, notification_status.time_stamp + timedelta(days=7))
+        self.assertEqual(NotificationStatus.objects.get(id=notification_status.id).done, NotificationStatus.Status.NOT_COMPLITED)
+        self.assertEqual(NotificationBase.objects.get(id=notification_periodic.notification_type_periodicity_id).pending_statuses, 1)
+        self.assertEqual(materialize_occurrences(timezone.now() + timedelta(days=7)), 1)
+
+class StatusCountersTests(NotificationSchedulingTestCase):
+    def test_status_counters_follow_statuses(self):
+        ''' Testing that scheduling, delivery and revoking keep the status counters of a notification and the repair command restores them '''
+        notification_periodic = self.create_periodic_notification()
+        notification_periodic.set_dates([self.notification_time.date() + timedelta(days=day) for day in range(0, 3)])
+        schedule_periodic_notification(notification_periodic)
+        notification_base = NotificationBase.objects.get(id=notification_periodic.notification_type_periodicity_id)
+        self.assertEqual((notification_base.pending_statuses, notification_base.completed_statuses, notification_base.revoked_statuses), (3, 0, 0))
+        self.assertEqual(notification_base.next_fire_at, self.notification_time)
+
+        due_status = notification_periodic.notification_status.get(time_stamp=self.notification_time)
+        load_deliveries([due_status.id])
+        notification_periodic.notification_status.revoke()
+        notification_base.refresh_from_db()
+        self.assertEqual((notification_base.pending_statuses, notification_base.completed_statuses, notification_base.revoked_statuses), (0, 1, 2))
+        self.assertIsNone(notification_base.next_fire_at)
+        self.assertIn(notification_base, NotificationBase.objects.active())
+
+        NotificationBase.objects.filter(id=notification_base.id).update(pending_statuses=10, revoked_statuses=0)
+        call_command('repair_notification_counters', stdout=StringIO())
+        notification_base.refresh_from_db()
+        self.assertEqual((notification_base.pending_statuses, notification_base.revoked_statuses), (0, 2))
@@ -0,0 +1,94 @@
+import smtplib
+from types import SimpleNamespace
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import SimpleTestCase, override_settings
+
+from ..rendering import render_telegram_messages
+from ..send_notifications import Delivery, get_retry_delay, send_emails
+
+class FlakyEmailBackend(EmailBackend):
+    # the connection breaks on the first message
+    opened = 0
+    failed = False
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+
+    def send_messages(self, messages):
+        if not FlakyEmailBackend.failed:
+            FlakyEmailBackend.failed = True
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+class RefusingEmailBackend(EmailBackend):
+    # the server refuses one recipient every time
+    def send_messages(self, messages):
+        if messages[0].to == ['user2@gmail.com']:
+            raise smtplib.SMTPRecipientsRefused({'user2@gmail.com': (550, b'No such user')})
+        return super().send_messages(messages)
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SendEmailsTests(SimpleTestCase):
+    def setUp(self):
+        self.deliveries = [
+            Delivery(
+                notification=SimpleNamespace(title=f'title {i}', text=f'text {i}'),
+                model='single' if i % 2 else 'periodic',
+                user=SimpleNamespace(username=f'user {i}', email=f'user{i}@gmail.com'),
+                time='October 18, 2026 09:00:00 AM',
+                lang_code='en',
+                notification_status_id=None
+            ) for i in range(5)
+        ]
+
+    @override_settings(NOTIFICATIONS_EMAIL_MESSAGES_PER_CONNECTION=2)
+    def test_send_emails(self):
+        ''' Testing that a batch of emails is rendered and sent '''
+        self.assertEqual(send_emails(self.deliveries), [None] * 5)
+        self.assertEqual([message.to for message in mail.outbox], [[f'user{i}@gmail.com'] for i in range(5)])
+        self.assertIn('title 1', mail.outbox[1].body)
+
+    @override_settings(EMAIL_BACKEND='notifications.tests.test_send_notifications.FlakyEmailBackend')
+    def test_send_emails_reconnects_after_failure(self):
+        ''' Testing that the connection is opened again and the failed message is not lost '''
+        FlakyEmailBackend.opened, FlakyEmailBackend.failed = 0, False
+        self.assertEqual(send_emails(self.deliveries), [None] * 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+
+    @override_settings(EMAIL_BACKEND='notifications.tests.test_send_notifications.RefusingEmailBackend')
+    def test_send_emails_reports_failed_message(self):
+        ''' Testing that a failed message does not stop the others and is reported as a permanent error '''
+        errors = send_emails(self.deliveries)
+        self.assertEqual([error is None for error in errors], [True, True, False, True, True])
+        self.assertTrue(errors[2].permanent)
+        self.assertEqual(len(mail.outbox), 4)
+
+class RetryDelayTests(SimpleTestCase):
+    @override_settings(NOTIFICATIONS_RETRY_POLICIES={'telegram': {'max_attempts': 5, 'backoff': 10, 'backoff_max': 60}})
+    def test_retry_delay_grows_exponentially_with_jitter(self):
+        ''' Testing that the delay doubles every attempt up to backoff_max and half of it is random '''
+        for attempt, delay in [(1, 10), (2, 20), (3, 40), (4, 60), (10, 60)]:
+            delays = [get_retry_delay('telegram', attempt) for _ in range(20)]
+            self.assertTrue(all(delay / 2 <= retry_delay <= delay for retry_delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+class RenderingTests(SimpleTestCase):
+    def test_render_telegram_messages_in_language_of_delivery(self):
+        ''' Testing that every message of a batch is rendered in its own language '''
+        deliveries = [
+            Delivery(
+                notification=SimpleNamespace(title='title', text='text', notification_category=SimpleNamespace(name_type='study')),
+                model='single',
+                user=SimpleNamespace(username='user', email='user@gmail.com'),
+                time='October 18, 2026 09:00:00 AM',
+                lang_code=lang_code,
+                notification_status_id=None
+            ) for lang_code in ['ru', 'en']
+        ]
+        russian, english = render_telegram_messages(deliveries)
+        self.assertTrue(russian.startswith('👋 Привет'))
+        self.assertTrue(english.startswith('👋 Hi'))
+        self.assertIn('study', english)
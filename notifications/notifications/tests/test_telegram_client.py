@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase, override_settings
+
+from .. import telegram_client
+from ..fake_telegram import FakeTelegramServer
+from ..send_notifications import get_telegram_error
+
+class TelegramClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeTelegramServer(throttle=True).start() # the first request of every chat is answered 429
+        cls.url = cls.server.url
+
+    def setUp(self):
+        self.server.reset()
+        self.server.retry_after = 0
+
+    def test_send_messages_concurrently(self):
+        ''' Testing that a batch of messages is delivered in order of the messages '''
+        messages = [(str(chat_id), f'message {chat_id}') for chat_id in range(30)]
+        with override_settings(TELEGRAM_API_SENDING_MESSAGE=self.url):
+            responses = telegram_client.send_messages(messages, concurrency=5)
+        self.assertEqual([response.status_code for response in responses], [200] * 30)
+        self.assertEqual([response.json()['result']['text'] for response in responses], [text for _, text in messages])
+        self.assertEqual(len(self.server.requests), 60)
+
+    def test_batches_share_the_connections_of_the_process(self):
+        ''' Testing that the batches sent from synchronous code go through one event loop and pool of connections of the process '''
+        with override_settings(TELEGRAM_API_SENDING_MESSAGE=self.url):
+            telegram_client.send_messages([('1', 'hello')], concurrency=5)
+            process_client = telegram_client.get_process_client()
+            pool = process_client.pools[5]
+            telegram_client.send_messages([('2', 'hello')], concurrency=5)
+        self.assertIs(telegram_client.get_process_client(), process_client)
+        self.assertIs(process_client.pools[5], pool)
+        self.assertTrue(process_client.loop.is_running())
+
+    def test_long_retry_after_is_left_to_celery(self):
+        ''' Testing that a message asked to wait longer than TELEGRAM_MAX_RETRY_AFTER is not waited for, its error keeps `retry_after` for the retry task '''
+        self.server.retry_after = 60
+        with override_settings(TELEGRAM_API_SENDING_MESSAGE=self.url, TELEGRAM_MAX_RETRY_AFTER=5):
+            responses = telegram_client.send_messages([('1', 'hello')])
+        self.assertEqual(responses[0].status_code, 429)
+        self.assertEqual(self.server.requests, ['1'])
+        error = get_telegram_error(responses[0])
+        self.assertFalse(error.permanent)
+        self.assertEqual(error.retry_after, 60)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
@@ -2,10 +2,10 @@ from django.test import TestCase, Client, RequestFactory
 from datetime import datetime, timedelta
 from django.urls import reverse
 
-from config.celery import app
 from authentication.models import MyUser, ChooseSendingNotifications
 from notification_categories.models import NotificationCategory
 from ..models import NotificationBase, NotificationSingle, NotificationStatus, NotificationPeriodicity, NotificationId
+from ..scheduling import schedule_single_notification, schedule_periodic_notification
 
 # Create your tests here.
 class NotificationGeneralViewsTests(TestCase):
@@ -121,6 +121,7 @@ class NotificationSingleViewsTests(TestCase):
             notification_status=cls.notification_status_single,
             notification_type_single=cls.type_single
         )
+        schedule_single_notification(cls.notification_single)
 
 
     def test_notification_single_detail_page_get_request(self):
@@ -350,8 +351,9 @@ class NotificationPeriodicViewsTests(TestCase):
             notification_periodicity_num=cls.notification_periodicity_num,
             notification_periodic_time=cls.notification_periodic_time,
             notification_type_periodicity=cls.type_periodic,
-            dates=cls.dates
         )
+        cls.notification_periodic.set_dates(cls.dates)
+        schedule_periodic_notification(cls.notification_periodic)
 
     def test_notification_periodic_detail_page_get_request(self):
         ''' Testing notification periodic detail page get request '''
@@ -642,17 +644,15 @@ class NotificationPeriodicViewsTests(TestCase):
         url = reverse('notifications:notification_periodic_revoke_certain_time_stamp', kwargs=request_kwargs)
 
         old_status = NotificationStatus.objects.first()
-        old_revoked_tasks = app.control.inspect().revoked()
 
         # authenticated user who is not `author` of the notification
         self.c.login(username=self.username, password=self.password)
         response = self.c.post(url)
 
         new_status = NotificationStatus.objects.first()
-        new_revoked_tasks = app.control.inspect().revoked()
 
-        self.assertTrue(old_revoked_tasks != new_revoked_tasks)
         self.assertNotEqual(old_status.done, new_status.done) # 0 2
+        self.assertEqual(new_status.done, NotificationStatus.Status.REVOKED) # the delivery skips it, workers are not told
         self.assertEqual(response.status_code, 302)
 
     def test_notification_periodic_delete_all_time_stamps_page_get_request(self):
@@ -686,18 +686,16 @@ class NotificationPeriodicViewsTests(TestCase):
             'pk': NotificationPeriodicity.objects.first().id
         }
         url = reverse('notifications:notification_periodic_revoke_all_time_stamps', kwargs=request_kwargs)
-        old_revoked_tasks = app.control.inspect().revoked()
         old_revoked_notif_statuses = self.notification_periodic.notification_status.filter(done=2).count()
 
         # authenticated user who is not `author` of the notification
         self.c.login(username=self.username, password=self.password)
         response = self.c.post(url)
 
-        new_revoked_tasks = app.control.inspect().revoked()
         new_revoked_notif_statuses = self.notification_periodic.notification_status.filter(done=2).count()
 
         self.assertEqual(old_revoked_notif_statuses+self.notification_periodicity_num, new_revoked_notif_statuses)
-        self.assertTrue(old_revoked_tasks != new_revoked_tasks)
+        self.assertFalse(self.notification_periodic.notification_status.filter(done=0).exists())
         self.assertEqual(response.status_code, 302)
 
     def test_notification_periodic_change_notification_status_from_revoke_to_incomplete_post_request(self):
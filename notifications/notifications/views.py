@@ -8,14 +8,21 @@ from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import CreateView, UpdateView, DeleteView, DetailView
 from django.utils import timezone
-from django.db.models.query_utils import Q
+from django.db import transaction
 from django.utils.translation import get_language
 
 from authentication.models import MyUser
-from config.celery import app
 from notification_categories.models import NotificationCategory
 
 from .tasks import create_periodic_notification_task, create_notification_task
+from .scheduling import (
+    delete_tasks,
+    reschedule_single_notification,
+    restore_periodic_status,
+    revoke_periodic_notification,
+    schedule_periodic_notification,
+    schedule_single_notification,
+)
 from .models import (
     NotificationBase, 
     NotificationPeriodicity, 
@@ -49,7 +56,7 @@ class NotificationListView(LoginRequiredMixin, ListView):
         return context
 
     def get_queryset(self):
-        return self.model.objects.filter(user=self.request.user)
+        return self.model.objects.filter(user=self.request.user).active()
 
 class NotificationFinishedListView(LoginRequiredMixin, ListView):
     model = NotificationBase
@@ -58,12 +65,12 @@ class NotificationFinishedListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["finished_notifications"] = [notification for notification in self.get_queryset() if notification.check_all_notifications_are_complited() == True]
+        context["finished_notifications"] = list(self.object_list)
         context["finished_notifications_length"] = len(context["finished_notifications"])
         return context
 
     def get_queryset(self):
-        return self.model.objects.filter(user=self.request.user)
+        return self.model.objects.filter(user=self.request.user).finished()
 
 class SearchNotificationView(LoginRequiredMixin, ListView):
     model = NotificationBase
@@ -76,24 +83,15 @@ class SearchNotificationView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get("q")
         context["user"] = self.request.user
-        if self.get_queryset():
-            context["searched_notifications_length"] = len(self.get_queryset())
-        else:
-            context["searched_notifications_length"] = 0
+        context["searched_notifications"] = list(self.object_list)
+        context["searched_notifications_length"] = len(context["searched_notifications"])
         return context
 
     def get_queryset(self):
         query = self.request.GET.get("q")
         if query:
-            singles = self.model.objects.filter(user=self.request.user).filter(notification_type="Single")
-            singles = singles.filter((Q(notification_single__title__icontains=query) | Q(notification_single__text__icontains=query)))
-            incomplited_singles = [notification_single for notification_single in singles if notification_single.check_all_notifications_are_complited() == False]
-
-            periodics = self.model.objects.filter(Q(notification_type="Periodic") & Q(user=self.request.user))
-            periodics = periodics.filter((Q(notification_periodic__title__icontains=query) | Q(notification_periodic__text__icontains=query)))
-            incomplited_periodics = [notification_periodic for notification_periodic in periodics if notification_periodic.check_all_notifications_are_complited() == False]
-            
-            return incomplited_singles + incomplited_periodics
+            return self.model.objects.filter(user=self.request.user).search(query).active()
+        return self.model.objects.none()
 
 class NotificationSingleDetailView(LoginRequiredMixin, DetailView):
     login_url = reverse_lazy('auth:login')
@@ -133,6 +131,7 @@ class NotificationSingleCreateView(LoginRequiredMixin, CreateView):
         kw['user'] = self.request.user
         return kw
 
+    @transaction.atomic # the notification and its scheduled status are committed together
     def form_valid(self, form):
         notification_date = form.cleaned_data['notification_date']
         notification_time = form.cleaned_data['notification_time']
@@ -145,7 +144,7 @@ class NotificationSingleCreateView(LoginRequiredMixin, CreateView):
             user=self.request.user,
             notification_type='Single'
         )
-        self.model.objects.create(
+        notification_single = self.model.objects.create(
             notification_category=form.cleaned_data['notification_category'],
             title=form.cleaned_data['title'],
             text=form.cleaned_data['text'],
@@ -154,6 +153,7 @@ class NotificationSingleCreateView(LoginRequiredMixin, CreateView):
             notification_status=notif_status,
             notification_type_single=notif_base
         )
+        schedule_single_notification(notification_single)
         return HttpResponseRedirect(self.success_url)
         
 class NotificationSingleEditView(LoginRequiredMixin, UpdateView):
@@ -181,26 +181,16 @@ class NotificationSingleEditView(LoginRequiredMixin, UpdateView):
         else:
             return HttpResponseRedirect(reverse_lazy('notifications:notification_list'))
         
+    @transaction.atomic
     def form_valid(self, form):
-        res = self.model.objects.get(pk=self.kwargs['pk'])
-        time = str(form.cleaned_data['notification_date']) + ' ' + str(form.cleaned_data['notification_time'])
-        time = datetime.strptime(time, '%Y-%m-%d %H:%M:%S')
-        time = timezone.localtime(timezone.make_aware(time))
-
-        NotificationStatus.objects.get(id=res.notification_status.id).delete()
-
-        task = res.notification_status.notification_celery_id
-        app.control.revoke(str(task), terminate=True, signal='SIGKILL')
-
-        NotificationId.objects.get(notification_id=task).delete()
-
+        res = self.model.objects.select_related('notification_status').get(pk=self.kwargs['pk'])
         res.notification_category = form.cleaned_data['notification_category']
         res.title = form.cleaned_data['title']
         res.text = form.cleaned_data['text']
         res.notification_time = form.cleaned_data['notification_time']
         res.notification_date = form.cleaned_data['notification_date']
-        res.notification_status = NotificationStatus.objects.create(time_stamp=time)
         res.save()
+        reschedule_single_notification(res) # a change of the title or the text needs no rescheduling
         return HttpResponseRedirect(self.success_url)
 
 class NotificationSingleDeleteView(LoginRequiredMixin, DeleteView):
@@ -229,7 +219,6 @@ class NotificationSingleDeleteView(LoginRequiredMixin, DeleteView):
         
         task = notification_single.notification_status.notification_celery_id.notification_id
 
-        app.control.revoke(str(task), terminate=True, signal='SIGKILL')
         NotificationId.objects.get(notification_id=task).delete()
         notification_base.delete()
 
@@ -252,7 +241,7 @@ class NotificationPeriodicDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         periodic_notification = get_object_or_404(self.model, pk=self.kwargs['pk'])
-        context['notification_is_finished'] = periodic_notification.notification_status.filter(done=1).count() == periodic_notification.notification_status.all().count()
+        context['notification_is_finished'] = periodic_notification.notification_type_periodicity.check_all_notifications_are_complited()
         context['count_all_revoked_execution_times'] = len(periodic_notification.get_all_revoked())
         return context
 
@@ -275,6 +264,7 @@ class PeriodicalNotificationCreateView(LoginRequiredMixin, CreateView):
         context['only_inactive'] = len(MyUser.objects.get(username=self.request.user.username).get_only_inactive_networks())
         return context
 
+    @transaction.atomic # the notification and its scheduled statuses are committed together
     def form_valid(self, form):
         value = form.cleaned_data.get('dates_type')
         current_date = timezone.localtime(timezone.now()).date()
@@ -288,26 +278,36 @@ class PeriodicalNotificationCreateView(LoginRequiredMixin, CreateView):
             for _ in range(amount_of_dates):
                 current_date = current_date + timedelta(days=1)
                 dates.append(current_date)
-            self.model.objects.create(
+            notification_periodic = self.model.objects.create(
                 notification_category=form.cleaned_data['notification_category'],
                 title=form.cleaned_data['title'],
                 text=form.cleaned_data['text'],
                 notification_periodicity_num=form.cleaned_data['notification_periodicity_num'],
                 notification_periodic_time=form.cleaned_data['notification_periodic_time'],
-                dates=dates,
                 notification_type_periodicity=notif_base
             )
         elif value == 'Your own dates':
-            dates = self.request.POST.get('dates').split(',')
-            dates = sorted(dates, key=lambda x: datetime.strptime(x, '%Y-%m-%d'))
-            self.model.objects.create(
+            dates = form.cleaned_data.get('dates')
+            notification_periodic = self.model.objects.create(
                 notification_category=form.cleaned_data['notification_category'],
                 title=form.cleaned_data['title'],
                 text=form.cleaned_data['text'],
                 notification_periodic_time=form.cleaned_data['notification_periodic_time'],
-                dates=dates,
                 notification_type_periodicity=notif_base
             )
+        elif value == 'Recurrence rule':
+            dates = []
+            notification_periodic = self.model.objects.create(
+                notification_category=form.cleaned_data['notification_category'],
+                title=form.cleaned_data['title'],
+                text=form.cleaned_data['text'],
+                notification_periodic_time=form.cleaned_data['notification_periodic_time'],
+                recurrence=form.cleaned_data['recurrence'],
+                recurrence_start=current_date,
+                notification_type_periodicity=notif_base
+            )
+        notification_periodic.set_dates(dates)
+        schedule_periodic_notification(notification_periodic)
         return HttpResponseRedirect(self.success_url)
 
 class NotificationPeriodicEditView(LoginRequiredMixin, UpdateView):
@@ -359,14 +359,7 @@ class NotificationPeriodicDeleteView(DeleteView, LoginRequiredMixin):
     def delete(self, *args, **kwargs):
         notification_periodic = self.model.objects.get(id=self.kwargs['pk'])
         notification_base = NotificationBase.objects.get(notification_periodic=notification_periodic)
-
-        for notification_status in notification_periodic.notification_status.all():
-            NotificationStatus.objects.get(id=notification_status.id).delete()
-
-        for task in notification_periodic.notification_type_periodicity.task_id.all():
-            app.control.revoke(str(task), terminate=True, signal='SIGKILL')
-            NotificationId.objects.get(notification_id=task).delete()
-
+        delete_tasks(notification_base)
         notification_base.delete()
 
         return HttpResponseRedirect(self.success_url)
@@ -418,10 +411,7 @@ class NotificationPeriodicRevokeCertainTimeStampView(LoginRequiredMixin, DeleteV
 
     def post(self, request, *args, **kwargs):
         notification_status = get_object_or_404(self.model, id=self.kwargs['pk'])
-        notification_status.done = 2
-        notification_status.save()
-        task = notification_status.notification_celery_id.notification_id
-        app.control.revoke(str(task), terminate=True, signal='SIGKILL')
+        self.model.objects.filter(id=notification_status.id).revoke()
         return HttpResponseRedirect(self.get_success_url())
 
 class NotificationPeriodicRevokeAllTimeStampsView(LoginRequiredMixin, DeleteView):
@@ -448,26 +438,17 @@ class NotificationPeriodicRevokeAllTimeStampsView(LoginRequiredMixin, DeleteView
             return HttpResponseRedirect(reverse_lazy('notifications:notification_list'))
 
     def post(self, request, *args, **kwargs):
-        notif_statuses = self.model.objects.get(id=self.kwargs['pk']).notification_status.filter(done=0)
-        for notification_status in notif_statuses:
-            notification_status.done = 2
-            notification_status.save()
-            task = notification_status.notification_celery_id.notification_id
-            app.control.revoke(str(task), terminate=True, signal='SIGKILL')
+        revoke_periodic_notification(self.model.objects.get(id=self.kwargs['pk']))
         return HttpResponseRedirect(self.get_success_url())
 
 @login_required(login_url='/auth/login/')
 def change_notification_status_from_revoke_to_incomplete(request, **kwargs):
     notification_status = get_object_or_404(NotificationStatus, id=kwargs['pk'])
     notification_periodic_model = NotificationPeriodicity.objects.get(notification_status=notification_status)
-    notification_celery_id = NotificationId.objects.get(notification_id=notification_status.notification_celery_id.notification_id)
     if notification_periodic_model.notification_type_periodicity.user == request.user:
         if notification_status.time_stamp > timezone.localtime(timezone.now()):
-            notification_status.done = 0 # incomplited
-            notification_status.save()
-            task = create_periodic_notification_task.apply_async(args=(notification_periodic_model.id, notification_status.id, get_language()), eta=notification_status.time_stamp)
-            notification_celery_id.notification_id = task
-            notification_celery_id.save()
+            with transaction.atomic():
+                restore_periodic_status(notification_periodic_model, notification_status)
     return HttpResponseRedirect(reverse_lazy('notifications:detail_periodic_notification', kwargs={"pk": notification_periodic_model.id }))
 
 @permission_required('is_staff', login_url=reverse_lazy('notifications:notification_list'))